@@ -0,0 +1,154 @@
+import calendar
+import re
+from datetime import date, datetime, timedelta
+
+PRIORITIES = {
+    'high': 'high', 'urgent': 'high', 'critical': 'high', 'asap': 'high',
+    'medium': 'medium', 'normal': 'medium', 'moderate': 'medium',
+    'low': 'low', 'minor': 'low'
+}
+
+TASK_STATUSES = ['open', 'done']
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+# Abbreviations that are not a prefix of the day's name
+WEEKDAY_ALIASES = {'weds': 2}
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+
+NO_DEADLINE = {'', 'none', 'n/a', 'na', 'null', '-', 'tbd', 'unknown', 'not specified', 'no deadline'}
+SAME_DAY = ['today', 'tonight', 'eod', 'end of day', 'end of the day', 'asap', 'as soon as possible', 'immediately']
+
+ISO_DATE = re.compile(r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b')
+SLASH_DATE = re.compile(r'\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b')
+MONTH_DAY = re.compile(r'\b([a-z]{3,9})\.? (\d{1,2})(?:st|nd|rd|th)?(?:,? (\d{4}))?\b')
+DAY_MONTH = re.compile(r'\b(\d{1,2})(?:st|nd|rd|th)? (?:of )?([a-z]{3,9})(?:,? (\d{4}))?\b')
+IN_DAYS = re.compile(r'\b(?:in|within) (\d+) (day|business day|week)s?\b')
+
+
+def reference_date(email_date):
+    #The date relative deadlines count from: the email's date, or today if it has none
+    try:
+        return datetime.fromisoformat(str(email_date)[:19]).date()
+    except ValueError:
+        return date.today()
+
+
+def safe_date(year, month, day):
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def mentions(text, *phrases):
+    return any(re.search(rf'\b{re.escape(phrase)}\b', text) for phrase in phrases)
+
+
+def named_weekday(text):
+    #The first weekday named in text, by its full name or an abbreviation of 3+ letters ("thurs"), or None
+    for word in re.findall(r'\b[a-z]{3,9}\b', text):
+        if word in WEEKDAY_ALIASES:
+            return WEEKDAY_ALIASES[word]
+        for weekday, name in enumerate(WEEKDAYS):
+            if name.startswith(word):
+                return weekday
+    return None
+
+
+def next_weekday(reference, weekday, strictly_after=False):
+    days = (weekday - reference.weekday()) % 7
+    if days == 0 and strictly_after:
+        days = 7
+    return reference + timedelta(days=days)
+
+
+def normalize_deadline(text, reference):
+    """ISO date (YYYY-MM-DD) for a deadline as the model wrote it, or None if it names no day.
+
+    Relative deadlines ("Friday", "tomorrow", "end of month", "in 3 days")
+    count from `reference`, the date of the email they were extracted from.
+    Dates without a year are taken in the reference's year.
+    """
+    if text is None:
+        return None
+    text = re.sub(r'\s+', ' ', str(text).strip().lower())
+    if text in NO_DEADLINE:
+        return None
+
+    match = ISO_DATE.search(text)
+    if match:
+        found = safe_date(*map(int, match.groups()))
+        return found.isoformat() if found else None
+
+    match = SLASH_DATE.search(text)
+    if match:
+        month, day, year = match.groups()
+        year = int(year) + 2000 if year and len(year) == 2 else int(year or reference.year)
+        found = safe_date(year, int(month), int(day))
+        return found.isoformat() if found else None
+
+    for pattern, month_group, day_group in ((MONTH_DAY, 1, 2), (DAY_MONTH, 2, 1)):
+        match = pattern.search(text)
+        if match and match.group(month_group) in MONTHS:
+            year = int(match.group(3) or reference.year)
+            found = safe_date(year, MONTHS[match.group(month_group)], int(match.group(day_group)))
+            if found:
+                return found.isoformat()
+
+    # Words like "EOD" or "ASAP" only mean the email's own day when no other day
+    # is named ("EOD Thursday", "ASAP, by Friday")
+    if mentions(text, 'tomorrow'):
+        return (reference + timedelta(days=1)).isoformat()
+    if mentions(text, 'next week'):
+        # The end of next working week
+        return (next_weekday(reference, 0, strictly_after=True) + timedelta(days=4)).isoformat()
+    if mentions(text, 'end of week', 'end of the week', 'this week', 'eow'):
+        return next_weekday(reference, 4).isoformat()
+    if mentions(text, 'end of month', 'end of the month', 'this month', 'eom'):
+        last_day = calendar.monthrange(reference.year, reference.month)[1]
+        return reference.replace(day=last_day).isoformat()
+
+    match = IN_DAYS.search(text)
+    if match:
+        count, unit = int(match.group(1)), match.group(2)
+        return (reference + timedelta(days=count * 7 if unit == 'week' else count)).isoformat()
+
+    weekday = named_weekday(text)
+    if weekday is not None:
+        return next_weekday(reference, weekday, strictly_after=mentions(text, 'next')).isoformat()
+
+    if mentions(text, *SAME_DAY):
+        return reference.isoformat()
+    return None
+
+
+def normalize_priority(value):
+    #'high', 'medium' or 'low', or None if the model gave something else
+    if not isinstance(value, str):
+        return None
+    return PRIORITIES.get(value.strip().lower())
+
+
+def task_rows(actions, email_date):
+    """(position, task, deadline, deadline_text, priority) for each valid item in an extracted actions result"""
+    if isinstance(actions, dict):
+        actions = actions.get('tasks')
+    if not isinstance(actions, list):
+        return []
+
+    reference = reference_date(email_date)
+    rows = []
+    for item in actions:
+        if not isinstance(item, dict) or not isinstance(item.get('task'), str) or not item['task'].strip():
+            continue
+        deadline_text = item.get('deadline')
+        deadline_text = str(deadline_text).strip() if deadline_text not in (None, '') else None
+        rows.append((
+            len(rows),
+            item['task'].strip(),
+            normalize_deadline(deadline_text, reference),
+            deadline_text,
+            normalize_priority(item.get('priority'))
+        ))
+    return rows
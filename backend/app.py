@@ -1,127 +1,567 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-from email_processor import EmailProcessor
-from database import Database
-import json
-import os
-
-app = Flask(__name__)
-CORS(app)
-
-db = Database()
-email_processor = EmailProcessor()
-
-@app.route('/api/emails', methods=['GET'])
-def get_emails():
-    emails = db.get_emails()
-    return jsonify(emails)
-
-@app.route('/api/emails/load-mock', methods=['POST'])
-def load_mock_emails():
-    try:
-        db.load_mock_data()
-        return jsonify({"message": "Mock data loaded successfully"})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/api/emails/<email_id>', methods=['GET'])
-def get_email(email_id):
-    email = db.get_email(email_id)
-    if email:
-        return jsonify(email)
-    return jsonify({"error": "Email not found"}), 404
-
-@app.route('/api/emails/<email_id>/process', methods=['POST'])
-def process_email(email_id):
-    try:
-        email = db.get_email(email_id)
-        if not email:
-            return jsonify({"error": "Email not found"}), 404
-        
-        # Get processing type from request
-        data = request.get_json()
-        process_type = data.get('type', 'all')
-        
-        result = email_processor.process_email(email, process_type)
-        db.update_email_processing(email_id, result)
-        
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/api/prompts', methods=['GET'])
-def get_prompts():
-    prompts = db.get_prompts()
-    return jsonify(prompts)
-
-@app.route('/api/prompts', methods=['POST'])
-def update_prompt():
-    try:
-        data = request.get_json()
-        prompt_name = data.get('name')
-        prompt_content = data.get('content')
-        
-        if not prompt_name or not prompt_content:
-            return jsonify({"error": "Name and content are required"}), 400
-        
-        db.update_prompt(prompt_name, prompt_content)
-        return jsonify({"message": "Prompt updated successfully"})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/api/chat', methods=['POST'])
-def chat_with_agent():
-    try:
-        data = request.get_json()
-        email_id = data.get('email_id')
-        query = data.get('query')
-        
-        if not query:
-            return jsonify({"error": "Query is required"}), 400
-        
-        if email_id:
-            # Chat about specific email
-            email = db.get_email(email_id)
-            response = email_processor.chat_about_email(email, query)
-        else:
-            # General inbox chat
-            emails = db.get_emails()
-            response = email_processor.chat_about_inbox(emails, query)
-        
-        return jsonify({"response": response})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/api/drafts', methods=['POST'])
-def create_draft():
-    try:
-        data = request.get_json()
-        draft_data = {
-            'subject': data.get('subject'),
-            'body': data.get('body'),
-            'to': data.get('to'),
-            'in_reply_to': data.get('in_reply_to')
-        }
-        
-        draft_id = db.save_draft(draft_data)
-        return jsonify({"draft_id": draft_id, "message": "Draft saved successfully"})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/api/drafts/generate', methods=['POST'])
-def generate_draft():
-    try:
-        data = request.get_json()
-        email_id = data.get('email_id')
-        instructions = data.get('instructions', '')
-        
-        email = db.get_email(email_id) if email_id else None
-        draft = email_processor.generate_draft(email, instructions)
-        
-        return jsonify(draft)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-if __name__ == '__main__':
-
-    app.run(debug=True, port=5000)
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask_cors import CORS
+from email_processor import EmailProcessor
+from database import Database
+from batch_processor import BatchProcessor
+from config import Config
+from retrieval import InboxRetriever
+from job_queue import JobQueue
+from metrics import metrics
+from http_cache import compress, not_modified, validated
+from action_items import TASK_STATUSES
+import json
+import os
+import uuid
+from datetime import date
+from werkzeug.utils import secure_filename
+
+app = Flask(__name__)
+CORS(app)
+
+MAX_PAGE_SIZE = 500
+
+db = Database()
+email_processor = EmailProcessor()
+batch_processor = BatchProcessor(
+    db,
+    email_processor,
+    default_concurrency=Config.BATCH_CONCURRENCY,
+    max_concurrency=Config.BATCH_MAX_CONCURRENCY
+)
+job_queue = JobQueue(
+    db,
+    max_attempts=Config.JOB_MAX_ATTEMPTS,
+    base_delay=Config.JOB_RETRY_DELAY
+)
+retriever = InboxRetriever(
+    db,
+    top_k=Config.RETRIEVAL_TOP_K,
+    token_budget=Config.RETRIEVAL_TOKEN_BUDGET,
+    candidates=Config.RETRIEVAL_CANDIDATES
+)
+# Thread and hash any emails stored before threading and the duplicate index existed (no-ops once done)
+email_processor.threads.assign_unthreaded()
+email_processor.near_duplicates.index_unindexed()
+
+@app.before_request
+def start_request_timer():
+    metrics.begin_request()
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    total, timings = metrics.end_request(request.method, route, response.status_code)
+    if response.status_code >= 500:
+        metrics.errors.inc(source='http', kind=f"HTTP {response.status_code}")
+    if Config.METRICS_TIMING_HEADER:
+        # Streamed responses only include the time until the stream started
+        stages = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in sorted(timings.items())]
+        response.headers['Server-Timing'] = ', '.join(stages + [f"total;dur={total * 1000:.2f}"])
+    return response
+
+@app.after_request
+def compress_response(response):
+    # Registered after the metrics hook so it runs first and the metrics include compression time
+    return compress(
+        request,
+        response,
+        min_size=Config.RESPONSE_COMPRESSION_MIN_BYTES,
+        level=Config.RESPONSE_COMPRESSION_LEVEL
+    )
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/emails', methods=['GET'])
+def get_emails():
+    # Any change to any email is a new version of every listing; the change log behind the
+    # counter watches every column served here
+    version, changed_at = db.get_table_validator('emails')
+    etag = f"emails-{version}"
+    cached = not_modified(request, etag, changed_at)
+    if cached:
+        return cached
+    
+    args = request.args
+    if not args:
+        # Unpaginated listing, kept for existing clients
+        return validated(jsonify(db.get_emails()), etag, changed_at)
+    
+    try:
+        limit = max(1, min(int(args.get('limit', 50)), MAX_PAGE_SIZE))
+        fields = [field.strip() for field in args['fields'].split(',') if field.strip()] if args.get('fields') else None
+        is_processed = args.get('is_processed')
+        if is_processed is not None:
+            is_processed = is_processed.lower() in ('1', 'true', 'yes')
+        
+        emails, next_cursor = db.list_emails(
+            limit=limit,
+            cursor=args.get('cursor'),
+            fields=fields,
+            category=args.get('category'),
+            is_processed=is_processed,
+            sender=args.get('sender'),
+            date_from=args.get('date_from'),
+            date_to=args.get('date_to')
+        )
+        return validated(jsonify({"emails": emails, "next_cursor": next_cursor}), etag, changed_at)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/emails/changes', methods=['GET'])
+def get_email_changes():
+    """Emails changed since a change sequence number; without since, just the current one to start from"""
+    args = request.args
+    if args.get('since') is None:
+        return jsonify({"changes": [], "next_since": db.get_change_seq(), "has_more": False})
+    
+    try:
+        since = int(args['since'])
+        limit = max(1, min(int(args.get('limit', MAX_PAGE_SIZE)), MAX_PAGE_SIZE))
+        fields = [field.strip() for field in args['fields'].split(',') if field.strip()] if args.get('fields') else None
+        changes, next_since, has_more = db.get_email_changes(since, limit=limit, fields=fields)
+        return jsonify({"changes": changes, "next_since": next_since, "has_more": has_more})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/emails/load-mock', methods=['POST'])
+def load_mock_emails():
+    try:
+        db.load_mock_data()
+        email_processor.threads.assign_unthreaded()
+        email_processor.near_duplicates.index_unindexed()
+        return jsonify({"message": "Mock data loaded successfully"})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/emails/import', methods=['POST'])
+def import_emails():
+    """Queue a mailbox import from an uploaded file or a file already in IMPORT_DIR.
+
+    Uploads are deleted once their import job has finished; files that were
+    already in IMPORT_DIR are left alone.
+    """
+    upload_path = None
+    try:
+        import_dir = os.path.abspath(Config.IMPORT_DIR)
+        os.makedirs(import_dir, exist_ok=True)
+        
+        upload = request.files.get('file')
+        data = {} if upload else (request.get_json() or {})
+        file_format = request.form.get('format') if upload else data.get('format')
+        if file_format not in (None, 'mbox', 'jsonl'):
+            return jsonify({"error": "format must be 'mbox' or 'jsonl'"}), 400
+        
+        if upload:
+            filename = secure_filename(upload.filename) or 'upload.mbox'
+            path = upload_path = os.path.join(import_dir, f"{uuid.uuid4()}-{filename}")
+            upload.save(path)
+        else:
+            if not data.get('path'):
+                return jsonify({"error": "Upload a file or give a path inside the import directory"}), 400
+            path = os.path.abspath(os.path.join(import_dir, data['path']))
+            if os.path.commonpath([path, import_dir]) != import_dir or not os.path.isfile(path):
+                return jsonify({"error": "File not found in import directory"}), 400
+        
+        job_id = job_queue.enqueue('import_mailbox', {'path': path, 'format': file_format, 'uploaded': bool(upload)})
+        return jsonify({"job_id": job_id, "status": "queued"}), 202
+    except Exception as e:
+        if upload_path and os.path.exists(upload_path):
+            os.remove(upload_path)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/emails/process-batch', methods=['POST'])
+def process_batch():
+    try:
+        data = request.get_json() or {}
+        email_ids = data.get('email_ids')
+        
+        incremental = bool(data.get('incremental', False))
+        
+        # Incremental jobs default to every email; only stale sub-tasks are re-run
+        if email_ids is None and data.get('filter') != 'unprocessed' and not incremental:
+            return jsonify({"error": "Provide email_ids, filter 'unprocessed' or incremental"}), 400
+        
+        job = batch_processor.start_job(
+            email_ids=email_ids,
+            process_type=data.get('type', 'all'),
+            concurrency=data.get('concurrency'),
+            fused=data.get('fused', Config.FUSED_PROCESSING),
+            incremental=incremental,
+            packed=data.get('packed', Config.PACKED_CATEGORIZATION)
+        )
+        return jsonify(job), 202
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/emails/process-batch/<job_id>', methods=['GET'])
+def get_batch_job(job_id):
+    job = batch_processor.get_job(job_id)
+    if job:
+        return jsonify(job)
+    return jsonify({"error": "Job not found"}), 404
+
+@app.route('/api/emails/search', methods=['GET'])
+def search_emails():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Query parameter q is required"}), 400
+    
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), MAX_PAGE_SIZE))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+    
+    results, has_more = db.search_emails(query, limit=limit, offset=offset)
+    return jsonify({
+        "results": results,
+        "next_offset": offset + limit if has_more else None
+    })
+
+@app.route('/api/emails/<email_id>', methods=['GET'])
+def get_email(email_id):
+    seq = db.get_email_version(email_id)
+    # The email's own change seq; Last-Modified can only say when the table last changed
+    _, changed_at = db.get_table_validator('emails')
+    etag = f"email-{seq}"
+    if seq is not None:
+        cached = not_modified(request, etag, changed_at)
+        if cached:
+            return cached
+    
+    email = db.get_email(email_id)
+    if email:
+        # The cleaned body and hash are prompt and index caches, not part of the email
+        for column in db.CACHE_COLUMNS:
+            email.pop(column, None)
+        return validated(jsonify(email), etag, changed_at) if seq is not None else jsonify(email)
+    return jsonify({"error": "Email not found"}), 404
+
+@app.route('/api/emails/<email_id>/similar', methods=['GET'])
+def get_similar_emails(email_id):
+    """Near-duplicates of an email, with their SimHash similarity"""
+    email = db.get_email(email_id)
+    if not email:
+        return jsonify({"error": "Email not found"}), 404
+    
+    try:
+        max_distance = int(request.args.get('max_distance', email_processor.near_duplicates.max_distance))
+    except ValueError:
+        return jsonify({"error": "max_distance must be an integer"}), 400
+    
+    matches = email_processor.near_duplicates.find_similar(email, max_distance=max_distance, processed_only=False)
+    return jsonify({"similar": [
+        {"id": similar_id, "distance": distance, "similarity": 1 - distance / 64}
+        for similar_id, distance in matches
+    ]})
+
+@app.route('/api/tasks', methods=['GET'])
+def get_tasks():
+    """Extracted tasks across the inbox, filtered by deadline range (ISO dates), priority and status"""
+    args = request.args
+    try:
+        limit = max(1, min(int(args.get('limit', 50)), MAX_PAGE_SIZE))
+        try:
+            due_from, due_to = [
+                date.fromisoformat(args[name]).isoformat() if args.get(name) else None
+                for name in ('due_from', 'due_to')
+            ]
+        except ValueError:
+            raise ValueError("due_from and due_to must be dates (YYYY-MM-DD)")
+        priorities = [value.strip().lower() for value in args['priority'].split(',') if value.strip()] if args.get('priority') else None
+        if priorities and any(value not in ('high', 'medium', 'low') for value in priorities):
+            raise ValueError("priority must be high, medium or low")
+        status = args.get('status')
+        if status is not None and status not in TASK_STATUSES:
+            raise ValueError(f"status must be one of: {', '.join(TASK_STATUSES)}")
+        
+        tasks, next_cursor = db.list_tasks(
+            limit=limit,
+            cursor=args.get('cursor'),
+            due_from=due_from,
+            due_to=due_to,
+            priorities=priorities,
+            status=status,
+            email_id=args.get('email_id')
+        )
+        return jsonify({"tasks": tasks, "next_cursor": next_cursor})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/tasks/<int:task_id>/status', methods=['POST'])
+def update_task_status(task_id):
+    status = (request.get_json() or {}).get('status')
+    if status not in TASK_STATUSES:
+        return jsonify({"error": f"status must be one of: {', '.join(TASK_STATUSES)}"}), 400
+    if not db.update_task_status(task_id, status):
+        return jsonify({"error": "Task not found"}), 404
+    return jsonify({"id": task_id, "status": status})
+
+@app.route('/api/emails/<email_id>/process', methods=['POST'])
+def process_email(email_id):
+    try:
+        email = db.get_email(email_id)
+        if not email:
+            return jsonify({"error": "Email not found"}), 404
+        
+        # Get processing type from request
+        data = request.get_json() or {}
+        process_type = data.get('type', 'all')
+        fused = data.get('fused', Config.FUSED_PROCESSING)
+        incremental = bool(data.get('incremental', False))
+        
+        if data.get('sync'):
+            # Inline processing, for callers that need the result in the response
+            result = email_processor.process_email(email, process_type, fused=fused, incremental=incremental)
+            db.update_email_processing(email_id, result)
+            return jsonify(result)
+        
+        job_id = job_queue.enqueue('process_email', {
+            'email_id': email_id,
+            'type': process_type,
+            'fused': fused,
+            'incremental': incremental
+        })
+        return jsonify({"job_id": job_id, "status": "queued"}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/threads/<thread_id>', methods=['GET'])
+def get_thread(thread_id):
+    thread = email_processor.threads.get_thread(thread_id)
+    if not thread:
+        return jsonify({"error": "Thread not found"}), 404
+    
+    emails = email_processor.threads.get_thread_emails(thread_id)
+    for email in emails:
+        for field in ('body', 'clean_body', 'clean_version'):
+            del email[field]
+    thread['emails'] = emails
+    return jsonify(thread)
+
+@app.route('/api/threads/<thread_id>/summarize', methods=['POST'])
+def summarize_thread(thread_id):
+    try:
+        summary = email_processor.summarize_thread(thread_id)
+        if summary is None:
+            return jsonify({"error": "Thread not found"}), 404
+        return jsonify({"thread_id": thread_id, "summary": summary})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/classifier', methods=['GET'])
+def get_classifier():
+    """Held-out accuracy of the local pre-classifier against LLM labels"""
+    report = email_processor.pre_classifier.get_report()
+    if report is None:
+        return jsonify({"error": "No classifier has been trained yet"}), 404
+    return jsonify(report)
+
+@app.route('/api/classifier/train', methods=['POST'])
+def train_classifier():
+    try:
+        job_id = job_queue.enqueue('train_classifier', {})
+        return jsonify({"job_id": job_id, "status": "queued"}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get_job(job_id)
+    if job:
+        return jsonify(job)
+    return jsonify({"error": "Job not found"}), 404
+
+@app.route('/api/prompts', methods=['GET'])
+def get_prompts():
+    version, changed_at = db.get_table_validator('prompts')
+    etag = f"prompts-{version}"
+    cached = not_modified(request, etag, changed_at)
+    if cached:
+        return cached
+    
+    prompts = db.get_prompts()
+    return validated(jsonify(prompts), etag, changed_at)
+
+@app.route('/api/prompts', methods=['POST'])
+def update_prompt():
+    try:
+        data = request.get_json()
+        prompt_name = data.get('name')
+        prompt_content = data.get('content')
+        
+        if not prompt_name or not prompt_content:
+            return jsonify({"error": "Name and content are required"}), 400
+        
+        db.update_prompt(prompt_name, prompt_content)
+        return jsonify({"message": "Prompt updated successfully"})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/stats', methods=['GET'])
+def get_inbox_stats():
+    """Inbox overview from the maintained aggregates; the same cost for any inbox size"""
+    try:
+        top_senders = max(1, min(int(request.args.get('top_senders', 10)), 100))
+    except ValueError:
+        return jsonify({"error": "top_senders must be an integer"}), 400
+    return jsonify(db.get_inbox_stats(top_senders=top_senders))
+
+@app.route('/api/stats/check', methods=['GET', 'POST'])
+def check_inbox_stats():
+    """Recompute the aggregates from scratch and report differences; POST with repair to rebuild them"""
+    repair = request.method == 'POST' and bool((request.get_json(silent=True) or {}).get('repair', False))
+    return jsonify(db.check_inbox_stats(repair=repair))
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(email_processor.cache.stats())
+
+@app.route('/api/preprocess/stats', methods=['GET'])
+def get_preprocess_stats():
+    return jsonify(db.get_preprocess_stats())
+
+@app.route('/api/duplicates/stats', methods=['GET'])
+def get_duplicate_stats():
+    return jsonify(email_processor.near_duplicates.get_stats())
+
+@app.route('/api/llm/scheduler', methods=['GET'])
+def get_scheduler_stats():
+    return jsonify(email_processor.scheduler.get_stats())
+
+@app.route('/api/cache', methods=['DELETE'])
+def clear_cache():
+    email_processor.cache.clear()
+    return jsonify({"message": "Cache cleared"})
+
+def inbox_chat_stats():
+    #Inbox aggregates for chat context, or None to give only the total
+    return db.get_inbox_stats() if Config.CHAT_INBOX_STATS else None
+
+@app.route('/api/chat', methods=['POST'])
+def chat_with_agent():
+    try:
+        data = request.get_json()
+        email_id = data.get('email_id')
+        query = data.get('query')
+        
+        if not query:
+            return jsonify({"error": "Query is required"}), 400
+        
+        if email_id:
+            # Chat about specific email
+            email = db.get_email(email_id)
+            response = email_processor.chat_about_email(email, query)
+        else:
+            # General inbox chat, using the emails most relevant to the question as context
+            emails = retriever.retrieve(query)
+            response = email_processor.chat_about_inbox(emails, query, total=db.count_emails(), stats=inbox_chat_stats())
+        
+        return jsonify({"response": response})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def sse_event(data, event=None):
+    #Format one Server-Sent Event
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+def sse_response(chunks, on_complete=None):
+    """Stream text chunks as SSE 'delta' events followed by a 'done' event"""
+    def generate():
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield sse_event({"delta": chunk})
+            result = on_complete(''.join(parts)) if on_complete else {"response": ''.join(parts)}
+            yield sse_event(result, event='done')
+        except Exception as e:
+            yield sse_event({"error": str(e)}, event='error')
+        finally:
+            # Closing the source generator on client disconnect cancels the model stream
+            close = getattr(chunks, 'close', None)
+            if close:
+                close()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_with_agent_stream():
+    # Errors before the stream starts get the same JSON error as /api/chat; later ones are 'error' events
+    try:
+        data = request.get_json() or {}
+        email_id = data.get('email_id')
+        query = data.get('query')
+        
+        if not query:
+            return jsonify({"error": "Query is required"}), 400
+        
+        if email_id:
+            email = db.get_email(email_id)
+            if not email:
+                return jsonify({"error": "Email not found"}), 404
+            chunks = email_processor.chat_about_email(email, query, stream=True)
+        else:
+            emails = retriever.retrieve(query)
+            chunks = email_processor.chat_about_inbox(emails, query, total=db.count_emails(), stream=True, stats=inbox_chat_stats())
+        
+        return sse_response(chunks)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/drafts', methods=['POST'])
+def create_draft():
+    try:
+        data = request.get_json()
+        draft_data = {
+            'subject': data.get('subject'),
+            'body': data.get('body'),
+            'to': data.get('to'),
+            'in_reply_to': data.get('in_reply_to')
+        }
+        
+        draft_id = db.save_draft(draft_data)
+        return jsonify({"draft_id": draft_id, "message": "Draft saved successfully"})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/drafts/generate', methods=['POST'])
+def generate_draft():
+    try:
+        data = request.get_json()
+        email_id = data.get('email_id')
+        instructions = data.get('instructions', '')
+        
+        email = db.get_email(email_id) if email_id else None
+        draft = email_processor.generate_draft(email, instructions)
+        
+        return jsonify(draft)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/drafts/generate/stream', methods=['POST'])
+def generate_draft_stream():
+    try:
+        data = request.get_json() or {}
+        email_id = data.get('email_id')
+        instructions = data.get('instructions', '')
+        
+        email = db.get_email(email_id) if email_id else None
+        chunks = email_processor.stream_draft(email, instructions)
+        
+        return sse_response(chunks, on_complete=lambda draft: email_processor.parse_draft(draft, email))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+if __name__ == '__main__':
+
+    app.run(debug=True, port=5000)
@@ -0,0 +1,178 @@
+"""ASGI entry point: the Flask API plus natively async LLM-bound routes.
+
+Chat and draft generation wait on the model for seconds at a time. Under
+this server those routes are Quart coroutines that use the async OpenAI
+client and run their SQLite calls in worker threads, so a waiting request
+holds no thread and one process can serve hundreds of them at once. Every
+other route is the unchanged Flask app, run in a thread pool.
+
+    uvicorn --app-dir backend asgi_app:app --port 5000 --workers 4
+"""
+import asyncio
+import time
+from a2wsgi import WSGIMiddleware
+from quart import Quart, Response, g, jsonify, request
+from app import app as flask_app, db, email_processor, inbox_chat_stats, retriever, sse_event
+from config import Config
+from metrics import metrics
+
+async_app = Quart(__name__)
+
+
+@async_app.before_request
+async def start_request_timer():
+    g.started = time.perf_counter()
+
+
+@async_app.after_request
+async def record_request_metrics(response):
+    # Not metrics.begin_request(): its per-thread stage timings would mix the requests sharing the event loop
+    total = time.perf_counter() - g.started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.request_seconds.observe(total, method=request.method, route=route, status=response.status_code)
+    if response.status_code >= 500:
+        metrics.errors.inc(source='http', kind=f"HTTP {response.status_code}")
+    if Config.METRICS_TIMING_HEADER:
+        response.headers['Server-Timing'] = f"total;dur={total * 1000:.2f}"
+    # Same as flask_cors' defaults on the Flask routes (preflight requests are answered there)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+@async_app.route('/api/chat', methods=['POST'])
+async def chat_with_agent():
+    try:
+        data = await request.get_json()
+        email_id = data.get('email_id')
+        query = data.get('query')
+
+        if not query:
+            return jsonify({"error": "Query is required"}), 400
+
+        if email_id:
+            email = await asyncio.to_thread(db.get_email, email_id)
+            prompt = await asyncio.to_thread(email_processor.build_email_chat_prompt, email, query)
+            response = await email_processor.acall_llm(
+                prompt, email_processor.EMAIL_CHAT_SYSTEM_MESSAGE, prompt_name='chat_email'
+            )
+        else:
+            emails = await asyncio.to_thread(retriever.retrieve, query)
+            total = await asyncio.to_thread(db.count_emails)
+            stats = await asyncio.to_thread(inbox_chat_stats)
+            prompt = email_processor.build_inbox_chat_prompt(emails, query, total=total, stats=stats)
+            response = await email_processor.acall_llm(
+                prompt, email_processor.INBOX_CHAT_SYSTEM_MESSAGE, prompt_name='chat_inbox'
+            )
+
+        return jsonify({"response": response})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def sse_response(chunks, on_complete=None):
+    """Stream async text chunks as SSE 'delta' events followed by a 'done' event"""
+    async def generate():
+        parts = []
+        try:
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield sse_event({"delta": chunk})
+            result = on_complete(''.join(parts)) if on_complete else {"response": ''.join(parts)}
+            yield sse_event(result, event='done')
+        except Exception as e:
+            yield sse_event({"error": str(e)}, event='error')
+        finally:
+            # Closing the source generator on client disconnect cancels the model stream
+            await chunks.aclose()
+
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Streams last as long as the model keeps writing
+    response.timeout = None
+    return response
+
+
+@async_app.route('/api/chat/stream', methods=['POST'])
+async def chat_with_agent_stream():
+    # Errors before the stream starts get the same JSON error as /api/chat; later ones are 'error' events
+    try:
+        data = await request.get_json() or {}
+        email_id = data.get('email_id')
+        query = data.get('query')
+
+        if not query:
+            return jsonify({"error": "Query is required"}), 400
+
+        if email_id:
+            email = await asyncio.to_thread(db.get_email, email_id)
+            if not email:
+                return jsonify({"error": "Email not found"}), 404
+            prompt = await asyncio.to_thread(email_processor.build_email_chat_prompt, email, query)
+            chunks = email_processor.astream_llm(prompt, email_processor.EMAIL_CHAT_SYSTEM_MESSAGE, prompt_name='chat_email')
+        else:
+            emails = await asyncio.to_thread(retriever.retrieve, query)
+            total = await asyncio.to_thread(db.count_emails)
+            stats = await asyncio.to_thread(inbox_chat_stats)
+            prompt = email_processor.build_inbox_chat_prompt(emails, query, total=total, stats=stats)
+            chunks = email_processor.astream_llm(prompt, email_processor.INBOX_CHAT_SYSTEM_MESSAGE, prompt_name='chat_inbox')
+
+        return sse_response(chunks)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+async def draft_prompt(data):
+    #(prompt, original email) for a draft request; the prompt may need a thread summary, so it is built in a thread
+    email_id = data.get('email_id')
+    email = await asyncio.to_thread(db.get_email, email_id) if email_id else None
+    prompt = await asyncio.to_thread(email_processor.build_draft_prompt, email, data.get('instructions', ''))
+    return prompt, email
+
+
+@async_app.route('/api/drafts/generate', methods=['POST'])
+async def generate_draft():
+    try:
+        prompt, email = await draft_prompt(await request.get_json())
+        draft = await email_processor.acall_llm(
+            prompt,
+            email_processor.DRAFT_SYSTEM_MESSAGE,
+            prompt_name='auto_reply',
+            use_cache=False  # Regenerating a draft should give a fresh one
+        )
+        return jsonify(email_processor.parse_draft(draft, email))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@async_app.route('/api/drafts/generate/stream', methods=['POST'])
+async def generate_draft_stream():
+    try:
+        prompt, email = await draft_prompt(await request.get_json() or {})
+        chunks = email_processor.astream_llm(prompt, email_processor.DRAFT_SYSTEM_MESSAGE, prompt_name='auto_reply', use_cache=False)
+        return sse_response(chunks, on_complete=lambda draft: email_processor.parse_draft(draft, email))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+class RouteDispatcher:
+    """Send requests for the async routes to Quart and everything else to Flask"""
+
+    def __init__(self, async_app, wsgi_app, wsgi_threads=10):
+        self.async_app = async_app
+        self.wsgi_app = WSGIMiddleware(wsgi_app, workers=wsgi_threads)
+        self.async_routes = {
+            (method, rule.rule)
+            for rule in async_app.url_map.iter_rules()
+            if rule.endpoint != 'static'
+            for method in rule.methods - {'HEAD', 'OPTIONS'}
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or (scope['method'], scope['path']) in self.async_routes:
+            # Lifespan events go to Quart, which has the startup and shutdown hooks
+            await self.async_app(scope, receive, send)
+        else:
+            await self.wsgi_app(scope, receive, send)
+
+
+app = RouteDispatcher(async_app, flask_app, wsgi_threads=Config.ASGI_WSGI_THREADS)
@@ -0,0 +1,286 @@
+import queue
+import threading
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from config import Config
+from db_connection import close_finished_connections, close_thread_connections
+from metrics import metrics
+from near_duplicates import InFlightIndex
+from tokens import estimate_tokens
+
+
+class BatchProcessor:
+    """Process many emails concurrently with a bounded worker pool"""
+
+    # Finished jobs kept around so clients can still poll their progress
+    MAX_FINISHED_JOBS = 100
+
+    def __init__(self, db, email_processor, default_concurrency=8, max_concurrency=32):
+        self.db = db
+        self.email_processor = email_processor
+        self.default_concurrency = default_concurrency
+        self.max_concurrency = max_concurrency
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def start_job(self, email_ids=None, process_type='all', concurrency=None, fused=False, incremental=False,
+                  packed=False):
+        """Create a batch job and run it in the background.
+
+        With incremental, only the sub-tasks whose input fingerprint changed
+        (email content, template version or model) are re-run; email_ids
+        defaults to every email instead of the unprocessed ones. With packed,
+        emails that need a model categorization are categorized several to a
+        request (emails going through a fused request are not).
+        """
+        self.email_processor.select_tasks(process_type)
+
+        if email_ids is None:
+            email_ids = self.db.get_email_ids() if incremental else self.db.get_unprocessed_email_ids()
+
+        concurrency = int(concurrency or self.default_concurrency)
+        concurrency = max(1, min(concurrency, self.max_concurrency))
+
+        job = {
+            'id': str(uuid.uuid4()),
+            'status': 'queued',
+            'process_type': process_type,
+            'fused': bool(fused) and process_type == 'all',
+            'incremental': bool(incremental),
+            'packed': bool(packed) and process_type in ('all', 'categorize'),
+            'concurrency': concurrency,
+            'total': len(email_ids),
+            'processed': 0,
+            'failed': 0,
+            'skipped': 0,
+            'errors': {},
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None
+        }
+
+        with self.lock:
+            self._prune_jobs()
+            self.jobs[job['id']] = job
+
+        thread = threading.Thread(target=self._run_job, args=(job['id'], list(email_ids)), daemon=True)
+        thread.start()
+        return self.get_job(job['id'])
+
+    def get_job(self, job_id):
+        #Get a snapshot of a job's progress
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = dict(job)
+            snapshot['errors'] = dict(job['errors'])
+            return snapshot
+
+    def _run_job(self, job_id, email_ids):
+        self._update_job(job_id, status='running', started_at=datetime.now().isoformat())
+        try:
+            prompts = self.email_processor.prompt_registry.get_prompts()
+            job_tasks = self.email_processor.select_tasks(self.jobs[job_id]['process_type'])
+            near_duplicates = self.email_processor.near_duplicates
+
+            with ThreadPoolExecutor(max_workers=self.jobs[job_id]['concurrency']) as executor:
+                # Every (email, sub-task) pair is an independent unit of work so a
+                # single email's categorize/actions/summary calls also overlap
+                futures = {}
+                completed = queue.Queue()
+                pending = {}
+                results = {}
+                provenance = {}
+                # Near-duplicates of an email still being processed wait for its
+                # results and reuse them instead of repeating its model calls
+                in_flight = InFlightIndex()
+                waiting = defaultdict(list)
+                # Emails waiting for a packed categorization request, as (email, attempt)
+                pack = []
+                pack_tokens = 0
+
+                def submit_pack():
+                    nonlocal pack, pack_tokens
+                    if not pack:
+                        return
+                    future = executor.submit(self.run_pack, [email for email, _ in pack], prompts)
+                    futures[future] = (None, pack)
+                    future.add_done_callback(completed.put)
+                    pack, pack_tokens = [], 0
+
+                def queue_packed(email, attempt=0):
+                    nonlocal pack_tokens
+                    tokens = estimate_tokens(self.email_processor.packed_entry(email))
+                    if pack and (pack_tokens + tokens > Config.PACKED_CATEGORIZATION_TOKEN_BUDGET
+                                 or len(pack) >= Config.PACKED_CATEGORIZATION_MAX_EMAILS):
+                        submit_pack()
+                    pack.append((email, attempt))
+                    pack_tokens += tokens
+
+                def submit_unit(email, task):
+                    future = executor.submit(self.run_unit, email, task, prompts)
+                    futures[future] = (email['id'], task)
+                    future.add_done_callback(completed.put)
+
+                def schedule(email, tasks):
+                    email_id = email['id']
+                    result, remaining = self.email_processor.reuse_duplicate(email, prompts, tasks)
+                    if self.jobs[job_id]['fused'] and len(remaining) == len(self.email_processor.PROCESS_TASKS):
+                        # One combined request per email
+                        remaining = [None]
+                    elif 'categorize' in remaining:
+                        # Obvious mail is categorized locally, without a model call
+                        decision = self.email_processor.pre_classify(email, prompts)
+                        if decision:
+                            result['category'], result['category_source'] = decision
+                            remaining = [task for task in remaining if task != 'categorize']
+                        else:
+                            result['category_source'] = 'llm'
+                    if not remaining:
+                        self._save_result(job_id, email_id, result, self.email_processor.provenance(email, prompts, tasks))
+                        return
+
+                    value = near_duplicates.ensure_indexed(email)
+                    if Config.NEAR_DUPLICATE_REUSE and near_duplicates.is_indexed(email_id, value):
+                        # Only wait when the leader's results would cover everything still to run
+                        if remaining == ['categorize']:
+                            max_distance = near_duplicates.max_distance
+                        else:
+                            max_distance = Config.NEAR_DUPLICATE_FULL_REUSE_DISTANCE
+                        leader = in_flight.find(value, max_distance, email.get('sender'))
+                        if leader is not None:
+                            waiting[leader].append((email, tasks))
+                            return
+                        in_flight.add(email_id, value, email.get('sender'))
+
+                    provenance[email_id] = self.email_processor.provenance(email, prompts, tasks)
+                    results[email_id] = result
+                    pending[email_id] = len(remaining)
+                    for task in remaining:
+                        if task == 'categorize' and self.jobs[job_id]['packed']:
+                            queue_packed(email)
+                        else:
+                            submit_unit(email, task)
+
+                def finish(email_id):
+                    # Its near-duplicates now find it in the index (or, if it failed, run themselves)
+                    in_flight.remove(email_id)
+                    for email, tasks in waiting.pop(email_id, []):
+                        schedule(email, tasks)
+
+                def complete(email_id, values):
+                    results[email_id].update(values)
+                    pending[email_id] -= 1
+                    if pending[email_id] == 0:
+                        del pending[email_id]
+                        self._save_result(job_id, email_id, results.pop(email_id), provenance.pop(email_id))
+                        finish(email_id)
+
+                def fail(email_id, error):
+                    del pending[email_id], results[email_id], provenance[email_id]
+                    metrics.record_error('batch', error)
+                    self._record_failure(job_id, email_id, str(error))
+                    finish(email_id)
+
+                def complete_pack(future, entries):
+                    try:
+                        categories = future.result()
+                    except Exception as e:
+                        for email, _ in entries:
+                            if email['id'] in pending:
+                                fail(email['id'], e)
+                        return
+                    for email, attempt in entries:
+                        if email['id'] not in pending:
+                            continue
+                        if email['id'] in categories:
+                            complete(email['id'], {'category': categories[email['id']]})
+                        elif attempt + 1 < Config.PACKED_CATEGORIZATION_ATTEMPTS:
+                            # Missing from the reply or invalid: try again in a later pack
+                            queue_packed(email, attempt + 1)
+                        else:
+                            submit_unit(email, 'categorize')
+
+                for email_id in email_ids:
+                    email = self.db.get_email(email_id)
+                    if not email:
+                        self._record_failure(job_id, email_id, "Email not found")
+                        continue
+                    tasks = job_tasks
+                    if self.jobs[job_id]['incremental']:
+                        tasks = self.email_processor.stale_tasks(email, prompts, job_tasks)
+                        if not tasks:
+                            self._increment(job_id, 'skipped')
+                            continue
+                    schedule(email, tasks)
+                submit_pack()
+
+                while futures:
+                    future = completed.get()
+                    email_id, task = futures.pop(future)
+                    if email_id is None:
+                        complete_pack(future, task)
+                    elif email_id in pending:
+                        # (Not pending if one of this email's other sub-tasks already failed)
+                        try:
+                            value = future.result()
+                        except Exception as e:
+                            fail(email_id, e)
+                        else:
+                            complete(email_id, value if task is None else {self.email_processor.PROCESS_TASKS[task]: value})
+                    if not futures:
+                        # Emails re-queued or scheduled since the last pack was sent
+                        submit_pack()
+
+            self._update_job(job_id, status='completed', finished_at=datetime.now().isoformat())
+        except Exception as e:
+            self._update_job(job_id, status='failed', error=str(e), finished_at=datetime.now().isoformat())
+        finally:
+            # The job thread and its pool's threads have finished with the database; don't
+            # leave their connections for the next thread that connects to reclaim
+            close_thread_connections()
+            close_finished_connections()
+
+    def _save_result(self, job_id, email_id, result, provenance):
+        result.update(provenance)
+        try:
+            self.db.update_email_processing(email_id, result)
+            self._increment(job_id, 'processed')
+        except Exception as e:
+            metrics.record_error('batch', e)
+            self._record_failure(job_id, email_id, str(e))
+
+    def run_unit(self, email, task, prompts):
+        # Batch work yields to interactive requests in the LLM scheduler
+        with self.email_processor.priority('batch'):
+            if task is None:
+                return self.email_processor.process_email(email, 'all', prompts, fused=True)
+            return self.email_processor.run_task(email, task, prompts)
+
+    def run_pack(self, emails, prompts):
+        with self.email_processor.priority('batch'):
+            return self.email_processor.categorize_packed(emails, prompts)
+
+    def _update_job(self, job_id, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields)
+
+    def _increment(self, job_id, field):
+        with self.lock:
+            self.jobs[job_id][field] += 1
+
+    def _record_failure(self, job_id, email_id, error):
+        with self.lock:
+            self.jobs[job_id]['failed'] += 1
+            self.jobs[job_id]['errors'][email_id] = error
+
+    def _prune_jobs(self):
+        finished = [job for job in self.jobs.values() if job['status'] in ('completed', 'failed')]
+        if len(finished) <= self.MAX_FINISHED_JOBS:
+            return
+        finished.sort(key=lambda job: job['created_at'])
+        for job in finished[:len(finished) - self.MAX_FINISHED_JOBS]:
+            del self.jobs[job['id']]
@@ -1,10 +1,94 @@
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-class Config:
-    OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', 'your-api-key')
-
-    DATABASE_PATH = 'data/emails.db'
-
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class Config:
+    OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', 'your-api-key')
+
+    DATABASE_PATH = 'data/emails.db'
+
+    # Batch processing worker pool
+    BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
+    BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '32'))
+    # Process 'all' with one combined LLM request per email instead of three
+    FUSED_PROCESSING = os.getenv('FUSED_PROCESSING', 'false').lower() in ('1', 'true', 'yes')
+
+    # LLM response cache
+    LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', 'data/llm_cache.db')
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '50000'))
+    LLM_CACHE_MAX_AGE = int(os.getenv('LLM_CACHE_MAX_AGE', str(30 * 24 * 3600)))
+
+    # SQLite connection tuning
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', '-65536'))  # negative = KiB, i.e. 64 MB
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+
+    # Inbox chat retrieval
+    RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '10'))
+    RETRIEVAL_TOKEN_BUDGET = int(os.getenv('RETRIEVAL_TOKEN_BUDGET', '2000'))
+    RETRIEVAL_CANDIDATES = int(os.getenv('RETRIEVAL_CANDIDATES', '50'))
+
+    # Background job queue and workers
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+    JOB_RETRY_DELAY = float(os.getenv('JOB_RETRY_DELAY', '2'))
+    WORKER_POLL_INTERVAL = float(os.getenv('WORKER_POLL_INTERVAL', '0.5'))
+
+    # Mailbox imports
+    IMPORT_DIR = os.getenv('IMPORT_DIR', 'data/imports')
+    IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '5000'))
+
+    # Client-side LLM rate limits for the API key. They are enforced in each process, so every
+    # process gets an equal share; LLM_PROCESSES is how many processes call the model (run.py
+    # sets it to the backend's processes plus WORKER_PROCESSES)
+    LLM_REQUESTS_PER_MINUTE = int(os.getenv('LLM_REQUESTS_PER_MINUTE', '3500'))
+    LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', '90000'))
+    LLM_PROCESSES = max(1, int(os.getenv('LLM_PROCESSES', '1')))
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '5'))
+
+    # USD per 1K tokens, for the cost metrics (gpt-3.5-turbo list prices)
+    LLM_PROMPT_PRICE_PER_1K = float(os.getenv('LLM_PROMPT_PRICE_PER_1K', '0.0005'))
+    LLM_COMPLETION_PRICE_PER_1K = float(os.getenv('LLM_COMPLETION_PRICE_PER_1K', '0.0015'))
+
+    # Add a Server-Timing header with per-stage durations to every API response
+    METRICS_TIMING_HEADER = os.getenv('METRICS_TIMING_HEADER', 'false').lower() in ('1', 'true', 'yes')
+
+    # Replies without threading headers join a thread with the same subject active this recently
+    THREAD_SUBJECT_WINDOW_DAYS = int(os.getenv('THREAD_SUBJECT_WINDOW_DAYS', '30'))
+
+    # Cap on email body tokens sent in prompts after preprocessing (0 = no cap)
+    PREPROCESS_MAX_TOKENS = int(os.getenv('PREPROCESS_MAX_TOKENS', '0'))
+
+    # Local pre-classifier: minimum confidence to skip the categorization call, and the
+    # held-out agreement with LLM labels required before it is used at all
+    PRECLASSIFIER_THRESHOLD = float(os.getenv('PRECLASSIFIER_THRESHOLD', '0.95'))
+    PRECLASSIFIER_MIN_ACCURACY = float(os.getenv('PRECLASSIFIER_MIN_ACCURACY', '0.95'))
+
+    # Near-duplicate reuse: categories are copied from processed emails by the same sender within
+    # MAX_DISTANCE differing SimHash bits (at most 3), actions and summaries within FULL_REUSE_DISTANCE
+    NEAR_DUPLICATE_REUSE = os.getenv('NEAR_DUPLICATE_REUSE', 'true').lower() in ('1', 'true', 'yes')
+    NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', '3'))
+    NEAR_DUPLICATE_FULL_REUSE_DISTANCE = int(os.getenv('NEAR_DUPLICATE_FULL_REUSE_DISTANCE', '0'))
+    NEAR_DUPLICATE_MIN_WORDS = int(os.getenv('NEAR_DUPLICATE_MIN_WORDS', '20'))
+
+    # ASGI server (run.py with BACKEND_SERVER=asgi): threads per process for the routes still
+    # served by the Flask app. Worker processes are set with ASGI_WORKERS in run.py; batch job
+    # progress is kept in memory, so polling process-batch jobs needs a single worker
+    ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '10'))
+
+    # JSON responses at least this large are gzip- or brotli-compressed (brotli when the
+    # optional brotli package is installed and the client accepts it); 0 disables compression
+    RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', '1024'))
+    RESPONSE_COMPRESSION_LEVEL = int(os.getenv('RESPONSE_COMPRESSION_LEVEL', '6'))
+
+    # Packed categorization (batch jobs with packed): emails per request are limited by an email
+    # token budget and a count; emails missing from a reply are re-packed until ATTEMPTS packed
+    # requests have failed them, then categorized on their own
+    PACKED_CATEGORIZATION = os.getenv('PACKED_CATEGORIZATION', 'false').lower() in ('1', 'true', 'yes')
+    PACKED_CATEGORIZATION_TOKEN_BUDGET = int(os.getenv('PACKED_CATEGORIZATION_TOKEN_BUDGET', '3000'))
+    PACKED_CATEGORIZATION_MAX_EMAILS = int(os.getenv('PACKED_CATEGORIZATION_MAX_EMAILS', '20'))
+    PACKED_CATEGORIZATION_ATTEMPTS = int(os.getenv('PACKED_CATEGORIZATION_ATTEMPTS', '2'))
+
+    # Give inbox chat the maintained inbox aggregates (counts by category, tasks, top senders)
+    # alongside the retrieved emails
+    CHAT_INBOX_STATS = os.getenv('CHAT_INBOX_STATS', 'true').lower() in ('1', 'true', 'yes')
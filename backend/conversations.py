@@ -0,0 +1,218 @@
+import hashlib
+import re
+from datetime import datetime, timedelta
+
+# Reply/forward prefixes in common mail clients (English, German, Nordic, French, Spanish...)
+REPLY_PREFIX = re.compile(r'^\s*((re|fw|fwd|aw|sv|vs|wg|tr|rv)(\[\d+\])?\s*:\s*)+', re.IGNORECASE)
+LIST_TAG = re.compile(r'^\s*\[[^\]]{1,40}\]\s*')
+MESSAGE_ID = re.compile(r'<([^<>\s]+)>')
+
+
+def normalize_subject(subject):
+    #Subject with reply/forward prefixes and list tags removed, for matching replies to threads
+    subject = subject or ''
+    while True:
+        stripped = LIST_TAG.sub('', REPLY_PREFIX.sub('', subject))
+        if stripped == subject:
+            break
+        subject = stripped
+    return ' '.join(subject.lower().split())
+
+
+def is_reply_subject(subject):
+    return bool(REPLY_PREFIX.match(LIST_TAG.sub('', subject or '')))
+
+
+def parse_message_ids(value):
+    #Message-IDs from an In-Reply-To/References header, without angle brackets
+    if not value:
+        return []
+    ids = MESSAGE_ID.findall(value)
+    if not ids:
+        ids = [part.strip('<>') for part in value.split()]
+    return [message_id for message_id in ids if message_id]
+
+
+class ConversationThreader:
+    """Group emails into conversations and keep the grouping current.
+
+    Messages are linked through Message-ID, In-Reply-To and References; ids
+    that are referenced but not (yet) stored are remembered in thread_refs,
+    so a parent that arrives after its reply still joins the reply's thread.
+    Replies without usable headers fall back to the most recent thread with
+    the same normalized subject within subject_window_days. When a message
+    links two existing threads they are merged.
+    """
+
+    def __init__(self, db, subject_window_days=30):
+        self.db = db
+        self.subject_window = timedelta(days=subject_window_days)
+        self.init_db()
+
+    def init_db(self):
+        #Initialize thread tables
+        self.db.ensure_column('emails', 'thread_id', 'TEXT')
+        conn = self.db.connect()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS threads (
+                    id TEXT PRIMARY KEY,
+                    subject TEXT,
+                    subject_key TEXT,
+                    message_count INTEGER DEFAULT 0,
+                    first_date TEXT,
+                    last_date TEXT,
+                    summary TEXT,
+                    summary_email_ids TEXT,
+                    summary_version INTEGER,
+                    updated_at TEXT
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS thread_refs (
+                    message_id TEXT PRIMARY KEY,
+                    thread_id TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_emails_thread_date ON emails (thread_id, date, id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_threads_subject_key ON threads (subject_key, last_date)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_thread_refs_thread ON thread_refs (thread_id)')
+
+    def assign_unthreaded(self, batch_size=1000):
+        """Thread every email that has no thread yet, oldest first; returns how many were assigned"""
+        conn = self.db.connect()
+        assigned = 0
+        while True:
+            rows = conn.execute('''
+                SELECT id, message_id, in_reply_to, references_ids, subject, date
+                FROM emails WHERE thread_id IS NULL
+                ORDER BY date, id
+                LIMIT ?
+            ''', (batch_size,)).fetchall()
+            if not rows:
+                return assigned
+            with conn:
+                for row in rows:
+                    self.assign(conn, row)
+            assigned += len(rows)
+
+    def rebuild(self):
+        #Recompute every thread from scratch (e.g. after changing the subject window)
+        conn = self.db.connect()
+        with conn:
+            conn.execute('UPDATE emails SET thread_id = NULL')
+            conn.execute('DELETE FROM thread_refs')
+            conn.execute('DELETE FROM threads')
+        return self.assign_unthreaded()
+
+    def assign(self, conn, email):
+        #Attach one email to a thread, inside the caller's transaction
+        own_id = (email['message_id'] or '').strip('<>') or None
+        linked_ids = parse_message_ids(email['references_ids']) + parse_message_ids(email['in_reply_to'])
+        message_ids = ([own_id] if own_id else []) + linked_ids
+
+        thread_ids = []
+        if message_ids:
+            placeholders = ', '.join('?' for _ in message_ids)
+            thread_ids = [row[0] for row in conn.execute(
+                f'SELECT DISTINCT thread_id FROM thread_refs WHERE message_id IN ({placeholders})', message_ids
+            )]
+
+        subject_key = normalize_subject(email['subject'])
+        if not thread_ids and subject_key and (linked_ids or is_reply_subject(email['subject'])):
+            thread_id = self.find_by_subject(conn, subject_key, email['date'])
+            if thread_id:
+                thread_ids = [thread_id]
+
+        if not thread_ids:
+            thread_id = hashlib.sha1(email['id'].encode('utf-8')).hexdigest()[:16]
+            conn.execute('''
+                INSERT OR IGNORE INTO threads (id, subject, subject_key, message_count, first_date, last_date, updated_at)
+                VALUES (?, ?, ?, 0, ?, ?, ?)
+            ''', (thread_id, email['subject'], subject_key, email['date'], email['date'], datetime.now().isoformat()))
+        else:
+            thread_id = self.merge(conn, thread_ids)
+
+        conn.executemany(
+            'INSERT OR REPLACE INTO thread_refs (message_id, thread_id) VALUES (?, ?)',
+            [(message_id, thread_id) for message_id in message_ids]
+        )
+        conn.execute('UPDATE emails SET thread_id = ? WHERE id = ?', (thread_id, email['id']))
+        self.refresh_stats(conn, thread_id)
+        return thread_id
+
+    @staticmethod
+    def refresh_stats(conn, thread_id):
+        # Counted rather than incremented, so re-threading a replaced email is not double counted
+        conn.execute('''
+            UPDATE threads
+            SET (message_count, first_date, last_date) = (
+                    SELECT COUNT(*), MIN(date), MAX(date) FROM emails WHERE thread_id = threads.id
+                ),
+                updated_at = ?
+            WHERE id = ?
+        ''', (datetime.now().isoformat(), thread_id))
+
+    def find_by_subject(self, conn, subject_key, date):
+        if date:
+            earliest = self.shift_date(date, -self.subject_window)
+            row = conn.execute('''
+                SELECT id FROM threads
+                WHERE subject_key = ? AND last_date >= ?
+                ORDER BY last_date DESC LIMIT 1
+            ''', (subject_key, earliest)).fetchone()
+        else:
+            row = conn.execute('''
+                SELECT id FROM threads WHERE subject_key = ?
+                ORDER BY last_date DESC LIMIT 1
+            ''', (subject_key,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def shift_date(date, delta):
+        try:
+            return (datetime.strptime(date[:19], '%Y-%m-%d %H:%M:%S') + delta).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return date
+
+    def merge(self, conn, thread_ids):
+        #Fold several threads into the largest one and return its id
+        if len(thread_ids) == 1:
+            return thread_ids[0]
+        placeholders = ', '.join('?' for _ in thread_ids)
+        threads = conn.execute(f'''
+            SELECT id FROM threads WHERE id IN ({placeholders})
+            ORDER BY message_count DESC, id
+        ''', thread_ids).fetchall()
+        keep = threads[0]['id']
+        for other in threads[1:]:
+            conn.execute('UPDATE emails SET thread_id = ? WHERE thread_id = ?', (keep, other['id']))
+            conn.execute('UPDATE thread_refs SET thread_id = ? WHERE thread_id = ?', (keep, other['id']))
+            conn.execute('DELETE FROM threads WHERE id = ?', (other['id'],))
+        # The stored summary covered only one of the merged threads
+        conn.execute('UPDATE threads SET summary = NULL, summary_email_ids = NULL WHERE id = ?', (keep,))
+        self.refresh_stats(conn, keep)
+        return keep
+
+    def get_thread(self, thread_id):
+        conn = self.db.connect()
+        row = conn.execute('SELECT * FROM threads WHERE id = ?', (thread_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_thread_emails(self, thread_id):
+        #Emails in a thread, oldest first
+        conn = self.db.connect()
+        rows = conn.execute('''
+            SELECT id, sender, subject, date, body, clean_body, clean_version, category, summary
+            FROM emails WHERE thread_id = ?
+            ORDER BY date, id
+        ''', (thread_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def save_summary(self, thread_id, summary, email_ids, version):
+        conn = self.db.connect()
+        with conn:
+            conn.execute('''
+                UPDATE threads SET summary = ?, summary_email_ids = ?, summary_version = ?, updated_at = ?
+                WHERE id = ?
+            ''', (summary, ' '.join(email_ids), version, datetime.now().isoformat(), thread_id))
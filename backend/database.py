@@ -1,332 +1,1087 @@
-import json
-import sqlite3
-import os
-from datetime import datetime
-
-class Database:
-    def __init__(self, db_path='data/emails.db'):
-        self.db_path = db_path
-        self.init_db()
-    
-    def init_db(self):
-        #Initialize database tables
-        os.makedirs('data', exist_ok=True)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Emails table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS emails (
-                id TEXT PRIMARY KEY,
-                sender TEXT,
-                subject TEXT,
-                body TEXT,
-                date TEXT,
-                category TEXT,
-                actions TEXT,
-                summary TEXT,
-                is_processed BOOLEAN DEFAULT FALSE,
-                created_at TEXT
-            )
-        ''')
-        
-        # Prompts table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS prompts (
-                name TEXT PRIMARY KEY,
-                content TEXT,
-                description TEXT,
-                updated_at TEXT
-            )
-        ''')
-        
-        # Drafts table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS drafts (
-                id TEXT PRIMARY KEY,
-                subject TEXT,
-                body TEXT,
-                to_email TEXT,
-                in_reply_to TEXT,
-                created_at TEXT
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-        
-        # Initialize default prompts if not exists
-        self.init_default_prompts()
-    
-    def init_default_prompts(self):
-        """Initialize default prompt templates"""
-        default_prompts = {
-            'categorization': {
-                'content': '''Categorize emails into: Important, Newsletter, Spam, To-Do, Project Update.
-Important: Urgent emails requiring immediate attention
-Newsletter: Marketing or informational emails
-Spam: Unwanted or promotional emails
-To-Do: Emails containing direct requests requiring user action
-Project Update: Progress reports or project status emails
-
-Respond with only the category name.''',
-                'description': 'Categorize emails into predefined categories'
-            },
-            'action_extraction': {
-                'content': '''Extract tasks and action items from the email. Respond in JSON format:
-{
-    "tasks": [
-        {
-            "task": "description of the task",
-            "deadline": "deadline if mentioned",
-            "priority": "high/medium/low"
-        }
-    ]
-}
-
-If no tasks are found, return empty tasks array.''',
-                'description': 'Extract action items and tasks from emails'
-            },
-            'auto_reply': {
-                'content': '''Draft a polite and professional email reply. Consider the context and tone of the original email.
-If it's a meeting request, ask for an agenda.
-If it's a task request, acknowledge receipt and provide a tentative timeline.
-Keep replies concise and professional.''',
-                'description': 'Generate automatic email replies'
-            },
-            'summary': {
-                'content': 'Summarize this email in 2-3 bullet points highlighting key information and required actions.',
-                'description': 'Generate email summaries'
-            }
-        }
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        for name, prompt_data in default_prompts.items():
-            cursor.execute('''
-                INSERT OR IGNORE INTO prompts (name, content, description, updated_at)
-                VALUES (?, ?, ?, ?)
-            ''', (name, prompt_data['content'], prompt_data['description'], datetime.now().isoformat()))
-        
-        conn.commit()
-        conn.close()
-    
-    def load_mock_data(self):
-        """Load mock email data"""
-        mock_file = 'data/mock_inbox.json'
-        if not os.path.exists(mock_file):
-            self.create_mock_data()
-        
-        with open(mock_file, 'r') as f:
-            emails = json.load(f)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        for email in emails:
-            cursor.execute('''
-                INSERT OR REPLACE INTO emails (id, sender, subject, body, date, created_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                email['id'],
-                email['from'],
-                email['subject'],
-                email['body'],
-                email['date'],
-                datetime.now().isoformat()
-            ))
-        
-        conn.commit()
-        conn.close()
-    
-    def create_mock_data(self):
-        #Create sample mock email data
-        mock_emails = [
-            {
-                "id": "1",
-                "from": "project.manager@company.com",
-                "subject": "Weekly Project Sync Meeting",
-                "body": "Hi team,\n\nLet's schedule our weekly project sync for Thursday at 2 PM. Please come prepared with updates on your respective tasks.\n\nAlso, remember that the Q3 report deadline is next Friday. Please submit your sections by EOD Thursday.\n\nBest regards,\nSarah",
-                "date": "2024-01-15 09:30:00"
-            },
-            {
-                "id": "2",
-                "from": "hr@company.com",
-                "subject": "Benefits Enrollment Reminder",
-                "body": "Dear Employee,\n\nThis is a reminder that benefits enrollment closes this Friday. Please log into the portal and make your selections.\n\nIf you have any questions, contact HR.\n\nThank you,\nHR Department",
-                "date": "2024-01-15 11:15:00"
-            },
-            {
-                "id": "3",
-                "from": "tech-news@newsletter.com",
-                "subject": "AI Developments Weekly",
-                "body": "This week in AI: New breakthroughs in language models, industry updates, and more...",
-                "date": "2024-01-15 08:00:00"
-            },
-            {
-                "id": "4",
-                "from": "client@clientcompany.com",
-                "subject": "Urgent: Website Issue",
-                "body": "Hello,\n\nWe're experiencing a critical issue with our website. The payment gateway is not working. Can you please look into this immediately?\n\nWe need this fixed by end of day today.\n\nThanks,\nJohn Client",
-                "date": "2024-01-15 10:45:00"
-            },
-            {
-                "id": "5",
-                "from": "marketing@company.com",
-                "subject": "Q1 Marketing Campaign Results",
-                "body": "Team,\n\nAttached are the Q1 marketing campaign results. We exceeded our KPIs by 15%. Great work everyone!\n\nOur next campaign planning session is scheduled for next Monday.\n\nRegards,\nMarketing Team",
-                "date": "2024-01-14 16:20:00"
-            },
-            {
-                "id": "6",
-                "from": "noreply@bank.com",
-                "subject": "Your statement is ready",
-                "body": "Your monthly account statement is now available for download.",
-                "date": "2024-01-14 14:30:00"
-            },
-            {
-                "id": "7",
-                "from": "ceo@company.com",
-                "subject": "All Hands Meeting Next Week",
-                "body": "Hello everyone,\n\nWe'll have an all-hands meeting next Wednesday at 10 AM to discuss company strategy and upcoming initiatives.\n\nPlease block your calendars.\n\nBest,\nCEO",
-                "date": "2024-01-14 13:15:00"
-            },
-            {
-                "id": "8",
-                "from": "colleague@company.com",
-                "subject": "Need your feedback on design mockups",
-                "body": "Hi,\n\nCould you please review the attached design mockups and provide feedback by tomorrow? We need to finalize the designs for the client presentation on Friday.\n\nThanks!",
-                "date": "2024-01-14 11:45:00"
-            },
-            {
-                "id": "9",
-                "from": "updates@linkedin.com",
-                "subject": "Weekly digest from your network",
-                "body": "See what's happening in your professional network this week...",
-                "date": "2024-01-14 10:00:00"
-            },
-            {
-                "id": "10",
-                "from": "it-support@company.com",
-                "subject": "System Maintenance Tonight",
-                "body": "Important: There will be system maintenance tonight from 10 PM to 2 AM. Some services may be unavailable during this time.\n\nPlan your work accordingly.\n\nIT Department",
-                "date": "2024-01-14 09:30:00"
-            }
-        ]
-        
-        os.makedirs('data', exist_ok=True)
-        with open('data/mock_inbox.json', 'w') as f:
-            json.dump(mock_emails, f, indent=2)
-    
-    def get_emails(self):
-        #Get all emails
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM emails ORDER BY date DESC')
-        emails = [dict(row) for row in cursor.fetchall()]
-        
-        # Parse JSON fields
-        for email in emails:
-            if email.get('actions'):
-                try:
-                    email['actions'] = json.loads(email['actions'])
-                except:
-                    email['actions'] = {}
-        
-        conn.close()
-        return emails
-    
-    def get_email(self, email_id):
-        #Get specific email by ID
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM emails WHERE id = ?', (email_id,))
-        email = cursor.fetchone()
-        
-        if email:
-            email_dict = dict(email)
-            if email_dict.get('actions'):
-                try:
-                    email_dict['actions'] = json.loads(email_dict['actions'])
-                except:
-                    email_dict['actions'] = {}
-            return email_dict
-        
-        return None
-    
-    def update_email_processing(self, email_id, processing_results):
-        #Update email with processing results
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE emails 
-            SET category = ?, actions = ?, summary = ?, is_processed = TRUE
-            WHERE id = ?
-        ''', (
-            processing_results.get('category'),
-            json.dumps(processing_results.get('actions', {})),
-            processing_results.get('summary'),
-            email_id
-        ))
-        
-        conn.commit()
-        conn.close()
-    
-    def get_prompts(self):
-        #Get all prompt templates
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM prompts')
-        prompts = {row['name']: dict(row) for row in cursor.fetchall()}
-        
-        conn.close()
-        return prompts
-    
-    def update_prompt(self, name, content):
-        #Update a prompt template
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE prompts 
-            SET content = ?, updated_at = ?
-            WHERE name = ?
-        ''', (content, datetime.now().isoformat(), name))
-        
-        conn.commit()
-        conn.close()
-    
-    def save_draft(self, draft_data):
-        #Save email draft
-        import uuid
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        draft_id = str(uuid.uuid4())
-        
-        cursor.execute('''
-            INSERT INTO drafts (id, subject, body, to_email, in_reply_to, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            draft_id,
-            draft_data['subject'],
-            draft_data['body'],
-            draft_data['to'],
-            draft_data.get('in_reply_to'),
-            datetime.now().isoformat()
-        ))
-        
-        conn.commit()
-        conn.close()
-
-        return draft_id
+import base64
+import json
+import os
+import re
+from datetime import datetime
+from llm_cache import LLMCache
+from db_connection import ConnectionManager
+from action_items import task_rows
+from metrics import metrics
+
+class Database:
+    # Columns that can be requested through list_emails(fields=...)
+    EMAIL_FIELDS = ['id', 'sender', 'subject', 'body', 'date', 'category', 'actions', 'summary', 'is_processed', 'created_at', 'thread_id']
+    
+    # Email columns caching derived data for prompting and the duplicate index; they are
+    # never served, so rewriting them is not a change to the email
+    CACHE_COLUMNS = ['clean_body', 'clean_version', 'simhash']
+    
+    # Templates that are combined into a single fused processing request
+    PROCESSING_PROMPTS = ['categorization', 'action_extraction', 'summary']
+    
+    def __init__(self, db_path='data/emails.db', llm_cache=None):
+        self.db_path = db_path
+        self.connections = ConnectionManager(db_path)
+        self.llm_cache = llm_cache or LLMCache()
+        self.init_db()
+    
+    def connect(self):
+        #Get a pooled connection for the calling thread
+        return self.connections.connect()
+    
+    def close(self):
+        #Close all pooled connections
+        self.connections.close_all()
+        self.llm_cache.close()
+    
+    def init_db(self):
+        #Initialize database tables
+        os.makedirs('data', exist_ok=True)
+        
+        conn = self.connect()
+        with conn:
+            cursor = conn.cursor()
+        
+            # Emails table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS emails (
+                    id TEXT PRIMARY KEY,
+                    sender TEXT,
+                    subject TEXT,
+                    body TEXT,
+                    date TEXT,
+                    category TEXT,
+                    actions TEXT,
+                    summary TEXT,
+                    is_processed BOOLEAN DEFAULT FALSE,
+                    created_at TEXT
+                )
+            ''')
+        
+            # Indexes backing keyset pagination and the list filters
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_date_id ON emails (date, id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_category_date ON emails (category, date, id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_processed_date ON emails (is_processed, date, id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_sender_date ON emails (sender, date, id)')
+        
+            # Prompts table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS prompts (
+                    name TEXT PRIMARY KEY,
+                    content TEXT,
+                    description TEXT,
+                    updated_at TEXT
+                )
+            ''')
+        
+            # Drafts table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS drafts (
+                    id TEXT PRIMARY KEY,
+                    subject TEXT,
+                    body TEXT,
+                    to_email TEXT,
+                    in_reply_to TEXT,
+                    created_at TEXT
+                )
+            ''')
+        
+        with conn:
+            # Change counters, bumped whenever a table's contents change
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS table_versions (
+                    name TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            conn.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('prompts', 1)")
+        
+        # Columns added after the original schema
+        self.ensure_column('emails', 'message_id', 'TEXT')
+        self.ensure_column('emails', 'in_reply_to', 'TEXT')
+        self.ensure_column('emails', 'references_ids', 'TEXT')
+        self.ensure_column('emails', 'headers', 'TEXT')
+        self.ensure_column('emails', 'prompt_versions', 'TEXT')
+        self.ensure_column('emails', 'fingerprints', 'TEXT')
+        self.ensure_column('emails', 'clean_body', 'TEXT')
+        self.ensure_column('emails', 'clean_version', 'INTEGER')
+        self.ensure_column('emails', 'category_source', 'TEXT')
+        # Set by ConversationIndex; created here too since EMAIL_FIELDS and the change log triggers name it
+        self.ensure_column('emails', 'thread_id', 'TEXT')
+        self.ensure_column('prompts', 'version', 'INTEGER DEFAULT 1')
+        # Unix time of the last bump, for Last-Modified
+        self.ensure_column('table_versions', 'changed_at', 'INTEGER')
+        
+        with conn:
+            # Imports dedupe on Message-ID
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_emails_message_id ON emails (message_id) WHERE message_id IS NOT NULL')
+            # Any write to the templates is a new version of the prompts listing and of every
+            # process's PromptRegistry, including default templates added by a newer release
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS prompts_version_{event.lower()} AFTER {event} ON prompts BEGIN
+                        INSERT INTO table_versions (name, version, changed_at) VALUES ('prompts', 1, CAST(strftime('%s', 'now') AS INTEGER))
+                        ON CONFLICT (name) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+                    END
+                ''')
+        
+        self.init_search_index()
+        self.init_change_log()
+        self.init_tasks()
+        self.init_inbox_stats()
+        
+        # Initialize default prompts if not exists
+        self.init_default_prompts()
+    
+    def ensure_column(self, table, column, definition):
+        #Add a column to an existing table if it is missing
+        conn = self.connect()
+        columns = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+        if column not in columns:
+            with conn:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    
+    def init_search_index(self):
+        """Create the FTS5 index over emails and the triggers that keep it in sync"""
+        conn = self.connect()
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'emails_fts'"
+        ).fetchone()
+        
+        with conn:
+            cursor = conn.cursor()
+            
+            # External-content table: the text lives in emails, FTS only stores the index
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+                    sender, subject, body, summary,
+                    content='emails', content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS emails_fts_insert AFTER INSERT ON emails BEGIN
+                    INSERT INTO emails_fts (rowid, sender, subject, body, summary)
+                    VALUES (new.rowid, new.sender, new.subject, new.body, new.summary);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS emails_fts_delete AFTER DELETE ON emails BEGIN
+                    INSERT INTO emails_fts (emails_fts, rowid, sender, subject, body, summary)
+                    VALUES ('delete', old.rowid, old.sender, old.subject, old.body, old.summary);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS emails_fts_update AFTER UPDATE OF sender, subject, body, summary ON emails BEGIN
+                    INSERT INTO emails_fts (emails_fts, rowid, sender, subject, body, summary)
+                    VALUES ('delete', old.rowid, old.sender, old.subject, old.body, old.summary);
+                    INSERT INTO emails_fts (rowid, sender, subject, body, summary)
+                    VALUES (new.rowid, new.sender, new.subject, new.body, new.summary);
+                END
+            ''')
+        
+        if not exists:
+            # Index emails stored before the search index existed
+            self.rebuild_search_index()
+    
+    def init_change_log(self):
+        """Create the email change log and the triggers that fill it.
+
+        Each email has one row holding its latest change; re-logging an email
+        replaces the row with a new, higher seq (AUTOINCREMENT never reuses
+        one), so seq is a monotonic change sequence and clients can ask for
+        everything after the last seq they saw. Deleted emails keep a
+        'delete' row. Every column the email endpoints serve is watched, so
+        seq and the emails table version cover every byte of their responses
+        (which is what their ETags rely on); CACHE_COLUMNS are not.
+        """
+        conn = self.connect()
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'email_changes'"
+        ).fetchone()
+        fields = [
+            row['name'] for row in conn.execute('PRAGMA table_info(emails)')
+            if row['name'] != 'id' and row['name'] not in self.CACHE_COLUMNS
+        ]
+        # UPDATE OF fires for any assignment, so also require a value to differ: rewriting
+        # rows with the same values (e.g. re-threading) is not a change
+        changed = ' OR '.join(f"old.{field} IS NOT new.{field}" for field in fields)
+        update_trigger = f'''CREATE TRIGGER email_changes_update AFTER UPDATE OF {', '.join(fields)} ON emails
+                WHEN {changed}
+                BEGIN
+                    INSERT OR REPLACE INTO email_changes (email_id, op) VALUES (new.id, 'update');
+                END'''
+        existing = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'email_changes_update'"
+        ).fetchone()
+        
+        with conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS email_changes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    email_id TEXT NOT NULL UNIQUE,
+                    op TEXT NOT NULL
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS email_changes_insert AFTER INSERT ON emails BEGIN
+                    INSERT OR REPLACE INTO email_changes (email_id, op) VALUES (new.id, 'insert');
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS email_changes_delete AFTER DELETE ON emails BEGIN
+                    INSERT OR REPLACE INTO email_changes (email_id, op) VALUES (old.id, 'delete');
+                END
+            ''')
+            if not existing or existing[0] != update_trigger:
+                # New, or created for other columns (columns added since, or by an older version)
+                cursor.execute('DROP TRIGGER IF EXISTS email_changes_update')
+                cursor.execute(update_trigger)
+            # Every logged change is also a new version of the emails table
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS email_changes_version AFTER INSERT ON email_changes BEGIN
+                    INSERT INTO table_versions (name, version, changed_at) VALUES ('emails', 1, CAST(strftime('%s', 'now') AS INTEGER))
+                    ON CONFLICT (name) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+                END
+            ''')
+            
+            if not exists:
+                # Emails stored before the change log existed
+                cursor.execute("INSERT INTO email_changes (email_id, op) SELECT id, 'insert' FROM emails ORDER BY rowid")
+    
+    def init_tasks(self):
+        """Create the action item table, filling it from stored actions the first time.
+
+        Each extracted task is a row with its deadline normalized to an ISO
+        date, so task queries are index range scans instead of decoding every
+        email's actions JSON. update_email_processing keeps it current.
+        """
+        conn = self.connect()
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks'"
+        ).fetchone()
+        
+        with conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY,
+                    email_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    task TEXT NOT NULL,
+                    deadline TEXT,
+                    deadline_text TEXT,
+                    priority TEXT,
+                    status TEXT NOT NULL DEFAULT 'open',
+                    created_at TEXT
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_deadline ON tasks (deadline)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_priority ON tasks (priority, deadline)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_email ON tasks (email_id)')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS tasks_email_delete AFTER DELETE ON emails BEGIN
+                    DELETE FROM tasks WHERE email_id = old.id;
+                END
+            ''')
+            
+            if not exists:
+                # Actions extracted before the table existed
+                rows = cursor.execute('SELECT id, date, actions FROM emails WHERE actions IS NOT NULL').fetchall()
+                for row in rows:
+                    try:
+                        actions = json.loads(row['actions'])
+                    except ValueError:
+                        continue
+                    self.replace_tasks(cursor, row['id'], actions, row['date'])
+    
+    @staticmethod
+    def replace_tasks(cursor, email_id, actions, email_date):
+        #Replace an email's task rows as part of the caller's transaction; tasks that are still there keep their status
+        statuses = dict(cursor.execute('SELECT task, status FROM tasks WHERE email_id = ?', (email_id,)).fetchall())
+        cursor.execute('DELETE FROM tasks WHERE email_id = ?', (email_id,))
+        now = datetime.now().isoformat()
+        cursor.executemany('''
+            INSERT INTO tasks (email_id, position, task, deadline, deadline_text, priority, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (email_id, position, task, deadline, deadline_text, priority, statuses.get(task, 'open'), now)
+            for position, task, deadline, deadline_text, priority in task_rows(actions, email_date)
+        ])
+    
+    # Inbox aggregates kept in inbox_stats: metric -> query computing (key, value) from scratch
+    INBOX_STATS_QUERIES = {
+        'emails': "SELECT '', COUNT(*) FROM emails",
+        'unprocessed': "SELECT '', COUNT(*) FROM emails WHERE NOT COALESCE(is_processed, FALSE)",
+        'category': "SELECT COALESCE(category, ''), COUNT(*) FROM emails GROUP BY 1",
+        'sender': "SELECT COALESCE(sender, ''), COUNT(*) FROM emails GROUP BY 1",
+        'task_status': "SELECT status, COUNT(*) FROM tasks GROUP BY 1",
+        'open_task_priority': "SELECT COALESCE(priority, ''), COUNT(*) FROM tasks WHERE status = 'open' GROUP BY 1"
+    }
+    
+    def init_inbox_stats(self):
+        """Create the inbox aggregates table and the triggers that maintain it.
+
+        Counts per category, sender, task status and so on are adjusted by
+        triggers on emails and tasks, in the same transaction as whatever
+        changed them (mock loads, imports, processing results), so reading
+        them costs the same however large the inbox is.
+        """
+        conn = self.connect()
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'inbox_stats'"
+        ).fetchone()
+        
+        def adjust(metric, key, delta):
+            return f'''
+                    INSERT INTO inbox_stats (metric, key, value) VALUES ('{metric}', {key}, {delta})
+                    ON CONFLICT (metric, key) DO UPDATE SET value = value + excluded.value;'''
+        
+        def email_changes(row, sign):
+            return (adjust('emails', "''", sign)
+                    + adjust('unprocessed', "''", f"CASE WHEN {row}.is_processed THEN 0 ELSE {sign} END")
+                    + adjust('category', f"COALESCE({row}.category, '')", sign)
+                    + adjust('sender', f"COALESCE({row}.sender, '')", sign))
+        
+        def task_changes(row, sign):
+            return (adjust('task_status', f"{row}.status", sign)
+                    + adjust('open_task_priority', f"COALESCE({row}.priority, '')", f"CASE WHEN {row}.status = 'open' THEN {sign} ELSE 0 END"))
+        
+        triggers = {
+            'inbox_stats_email_insert': f"AFTER INSERT ON emails BEGIN {email_changes('new', 1)} END",
+            'inbox_stats_email_delete': f"AFTER DELETE ON emails BEGIN {email_changes('old', -1)} END",
+            'inbox_stats_email_category': f'''AFTER UPDATE OF category ON emails WHEN old.category IS NOT new.category BEGIN
+                    {adjust('category', "COALESCE(old.category, '')", -1)}{adjust('category', "COALESCE(new.category, '')", 1)} END''',
+            'inbox_stats_email_processed': f'''AFTER UPDATE OF is_processed ON emails WHEN old.is_processed IS NOT new.is_processed BEGIN
+                    {adjust('unprocessed', "''", "CASE WHEN old.is_processed THEN 0 ELSE -1 END + CASE WHEN new.is_processed THEN 0 ELSE 1 END")} END''',
+            'inbox_stats_email_sender': f'''AFTER UPDATE OF sender ON emails WHEN old.sender IS NOT new.sender BEGIN
+                    {adjust('sender', "COALESCE(old.sender, '')", -1)}{adjust('sender', "COALESCE(new.sender, '')", 1)} END''',
+            'inbox_stats_task_insert': f"AFTER INSERT ON tasks BEGIN {task_changes('new', 1)} END",
+            'inbox_stats_task_delete': f"AFTER DELETE ON tasks BEGIN {task_changes('old', -1)} END",
+            'inbox_stats_task_update': f'''AFTER UPDATE OF status, priority ON tasks
+                    WHEN old.status IS NOT new.status OR old.priority IS NOT new.priority BEGIN
+                    {task_changes('old', -1)}{task_changes('new', 1)} END'''
+        }
+        
+        with conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS inbox_stats (
+                    metric TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value INTEGER NOT NULL,
+                    PRIMARY KEY (metric, key)
+                ) WITHOUT ROWID
+            ''')
+            # Top senders without sorting every sender
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_inbox_stats_value ON inbox_stats (metric, value)')
+            for name, body in triggers.items():
+                cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+            
+            if not exists:
+                self.rebuild_inbox_stats(cursor)
+    
+    def rebuild_inbox_stats(self, cursor):
+        #Recompute every aggregate from scratch as part of the caller's transaction
+        cursor.execute('DELETE FROM inbox_stats')
+        for metric, query in self.INBOX_STATS_QUERIES.items():
+            cursor.execute(f"INSERT INTO inbox_stats (metric, key, value) SELECT '{metric}', * FROM ({query})")
+    
+    @metrics.timed('db')
+    def get_inbox_stats(self, top_senders=10):
+        """Inbox overview from the maintained aggregates: counts by category, processing state, task status and sender"""
+        conn = self.connect()
+        metrics_names = [metric for metric in self.INBOX_STATS_QUERIES if metric != 'sender']
+        rows = conn.execute(f'''
+            SELECT metric, key, value FROM inbox_stats
+            WHERE metric IN ({', '.join('?' * len(metrics_names))}) AND value != 0
+        ''', metrics_names).fetchall()
+        counts = {}
+        for row in rows:
+            counts.setdefault(row['metric'], {})[row['key']] = row['value']
+        
+        senders = conn.execute('''
+            SELECT key, value FROM inbox_stats
+            WHERE metric = 'sender' AND value > 0
+            ORDER BY value DESC LIMIT ?
+        ''', (top_senders,)).fetchall()
+        
+        total = counts.get('emails', {}).get('', 0)
+        unprocessed = counts.get('unprocessed', {}).get('', 0)
+        categories = counts.get('category', {})
+        priorities = counts.get('open_task_priority', {})
+        return {
+            'emails': total,
+            'processed': total - unprocessed,
+            'unprocessed': unprocessed,
+            'categories': {name: count for name, count in categories.items() if name},
+            'uncategorized': categories.get('', 0),
+            'tasks': {
+                'by_status': counts.get('task_status', {}),
+                'open_by_priority': {name or 'unset': count for name, count in priorities.items()}
+            },
+            'top_senders': [{'sender': row['key'], 'count': row['value']} for row in senders]
+        }
+    
+    @metrics.timed('db')
+    def check_inbox_stats(self, repair=False):
+        """Recompute the aggregates from scratch and diff them against the maintained ones.
+
+        Returns {'consistent', 'differences', 'repaired'}; with repair, a table
+        that has drifted is rebuilt.
+        """
+        conn = self.connect()
+        with conn:
+            # sqlite3 only opens transactions for writes; this one gives both sides the same snapshot
+            if not conn.in_transaction:
+                conn.execute('BEGIN')
+            stored = {
+                (row['metric'], row['key']): row['value']
+                for row in conn.execute('SELECT metric, key, value FROM inbox_stats WHERE value != 0')
+            }
+            actual = {}
+            for metric, query in self.INBOX_STATS_QUERIES.items():
+                for key, value in conn.execute(query):
+                    if value:
+                        actual[(metric, key)] = value
+            
+            differences = [
+                {'metric': metric, 'key': key, 'stored': stored.get((metric, key), 0), 'actual': actual.get((metric, key), 0)}
+                for metric, key in sorted(set(stored) | set(actual))
+                if stored.get((metric, key), 0) != actual.get((metric, key), 0)
+            ]
+            if differences and repair:
+                self.rebuild_inbox_stats(conn.cursor())
+        
+        return {'consistent': not differences, 'differences': differences, 'repaired': bool(differences and repair)}
+    
+    def rebuild_search_index(self):
+        """Rebuild the full-text index from the emails table (e.g. after VACUUM renumbers rowids)"""
+        conn = self.connect()
+        with conn:
+            conn.execute("INSERT INTO emails_fts (emails_fts) VALUES ('rebuild')")
+    
+    def init_default_prompts(self):
+        """Initialize default prompt templates"""
+        default_prompts = {
+            'categorization': {
+                'content': '''Categorize emails into: Important, Newsletter, Spam, To-Do, Project Update.
+Important: Urgent emails requiring immediate attention
+Newsletter: Marketing or informational emails
+Spam: Unwanted or promotional emails
+To-Do: Emails containing direct requests requiring user action
+Project Update: Progress reports or project status emails
+
+Respond with only the category name.''',
+                'description': 'Categorize emails into predefined categories'
+            },
+            'action_extraction': {
+                'content': '''Extract tasks and action items from the email. Respond in JSON format:
+{
+    "tasks": [
+        {
+            "task": "description of the task",
+            "deadline": "deadline if mentioned",
+            "priority": "high/medium/low"
+        }
+    ]
+}
+
+If no tasks are found, return empty tasks array.''',
+                'description': 'Extract action items and tasks from emails'
+            },
+            'auto_reply': {
+                'content': '''Draft a polite and professional email reply. Consider the context and tone of the original email.
+If it's a meeting request, ask for an agenda.
+If it's a task request, acknowledge receipt and provide a tentative timeline.
+Keep replies concise and professional.''',
+                'description': 'Generate automatic email replies'
+            },
+            'summary': {
+                'content': 'Summarize this email in 2-3 bullet points highlighting key information and required actions.',
+                'description': 'Generate email summaries'
+            }
+        }
+        
+        conn = self.connect()
+        with conn:
+            cursor = conn.cursor()
+        
+            for name, prompt_data in default_prompts.items():
+                cursor.execute('''
+                    INSERT OR IGNORE INTO prompts (name, content, description, updated_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (name, prompt_data['content'], prompt_data['description'], datetime.now().isoformat()))
+    
+    @metrics.timed('db')
+    def load_mock_data(self):
+        """Load mock email data"""
+        mock_file = 'data/mock_inbox.json'
+        if not os.path.exists(mock_file):
+            self.create_mock_data()
+        
+        with open(mock_file, 'r') as f:
+            emails = json.load(f)
+        
+        conn = self.connect()
+        with conn:
+            cursor = conn.cursor()
+        
+            for email in emails:
+                # Deleted first rather than REPLACEd, which would skip the delete triggers
+                # that keep tasks and inbox stats in step
+                cursor.execute('DELETE FROM emails WHERE id = ?', (email['id'],))
+                cursor.execute('''
+                    INSERT INTO emails (id, sender, subject, body, date, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (
+                    email['id'],
+                    email['from'],
+                    email['subject'],
+                    email['body'],
+                    email['date'],
+                    datetime.now().isoformat()
+                ))
+    
+    def create_mock_data(self):
+        #Create sample mock email data
+        mock_emails = [
+            {
+                "id": "1",
+                "from": "project.manager@company.com",
+                "subject": "Weekly Project Sync Meeting",
+                "body": "Hi team,\n\nLet's schedule our weekly project sync for Thursday at 2 PM. Please come prepared with updates on your respective tasks.\n\nAlso, remember that the Q3 report deadline is next Friday. Please submit your sections by EOD Thursday.\n\nBest regards,\nSarah",
+                "date": "2024-01-15 09:30:00"
+            },
+            {
+                "id": "2",
+                "from": "hr@company.com",
+                "subject": "Benefits Enrollment Reminder",
+                "body": "Dear Employee,\n\nThis is a reminder that benefits enrollment closes this Friday. Please log into the portal and make your selections.\n\nIf you have any questions, contact HR.\n\nThank you,\nHR Department",
+                "date": "2024-01-15 11:15:00"
+            },
+            {
+                "id": "3",
+                "from": "tech-news@newsletter.com",
+                "subject": "AI Developments Weekly",
+                "body": "This week in AI: New breakthroughs in language models, industry updates, and more...",
+                "date": "2024-01-15 08:00:00"
+            },
+            {
+                "id": "4",
+                "from": "client@clientcompany.com",
+                "subject": "Urgent: Website Issue",
+                "body": "Hello,\n\nWe're experiencing a critical issue with our website. The payment gateway is not working. Can you please look into this immediately?\n\nWe need this fixed by end of day today.\n\nThanks,\nJohn Client",
+                "date": "2024-01-15 10:45:00"
+            },
+            {
+                "id": "5",
+                "from": "marketing@company.com",
+                "subject": "Q1 Marketing Campaign Results",
+                "body": "Team,\n\nAttached are the Q1 marketing campaign results. We exceeded our KPIs by 15%. Great work everyone!\n\nOur next campaign planning session is scheduled for next Monday.\n\nRegards,\nMarketing Team",
+                "date": "2024-01-14 16:20:00"
+            },
+            {
+                "id": "6",
+                "from": "noreply@bank.com",
+                "subject": "Your statement is ready",
+                "body": "Your monthly account statement is now available for download.",
+                "date": "2024-01-14 14:30:00"
+            },
+            {
+                "id": "7",
+                "from": "ceo@company.com",
+                "subject": "All Hands Meeting Next Week",
+                "body": "Hello everyone,\n\nWe'll have an all-hands meeting next Wednesday at 10 AM to discuss company strategy and upcoming initiatives.\n\nPlease block your calendars.\n\nBest,\nCEO",
+                "date": "2024-01-14 13:15:00"
+            },
+            {
+                "id": "8",
+                "from": "colleague@company.com",
+                "subject": "Need your feedback on design mockups",
+                "body": "Hi,\n\nCould you please review the attached design mockups and provide feedback by tomorrow? We need to finalize the designs for the client presentation on Friday.\n\nThanks!",
+                "date": "2024-01-14 11:45:00"
+            },
+            {
+                "id": "9",
+                "from": "updates@linkedin.com",
+                "subject": "Weekly digest from your network",
+                "body": "See what's happening in your professional network this week...",
+                "date": "2024-01-14 10:00:00"
+            },
+            {
+                "id": "10",
+                "from": "it-support@company.com",
+                "subject": "System Maintenance Tonight",
+                "body": "Important: There will be system maintenance tonight from 10 PM to 2 AM. Some services may be unavailable during this time.\n\nPlan your work accordingly.\n\nIT Department",
+                "date": "2024-01-14 09:30:00"
+            }
+        ]
+        
+        os.makedirs('data', exist_ok=True)
+        with open('data/mock_inbox.json', 'w') as f:
+            json.dump(mock_emails, f, indent=2)
+    
+    @metrics.timed('db')
+    def get_emails(self):
+        #Get all emails
+        conn = self.connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT * FROM emails ORDER BY date DESC')
+        emails = [dict(row) for row in cursor.fetchall()]
+        for email in emails:
+            # Prompt-only copy of the body and index hash; not part of the listing
+            for column in self.CACHE_COLUMNS:
+                email.pop(column, None)
+        
+        # Parse JSON fields
+        with metrics.timer('json', 'decode_email_rows'):
+            for email in emails:
+                self.decode_json_fields(email)
+        
+        return emails
+    
+    @metrics.timed('db')
+    def list_emails(self, limit=50, cursor=None, fields=None, category=None, is_processed=None,
+                    sender=None, date_from=None, date_to=None):
+        """List emails newest first using keyset pagination on (date, id).
+
+        Returns (emails, next_cursor); next_cursor is None on the last page.
+        """
+        if fields:
+            unknown = [field for field in fields if field not in self.EMAIL_FIELDS]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+            # id and date are needed to build the next cursor
+            columns = ['id', 'date'] + [field for field in fields if field not in ('id', 'date')]
+        else:
+            columns = list(self.EMAIL_FIELDS)
+        
+        conditions = []
+        params = []
+        if category is not None:
+            conditions.append('category = ?')
+            params.append(category)
+        if is_processed is not None:
+            conditions.append('is_processed = ?')
+            params.append(1 if is_processed else 0)
+        if sender is not None:
+            conditions.append('sender = ?')
+            params.append(sender)
+        if date_from is not None:
+            conditions.append('date >= ?')
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append('date <= ?')
+            params.append(date_to)
+        
+        def page(extra_condition, extra_params, count):
+            where = conditions + [extra_condition] if extra_condition else conditions
+            query = f"SELECT {', '.join(columns)} FROM emails"
+            if where:
+                query += ' WHERE ' + ' AND '.join(where)
+            query += ' ORDER BY date DESC, id DESC LIMIT ?'
+            return conn.execute(query, params + extra_params + [count]).fetchall()
+        
+        conn = self.connect()
+        # Fetch one extra row to know whether another page exists
+        if not cursor:
+            rows = page(None, [], limit + 1)
+        else:
+            cursor_date, cursor_id = self.decode_cursor(cursor)
+            if cursor_date is None:
+                rows = page('date IS NULL AND id < ?', [cursor_id], limit + 1)
+            else:
+                rows = page('(date, id) < (?, ?)', [cursor_date, cursor_id], limit + 1)
+                if len(rows) <= limit:
+                    # Emails without a date (unparseable Date header) sort after every dated
+                    # one, but no row comparison matches NULL; a separate query keeps both
+                    # of them index range scans
+                    rows += page('date IS NULL', [], limit + 1 - len(rows))
+        
+        emails = [dict(row) for row in rows[:limit]]
+        with metrics.timer('json', 'decode_email_rows'):
+            for email in emails:
+                self.decode_json_fields(email)
+        
+        next_cursor = None
+        if len(rows) > limit:
+            last = emails[-1]
+            next_cursor = self.encode_cursor(last['date'], last['id'])
+        
+        return emails, next_cursor
+    
+    @metrics.timed('db')
+    def get_change_seq(self):
+        #Latest email change sequence number (0 before any change)
+        conn = self.connect()
+        return conn.execute('SELECT COALESCE(MAX(seq), 0) FROM email_changes').fetchone()[0]
+    
+    @metrics.timed('db')
+    def get_email_changes(self, since, limit=500, fields=None):
+        """Emails inserted, updated or deleted after change `since`, oldest change first.
+
+        Returns (changes, next_since, has_more). Each change carries the
+        email's current fields, or just its id when it was deleted.
+        """
+        if fields:
+            unknown = [field for field in fields if field not in self.EMAIL_FIELDS]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+            # id and date are needed to place the email in a listing
+            columns = ['id', 'date'] + [field for field in fields if field not in ('id', 'date')]
+        else:
+            columns = list(self.EMAIL_FIELDS)
+        
+        conn = self.connect()
+        rows = conn.execute(f'''
+            SELECT c.seq AS _seq, c.op AS _op, c.email_id AS _email_id, {', '.join(f'e.{column} AS {column}' for column in columns)}
+            FROM email_changes c
+            LEFT JOIN emails e ON e.id = c.email_id
+            WHERE c.seq > ?
+            ORDER BY c.seq
+            LIMIT ?
+        ''', (since, limit + 1)).fetchall()
+        
+        changes = []
+        for row in rows[:limit]:
+            row = dict(row)
+            seq, op, email_id = row.pop('_seq'), row.pop('_op'), row.pop('_email_id')
+            if op == 'delete':
+                changes.append({'seq': seq, 'op': op, 'id': email_id})
+            else:
+                with metrics.timer('json', 'decode_email_rows'):
+                    self.decode_json_fields(row)
+                changes.append({'seq': seq, 'op': op, 'email': row})
+        
+        next_since = changes[-1]['seq'] if changes else since
+        return changes, next_since, len(rows) > limit
+    
+    @metrics.timed('db')
+    def list_tasks(self, limit=50, cursor=None, due_from=None, due_to=None, priorities=None, status=None,
+                   email_id=None):
+        """List tasks soonest deadline first, tasks without a deadline last, with keyset pagination.
+
+        due_from and due_to are ISO dates and leave out tasks without a
+        deadline. Returns (tasks, next_cursor); next_cursor is None on the
+        last page.
+        """
+        conditions = []
+        params = []
+        if due_from is not None:
+            conditions.append('t.deadline >= ?')
+            params.append(due_from)
+        if due_to is not None:
+            conditions.append('t.deadline <= ?')
+            params.append(due_to)
+        if priorities:
+            conditions.append(f"t.priority IN ({', '.join('?' * len(priorities))})")
+            params.extend(priorities)
+        if status is not None:
+            conditions.append('t.status = ?')
+            params.append(status)
+        if email_id is not None:
+            conditions.append('t.email_id = ?')
+            params.append(email_id)
+        if cursor:
+            cursor_deadline, cursor_id = self.decode_cursor(cursor)
+            if cursor_deadline is None:
+                conditions.append('(t.deadline IS NULL AND t.id > ?)')
+                params.append(cursor_id)
+            else:
+                conditions.append('((t.deadline, t.id) > (?, ?) OR t.deadline IS NULL)')
+                params.extend([cursor_deadline, cursor_id])
+        
+        # A deadline range has no undated tasks, so the deadline index can give the order
+        dated_only = due_from is not None or due_to is not None
+        query = '''
+            SELECT t.id, t.email_id, t.task, t.deadline, t.deadline_text, t.priority, t.status,
+                   e.subject AS email_subject, e.sender AS email_sender
+            FROM tasks t
+            LEFT JOIN emails e ON e.id = t.email_id
+        '''
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY t.deadline, t.id' if dated_only else ' ORDER BY t.deadline IS NULL, t.deadline, t.id'
+        query += ' LIMIT ?'
+        params.append(limit + 1)
+        
+        conn = self.connect()
+        rows = conn.execute(query, params).fetchall()
+        tasks = [dict(row) for row in rows[:limit]]
+        
+        next_cursor = None
+        if len(rows) > limit:
+            last = tasks[-1]
+            next_cursor = self.encode_cursor(last['deadline'], last['id'])
+        
+        return tasks, next_cursor
+    
+    @metrics.timed('db')
+    def update_task_status(self, task_id, status):
+        #Set a task's status; returns whether the task exists
+        conn = self.connect()
+        with conn:
+            cursor = conn.execute('UPDATE tasks SET status = ? WHERE id = ?', (status, task_id))
+        return cursor.rowcount > 0
+    
+    @staticmethod
+    def encode_cursor(date, email_id):
+        payload = json.dumps([date, email_id]).encode('utf-8')
+        return base64.urlsafe_b64encode(payload).decode('ascii')
+    
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            date, email_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return date, email_id
+        except Exception:
+            raise ValueError("Invalid cursor")
+    
+    @metrics.timed('db')
+    def search_emails(self, query, limit=20, offset=0, match_any=False):
+        """Full-text search over sender, subject, body and summary, best match first.
+
+        Returns (results, has_more). By default every term must match; with
+        match_any=True any term is enough, which suits free-form questions.
+        """
+        fts_query = self.build_fts_query(query, match_any)
+        if not fts_query:
+            return [], False
+        
+        conn = self.connect()
+        rows = conn.execute('''
+            SELECT e.id, e.sender, e.subject, e.date, e.category, e.summary, e.is_processed,
+                   snippet(emails_fts, -1, '[', ']', '...', 16) AS snippet,
+                   bm25(emails_fts, 2.0, 3.0, 1.0, 1.5) AS score
+            FROM emails_fts
+            JOIN emails e ON e.rowid = emails_fts.rowid
+            WHERE emails_fts MATCH ?
+            ORDER BY score
+            LIMIT ? OFFSET ?
+        ''', (fts_query, limit + 1, offset)).fetchall()
+        
+        results = [dict(row) for row in rows[:limit]]
+        return results, len(rows) > limit
+    
+    @staticmethod
+    def build_fts_query(query, match_any=False):
+        #Turn free text into a safe FTS5 query by quoting each term
+        terms = re.findall(r'\w+', query or '')
+        if not terms:
+            return ''
+        quoted = ['"' + term + '"' for term in terms]
+        return (' OR ' if match_any else ' ').join(quoted)
+    
+    @metrics.timed('db')
+    def count_emails(self):
+        #Read from the maintained aggregates rather than counting rows
+        conn = self.connect()
+        row = conn.execute("SELECT value FROM inbox_stats WHERE metric = 'emails' AND key = ''").fetchone()
+        return row[0] if row else 0
+    
+    # Email columns stored as JSON text
+    JSON_FIELDS = ['actions', 'prompt_versions', 'headers', 'fingerprints']
+    
+    @classmethod
+    def decode_json_fields(cls, email):
+        #Parse JSON columns of an email row in place
+        for field in cls.JSON_FIELDS:
+            if email.get(field):
+                try:
+                    email[field] = json.loads(email[field])
+                except:
+                    email[field] = {}
+        return email
+    
+    @metrics.timed('db')
+    def get_email(self, email_id):
+        #Get specific email by ID
+        conn = self.connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT * FROM emails WHERE id = ?', (email_id,))
+        email = cursor.fetchone()
+        
+        if email:
+            email_dict = dict(email)
+            with metrics.timer('json', 'decode_email_rows'):
+                self.decode_json_fields(email_dict)
+            return email_dict
+        
+        return None
+    
+    @metrics.timed('db')
+    def get_email_ids(self):
+        #Get ids of all emails
+        conn = self.connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT id FROM emails ORDER BY date DESC')
+        return [row[0] for row in cursor.fetchall()]
+    
+    @metrics.timed('db')
+    def get_unprocessed_email_ids(self):
+        #Get ids of emails that have not been processed yet
+        conn = self.connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT id FROM emails WHERE NOT is_processed ORDER BY date DESC')
+        email_ids = [row[0] for row in cursor.fetchall()]
+        
+        return email_ids
+    
+    @metrics.timed('db')
+    def update_email_processing(self, email_id, processing_results):
+        """Update email with processing results.
+
+        Only the result fields present in processing_results are written, and
+        prompt_versions/fingerprints are merged key by key, so re-running one
+        sub-task leaves the other results and their provenance alone.
+        """
+        assignments = []
+        params = []
+        for field in ['category', 'category_source', 'actions', 'summary']:
+            if field in processing_results:
+                value = processing_results[field]
+                assignments.append(f'{field} = ?')
+                params.append(json.dumps(value) if field == 'actions' else value)
+        for field in ['prompt_versions', 'fingerprints']:
+            if processing_results.get(field):
+                assignments.append(f"{field} = json_patch(COALESCE({field}, '{{}}'), ?)")
+                params.append(json.dumps(processing_results[field]))
+        assignments.append('is_processed = TRUE')
+        
+        conn = self.connect()
+        with conn:
+            cursor = conn.cursor()
+        
+            cursor.execute(f'''
+                UPDATE emails 
+                SET {', '.join(assignments)}
+                WHERE id = ?
+            ''', params + [email_id])
+            
+            if 'actions' in processing_results:
+                row = cursor.execute('SELECT date FROM emails WHERE id = ?', (email_id,)).fetchone()
+                if row:
+                    self.replace_tasks(cursor, email_id, processing_results['actions'], row['date'])
+    
+    @metrics.timed('db')
+    def save_clean_body(self, email_id, body, clean_body, version):
+        #Cache the preprocessed body used in prompts, unless the stored body has changed since
+        conn = self.connect()
+        with conn:
+            conn.execute('UPDATE emails SET clean_body = ?, clean_version = ? WHERE id = ? AND body IS ?',
+                         (clean_body, version, email_id, body))
+    
+    @metrics.timed('db')
+    def get_preprocess_stats(self):
+        #Size of the cached clean bodies against the originals (tokens estimated at ~4 characters each)
+        conn = self.connect()
+        row = conn.execute('''
+            SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0), COALESCE(SUM(LENGTH(clean_body)), 0)
+            FROM emails WHERE clean_body IS NOT NULL
+        ''').fetchone()
+        emails, chars_before, chars_after = row[0], row[1], row[2]
+        
+        return {
+            'emails': emails,
+            'chars_before': chars_before,
+            'chars_after': chars_after,
+            'chars_saved': chars_before - chars_after,
+            'tokens_saved': (chars_before - chars_after) // 4,
+            'saved_ratio': (chars_before - chars_after) / chars_before if chars_before else 0.0
+        }
+    
+    @metrics.timed('db')
+    def get_prompts(self):
+        #Get all prompt templates
+        conn = self.connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT * FROM prompts')
+        prompts = {row['name']: dict(row) for row in cursor.fetchall()}
+        
+        return prompts
+    
+    @metrics.timed('db')
+    def update_prompt(self, name, content):
+        #Update a prompt template
+        conn = self.connect()
+        with conn:
+            cursor = conn.cursor()
+        
+            cursor.execute('''
+                UPDATE prompts 
+                SET content = ?, updated_at = ?, version = version + 1
+                WHERE name = ?
+            ''', (content, datetime.now().isoformat(), name))
+        
+        # Responses generated from the old template are no longer valid
+        self.llm_cache.invalidate_prompt(name)
+        if name in self.PROCESSING_PROMPTS:
+            self.llm_cache.invalidate_prompt('fused')
+        if name == 'categorization':
+            self.llm_cache.invalidate_prompt('categorization_packed')
+    
+    @metrics.timed('db')
+    def get_table_version(self, name):
+        #Get the change counter for a table
+        conn = self.connect()
+        row = conn.execute('SELECT version FROM table_versions WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0
+    
+    @metrics.timed('db')
+    def get_table_validator(self, name):
+        #(version, unix time of the last change) for a table, for conditional requests
+        conn = self.connect()
+        row = conn.execute('SELECT version, changed_at FROM table_versions WHERE name = ?', (name,)).fetchone()
+        return (row['version'], row['changed_at']) if row else (0, None)
+    
+    @metrics.timed('db')
+    def get_email_version(self, email_id):
+        #Sequence number of an email's latest change, or None if it was never logged
+        conn = self.connect()
+        row = conn.execute('SELECT seq FROM email_changes WHERE email_id = ?', (email_id,)).fetchone()
+        return row[0] if row else None
+    
+    @staticmethod
+    def bump_table_version(cursor, name):
+        #Increment a table's change counter as part of the caller's transaction
+        cursor.execute('''
+            INSERT INTO table_versions (name, version, changed_at) VALUES (?, 1, CAST(strftime('%s', 'now') AS INTEGER))
+            ON CONFLICT (name) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at
+        ''', (name,))
+    
+    @metrics.timed('db')
+    def save_draft(self, draft_data):
+        #Save email draft
+        import uuid
+        
+        conn = self.connect()
+        with conn:
+            cursor = conn.cursor()
+        
+            draft_id = str(uuid.uuid4())
+        
+            cursor.execute('''
+                INSERT INTO drafts (id, subject, body, to_email, in_reply_to, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (
+                draft_id,
+                draft_data['subject'],
+                draft_data['body'],
+                draft_data['to'],
+                draft_data.get('in_reply_to'),
+                datetime.now().isoformat()
+            ))
+
+        return draft_id
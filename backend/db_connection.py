@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import threading
+import weakref
+from config import Config
+
+#Every manager, so a thread can release all of its connections when its work is done
+MANAGERS = weakref.WeakSet()
+
+
+class ConnectionManager:
+    """Thread-local SQLite connections that are opened once and reused"""
+
+    def __init__(self, db_path, pragmas=None, timeout=30.0, cached_statements=256):
+        self.db_path = db_path
+        self.timeout = timeout
+        # sqlite3 keeps an LRU of compiled statements per connection, so reusing
+        # connections also reuses prepared statements for the same SQL text
+        self.cached_statements = cached_statements
+        self.pragmas = pragmas if pragmas is not None else default_pragmas()
+        self.local = threading.local()
+        # Owning thread -> connection, so close_all can reach every thread's
+        # connection and connections of threads that have exited get closed
+        self.connections = {}
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        MANAGERS.add(self)
+
+    def connect(self):
+        #Get the calling thread's connection, opening it on first use
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            return conn
+
+        # A server running each request on a new thread leaves one connection per
+        # exited thread; reclaim them whenever a new thread connects
+        self.close_finished()
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+
+        self.local.conn = conn
+        with self.lock:
+            self.connections[threading.current_thread()] = conn
+        return conn
+
+    def close(self):
+        #Close the calling thread's connection
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            return
+        self.local.conn = None
+        with self.lock:
+            if self.connections.get(threading.current_thread()) is conn:
+                del self.connections[threading.current_thread()]
+        conn.close()
+
+    def close_finished(self):
+        #Close the connections of threads that have exited, which nothing else can reach
+        with self.lock:
+            finished = [thread for thread in self.connections if not thread.is_alive()]
+            connections = [self.connections.pop(thread) for thread in finished]
+        for conn in connections:
+            conn.close()
+
+    def close_all(self):
+        #Close every connection opened through this manager
+        with self.lock:
+            connections, self.connections = list(self.connections.values()), {}
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
+        self.local = threading.local()
+
+
+def close_thread_connections():
+    """Close the calling thread's connection in every manager.
+
+    For threads that are about to exit, such as pool workers and the job
+    worker, so their connections don't wait for close_finished. Don't call it
+    per request or job: the thread's next query would reopen the database and
+    set up its pragmas again.
+    """
+    for manager in list(MANAGERS):
+        manager.close()
+
+
+def close_finished_connections():
+    #Close the connections of exited threads in every manager, e.g. once a thread pool has shut down
+    for manager in list(MANAGERS):
+        manager.close_finished()
+
+
+def default_pragmas():
+    return {
+        # WAL lets readers proceed while a writer (e.g. a batch job) commits
+        'journal_mode': 'WAL',
+        'synchronous': Config.SQLITE_SYNCHRONOUS,
+        'cache_size': Config.SQLITE_CACHE_SIZE,
+        'mmap_size': Config.SQLITE_MMAP_SIZE,
+        'temp_store': 'MEMORY',
+        # INSERT OR REPLACE only fires delete triggers (which keep the search
+        # index in sync) when recursive triggers are enabled
+        'recursive_triggers': 'ON',
+        'foreign_keys': 'ON'
+    }
@@ -1,122 +1,782 @@
-import os
-import json
-from openai import OpenAI
-from database import Database
-
-class EmailProcessor:
-    def __init__(self):
-        self.db = Database()
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY', 'your-api-key'))
-        self.model = "gpt-3.5-turbo"
-    
-    def call_llm(self, prompt, system_message=None):
-        try:
-            messages = []
-            if system_message:
-                messages.append({"role": "system", "content": system_message})
-            messages.append({"role": "user", "content": prompt})
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.3
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"LLM Error: {e}")
-            return f"Error processing request: {str(e)}"
-    
-    def process_email(self, email, process_type='all'):
-        prompts = self.db.get_prompts()
-        results = {}
-        
-        if process_type in ['all', 'categorize']:
-            # Categorize email
-            categorization_prompt = prompts['categorization']['content']
-            prompt = f"{categorization_prompt}\n\nEmail Content:\nFrom: {email['from']}\nSubject: {email['subject']}\nBody: {email['body']}"
-            category = self.call_llm(prompt, "You are an email categorization assistant.")
-            results['category'] = category
-        
-        if process_type in ['all', 'actions']:
-            # Extract action items
-            action_prompt = prompts['action_extraction']['content']
-            prompt = f"{action_prompt}\n\nEmail Content:\n{email['body']}"
-            actions = self.call_llm(prompt, "You are an action item extraction assistant.")
-            try:
-                results['actions'] = json.loads(actions)
-            except:
-                results['actions'] = {"tasks": []}
-        
-        if process_type in ['all', 'summary']:
-            # Generate summary
-            summary_prompt = prompts.get('summary', {}).get('content', 'Summarize this email concisely:')
-            prompt = f"{summary_prompt}\n\nEmail: {email['body']}"
-            summary = self.call_llm(prompt, "You are an email summarization assistant.")
-            results['summary'] = summary
-        
-        return results
-    
-    def chat_about_email(self, email, query):
-        context = f"""
-        Email Details:
-        From: {email['from']}
-        Subject: {email['subject']}
-        Date: {email['date']}
-        Body: {email['body']}
-        
-        Processing Results:
-        Category: {email.get('category', 'Not categorized')}
-        Actions: {json.dumps(email.get('actions', {}), indent=2)}
-        Summary: {email.get('summary', 'Not summarized')}
-        """
-        
-        prompt = f"Context:\n{context}\n\nUser Question: {query}"
-        return self.call_llm(prompt, "You are an email productivity assistant. Help the user understand and manage their emails.")
-    
-    def chat_about_inbox(self, emails, query):
-        inbox_context = f"Total emails: {len(emails)}\n\n"
-        
-        for i, email in enumerate(emails[:10]):  # Limit context
-            inbox_context += f"{i+1}. From: {email['from']}, Subject: {email['subject']}, Category: {email.get('category', 'Unknown')}\n"
-        
-        prompt = f"Inbox Overview:\n{inbox_context}\n\nUser Question: {query}"
-        return self.call_llm(prompt, "You are an inbox management assistant. Help the user understand and manage their entire email inbox.")
-    
-    def generate_draft(self, original_email=None, instructions=""):
-        prompts = self.db.get_prompts()
-        draft_prompt = prompts['auto_reply']['content']
-        
-        if original_email:
-            context = f"""
-            Original Email:
-            From: {original_email['from']}
-            Subject: {original_email['subject']}
-            Body: {original_email['body']}
-            
-            Additional Instructions: {instructions}
-            """
-            prompt = f"{draft_prompt}\n\n{context}"
-        else:
-            prompt = f"{draft_prompt}\n\nNew Email Instructions: {instructions}"
-        
-        draft = self.call_llm(prompt, "You are an email drafting assistant. Create professional email drafts.")
-        
-        # Parse the draft to extract subject and body
-        lines = draft.split('\n')
-        subject = "Draft Email"
-        body = draft
-        
-        for i, line in enumerate(lines):
-            if line.lower().startswith('subject:'):
-                subject = line.replace('Subject:', '').strip()
-                body = '\n'.join(lines[i+1:])
-                break
-        
-        return {
-            "subject": subject,
-            "body": body.strip(),
-            "to": original_email['from'] if original_email else "",
-            "in_reply_to": original_email['id'] if original_email else None
-
-        }
-
+import os
+import json
+import asyncio
+import hashlib
+import time
+import threading
+from contextlib import contextmanager
+from openai import AsyncOpenAI, OpenAI
+from database import Database
+from prompt_registry import PromptRegistry
+from conversations import ConversationThreader
+from pre_classifier import PreClassifier
+from near_duplicates import NearDuplicateIndex
+from preprocess import PREPROCESS_VERSION, clean_body, savings, truncate
+from rate_limiter import LLMError, LLMScheduler
+from tokens import estimate_tokens
+from config import Config
+from metrics import metrics
+
+
+def email_sender(email):
+    # Emails from the mock file use 'from', rows from the database use 'sender'
+    return email.get('from') or email.get('sender', '')
+
+
+class EmailProcessor:
+    # Processing sub-task -> result field it produces
+    PROCESS_TASKS = {
+        'categorize': 'category',
+        'actions': 'actions',
+        'summary': 'summary'
+    }
+    
+    # Processing sub-task -> prompt template it uses
+    TASK_PROMPTS = {
+        'categorize': 'categorization',
+        'actions': 'action_extraction',
+        'summary': 'summary'
+    }
+    
+    # Cache namespace for fused requests, which depend on all three processing templates
+    FUSED_PROMPT_NAME = 'fused'
+    
+    # Cache namespace for requests that categorize several emails at once
+    PACKED_PROMPT_NAME = 'categorization_packed'
+    
+    DRAFT_SYSTEM_MESSAGE = "You are an email drafting assistant. Create professional email drafts."
+    EMAIL_CHAT_SYSTEM_MESSAGE = "You are an email productivity assistant. Help the user understand and manage their emails."
+    INBOX_CHAT_SYSTEM_MESSAGE = "You are an inbox management assistant. Help the user understand and manage their entire email inbox."
+    
+    # Messages per request when (re)building a thread summary
+    THREAD_SUMMARY_CHUNK = 20
+    
+    def __init__(self):
+        self.db = Database()
+        # Retries are handled by the scheduler, which knows about the rate limits
+        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY', 'your-api-key'), max_retries=0)
+        # Used by the ASGI server's routes, so waiting on the model does not hold a thread
+        self.async_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY', 'your-api-key'), max_retries=0)
+        self.model = "gpt-3.5-turbo"
+        self.temperature = 0.3
+        self.cache = self.db.llm_cache
+        self.prompt_registry = PromptRegistry(self.db)
+        self.threads = ConversationThreader(self.db, subject_window_days=Config.THREAD_SUBJECT_WINDOW_DAYS)
+        self.pre_classifier = PreClassifier(
+            self.db,
+            threshold=Config.PRECLASSIFIER_THRESHOLD,
+            min_accuracy=Config.PRECLASSIFIER_MIN_ACCURACY
+        )
+        self.near_duplicates = NearDuplicateIndex(
+            self.db,
+            max_distance=Config.NEAR_DUPLICATE_MAX_DISTANCE,
+            min_words=Config.NEAR_DUPLICATE_MIN_WORDS
+        )
+        # This process's share of the API key's limits
+        self.scheduler = LLMScheduler(
+            requests_per_minute=Config.LLM_REQUESTS_PER_MINUTE / Config.LLM_PROCESSES,
+            tokens_per_minute=Config.LLM_TOKENS_PER_MINUTE / Config.LLM_PROCESSES,
+            max_retries=Config.LLM_MAX_RETRIES
+        )
+        # Completion size assumed when budgeting tokens before a request
+        self.max_output_tokens = 256
+        self.max_body_tokens = Config.PREPROCESS_MAX_TOKENS or None
+        self.local = threading.local()
+    
+    def build_messages(self, prompt, system_message=None):
+        messages = []
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    def call_llm(self, prompt, system_message=None, prompt_name=None, use_cache=True):
+        messages = self.build_messages(prompt, system_message)
+        
+        if use_cache:
+            cache_key = self.cache.make_key(self.model, system_message, prompt, self.temperature)
+            cached = self.cache.get(cache_key)
+            metrics.record_cache_lookup(prompt_name, cached is not None)
+            if cached is not None:
+                return cached
+        
+        estimated_tokens = sum(estimate_tokens(message['content']) for message in messages) + self.max_output_tokens
+        
+        def request():
+            return self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature
+            )
+        
+        try:
+            with metrics.timer('llm', prompt_name or 'other'):
+                response = self.scheduler.run(request, estimated_tokens, self.current_priority())
+        except Exception as e:
+            print(f"LLM Error: {e}")
+            metrics.record_error('llm', e)
+            metrics.record_llm(prompt_name, 'error')
+            # Raised rather than returned so error text never ends up stored as a result
+            raise LLMError(str(e)) from e
+        
+        content = response.choices[0].message.content
+        usage = getattr(response, 'usage', None)
+        self.scheduler.record_usage(estimated_tokens, getattr(usage, 'total_tokens', None))
+        self.record_usage(prompt_name, messages, content, usage)
+        
+        if use_cache:
+            self.cache.set(cache_key, content, prompt_name=prompt_name, model=self.model)
+        return content
+    
+    async def acall_llm(self, prompt, system_message=None, prompt_name=None, use_cache=True):
+        """call_llm() for coroutines, using the async client; cache lookups run in a worker thread"""
+        messages = self.build_messages(prompt, system_message)
+        
+        if use_cache:
+            cache_key = self.cache.make_key(self.model, system_message, prompt, self.temperature)
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            metrics.record_cache_lookup(prompt_name, cached is not None)
+            if cached is not None:
+                return cached
+        
+        estimated_tokens = sum(estimate_tokens(message['content']) for message in messages) + self.max_output_tokens
+        
+        async def request():
+            return await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature
+            )
+        
+        # Not a timer block: other coroutines run on this thread while it waits
+        started = time.perf_counter()
+        try:
+            response = await self.scheduler.arun(request, estimated_tokens, 'interactive')
+        except Exception as e:
+            print(f"LLM Error: {e}")
+            metrics.record_error('llm', e)
+            metrics.record_llm(prompt_name, 'error')
+            raise LLMError(str(e)) from e
+        finally:
+            metrics.observe_stage('llm', prompt_name or 'other', time.perf_counter() - started)
+        
+        content = response.choices[0].message.content
+        usage = getattr(response, 'usage', None)
+        self.scheduler.record_usage(estimated_tokens, getattr(usage, 'total_tokens', None))
+        self.record_usage(prompt_name, messages, content, usage)
+        
+        if use_cache:
+            await asyncio.to_thread(self.cache.set, cache_key, content, prompt_name=prompt_name, model=self.model)
+        return content
+    
+    def record_usage(self, prompt_name, messages, content, usage=None):
+        #Count tokens and cost, estimating them when the API did not report usage (e.g. streams)
+        prompt_tokens = getattr(usage, 'prompt_tokens', None)
+        if prompt_tokens is None:
+            prompt_tokens = sum(estimate_tokens(message['content']) for message in messages)
+        completion_tokens = getattr(usage, 'completion_tokens', None)
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens(content)
+        cost = (prompt_tokens * Config.LLM_PROMPT_PRICE_PER_1K + completion_tokens * Config.LLM_COMPLETION_PRICE_PER_1K) / 1000
+        metrics.record_llm(prompt_name, 'ok', prompt_tokens, completion_tokens, cost)
+    
+    def current_priority(self):
+        return getattr(self.local, 'priority', 'interactive')
+    
+    @contextmanager
+    def priority(self, level):
+        """Run LLM calls made by this thread at the given scheduler priority"""
+        previous = self.current_priority()
+        self.local.priority = level
+        try:
+            yield
+        finally:
+            self.local.priority = previous
+    
+    def stream_llm(self, prompt, system_message=None, prompt_name=None, use_cache=True):
+        """Yield the completion in chunks as the model produces them.
+
+        Closing the generator (e.g. when the HTTP client disconnects) closes
+        the upstream stream, so the model stops generating.
+        """
+        messages = self.build_messages(prompt, system_message)
+        
+        if use_cache:
+            cache_key = self.cache.make_key(self.model, system_message, prompt, self.temperature)
+            cached = self.cache.get(cache_key)
+            metrics.record_cache_lookup(prompt_name, cached is not None)
+            if cached is not None:
+                yield cached
+                return
+        
+        estimated_tokens = sum(estimate_tokens(message['content']) for message in messages) + self.max_output_tokens
+        
+        def request():
+            return self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                stream=True
+            )
+        
+        started = time.perf_counter()
+        try:
+            stream = self.scheduler.run(request, estimated_tokens, self.current_priority())
+        except Exception as e:
+            metrics.record_error('llm', e)
+            metrics.record_llm(prompt_name, 'error')
+            raise LLMError(str(e)) from e
+        chunks = []
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    chunks.append(delta)
+                    yield delta
+        finally:
+            close = getattr(stream, 'close', None)
+            if close:
+                close()
+            # Not a timer block: the generator is suspended between chunks
+            metrics.observe_stage('llm', prompt_name or 'other', time.perf_counter() - started)
+        
+        self.record_usage(prompt_name, messages, ''.join(chunks))
+        if use_cache:
+            self.cache.set(cache_key, ''.join(chunks), prompt_name=prompt_name, model=self.model)
+    
+    async def astream_llm(self, prompt, system_message=None, prompt_name=None, use_cache=True):
+        """stream_llm() as an async generator, using the async client"""
+        messages = self.build_messages(prompt, system_message)
+        
+        if use_cache:
+            cache_key = self.cache.make_key(self.model, system_message, prompt, self.temperature)
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            metrics.record_cache_lookup(prompt_name, cached is not None)
+            if cached is not None:
+                yield cached
+                return
+        
+        estimated_tokens = sum(estimate_tokens(message['content']) for message in messages) + self.max_output_tokens
+        
+        async def request():
+            return await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                stream=True
+            )
+        
+        started = time.perf_counter()
+        try:
+            stream = await self.scheduler.arun(request, estimated_tokens, 'interactive')
+        except Exception as e:
+            metrics.record_error('llm', e)
+            metrics.record_llm(prompt_name, 'error')
+            raise LLMError(str(e)) from e
+        chunks = []
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    chunks.append(delta)
+                    yield delta
+        finally:
+            close = getattr(stream, 'close', None)
+            if close:
+                await close()
+            metrics.observe_stage('llm', prompt_name or 'other', time.perf_counter() - started)
+        
+        self.record_usage(prompt_name, messages, ''.join(chunks))
+        if use_cache:
+            await asyncio.to_thread(self.cache.set, cache_key, ''.join(chunks), prompt_name=prompt_name, model=self.model)
+    
+    def process_email(self, email, process_type='all', prompts=None, fused=False, incremental=False):
+        if prompts is None:
+            prompts = self.prompt_registry.get_prompts()
+        
+        tasks = self.select_tasks(process_type)
+        if incremental:
+            # Only re-run sub-tasks whose inputs changed since their stored result
+            tasks = self.stale_tasks(email, prompts, tasks)
+        
+        # Results copied from an already processed near-duplicate are not requested again
+        results, remaining = self.reuse_duplicate(email, prompts, tasks)
+        
+        if fused and len(remaining) == len(self.PROCESS_TASKS):
+            return self.process_email_fused(email, prompts)
+        
+        for task in remaining:
+            if task == 'categorize':
+                decision = self.pre_classify(email, prompts)
+                if decision:
+                    results['category'], results['category_source'] = decision
+                    continue
+                results['category_source'] = 'llm'
+            results[self.PROCESS_TASKS[task]] = self.run_task(email, task, prompts)
+        
+        results.update(self.provenance(email, prompts, tasks))
+        return results
+    
+    def reuse_duplicate(self, email, prompts, tasks):
+        """Copy results from the closest processed near-duplicate; returns (results, tasks still to run).
+
+        Only emails from the same sender are considered: a similar body from
+        someone else (a forwarded or templated message) can need a different
+        category. Categories are reused for any match within the index's distance.
+        Actions and summaries can mention details such as dates and amounts,
+        so they are only reused from matches within NEAR_DUPLICATE_FULL_REUSE_DISTANCE.
+        Results made with another template version are never reused.
+        """
+        if not Config.NEAR_DUPLICATE_REUSE or not tasks:
+            return {}, tasks
+        
+        for source_id, distance in self.near_duplicates.find_similar(email, limit=3, same_sender=True):
+            source = self.db.get_email(source_id)
+            if not source:
+                continue
+            # Emails processed before template versions were recorded used version 1
+            versions = source.get('prompt_versions') or {}
+            results = {}
+            for task in tasks:
+                field = self.PROCESS_TASKS[task]
+                template = self.TASK_PROMPTS[task]
+                if source.get(field) in (None, ''):
+                    continue
+                if task != 'categorize' and distance > Config.NEAR_DUPLICATE_FULL_REUSE_DISTANCE:
+                    continue
+                if versions.get(template, 1) != prompts.get(template, {}).get('version'):
+                    continue
+                results[field] = source[field]
+            if results:
+                self.near_duplicates.record_lookup(distance)
+                if 'category' in results:
+                    results['category_source'] = 'duplicate'
+                return results, [task for task in tasks if self.PROCESS_TASKS[task] not in results]
+        
+        self.near_duplicates.record_lookup(None)
+        return {}, tasks
+    
+    def pre_classify(self, email, prompts):
+        """(category, source) from the local pre-classifier, or None when the model has to decide"""
+        decision = self.pre_classifier.classify(email, prompts.get('categorization', {}).get('version'))
+        metrics.preclassifier_decisions.inc(source=decision[1] if decision else 'llm')
+        return decision
+    
+    def train_pre_classifier(self):
+        #Retrain the local pre-classifier on emails labelled with the current categorization prompt
+        prompts = self.prompt_registry.get_prompts()
+        return self.pre_classifier.train(prompts.get('categorization', {}).get('version'))
+    
+    def select_tasks(self, process_type='all'):
+        if process_type == 'all':
+            return list(self.PROCESS_TASKS)
+        if process_type not in self.PROCESS_TASKS:
+            raise ValueError(f"Unknown processing type: {process_type}")
+        return [process_type]
+    
+    def provenance(self, email, prompts, tasks):
+        #Record which template version and inputs produced each result field
+        return {
+            'prompt_versions': {
+                self.TASK_PROMPTS[task]: prompts.get(self.TASK_PROMPTS[task], {}).get('version')
+                for task in tasks
+            },
+            'fingerprints': {
+                self.PROCESS_TASKS[task]: self.task_fingerprint(email, task, prompts)
+                for task in tasks
+            }
+        }
+    
+    def task_fingerprint(self, email, task, prompts):
+        #Hash of everything a sub-task's result depends on: email content, template version and model
+        content = f"{email_sender(email)}\n{email['subject']}\n{email['body']}"
+        template = self.TASK_PROMPTS[task]
+        key = json.dumps([
+            hashlib.sha256(content.encode('utf-8')).hexdigest(),
+            PREPROCESS_VERSION,
+            self.max_body_tokens,
+            template,
+            prompts.get(template, {}).get('version'),
+            self.model
+        ])
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+    
+    def stale_tasks(self, email, prompts, tasks=None):
+        #Sub-tasks whose stored fingerprint no longer matches their current inputs
+        stored = email.get('fingerprints') or {}
+        return [
+            task for task in (tasks or list(self.PROCESS_TASKS))
+            if stored.get(self.PROCESS_TASKS[task]) != self.task_fingerprint(email, task, prompts)
+        ]
+    
+    def prepared_body(self, email):
+        """Email body as sent to the model: quotes, signatures, disclaimers and HTML removed.
+
+        The cleaned text is cached in the emails table (clean_body) and only
+        recomputed when PREPROCESS_VERSION changes.
+        """
+        text = email.get('clean_body')
+        if text is None or email.get('clean_version') != PREPROCESS_VERSION:
+            text = clean_body(email.get('body'))
+            metrics.record_preprocess(savings(email.get('body') or '', text))
+            email['clean_body'] = text
+            email['clean_version'] = PREPROCESS_VERSION
+            if email.get('id'):
+                self.db.save_clean_body(email['id'], email.get('body'), text, PREPROCESS_VERSION)
+        return truncate(text, self.max_body_tokens)
+    
+    def run_task(self, email, task, prompts):
+        #Run a single processing sub-task and return its result
+        if task == 'categorize':
+            return self.categorize_email(email, prompts)
+        if task == 'actions':
+            return self.extract_actions(email, prompts)
+        if task == 'summary':
+            return self.summarize_email(email, prompts)
+        raise ValueError(f"Unknown processing task: {task}")
+    
+    def prompt_prefix(self, prompts, name):
+        #Get the pre-rendered start of a prompt, rendering it if the registry did not
+        prompt = prompts.get(name)
+        if prompt is None:
+            if name == 'summary':
+                return "Summarize this email concisely:\n\nEmail: "
+            raise KeyError(f"Missing prompt template: {name}")
+        if 'prefix' in prompt:
+            return prompt['prefix']
+        return PromptRegistry.PREFIXES.get(name, "{content}\n\n").format(content=prompt['content'])
+    
+    def categorize_email(self, email, prompts):
+        prompt = f"{self.prompt_prefix(prompts, 'categorization')}From: {email_sender(email)}\nSubject: {email['subject']}\nBody: {self.prepared_body(email)}"
+        return self.call_llm(prompt, "You are an email categorization assistant.", prompt_name='categorization')
+    
+    def extract_actions(self, email, prompts):
+        prompt = f"{self.prompt_prefix(prompts, 'action_extraction')}{self.prepared_body(email)}"
+        actions = self.call_llm(prompt, "You are an action item extraction assistant.", prompt_name='action_extraction')
+        try:
+            with metrics.timer('json', 'parse_actions'):
+                return json.loads(actions)
+        except:
+            return {"tasks": []}
+    
+    def summarize_email(self, email, prompts):
+        prompt = f"{self.prompt_prefix(prompts, 'summary')}{self.prepared_body(email)}"
+        return self.call_llm(prompt, "You are an email summarization assistant.", prompt_name='summary')
+    
+    def process_email_fused(self, email, prompts):
+        """Categorize, extract actions and summarize in a single request.
+
+        The three templates are combined into one prompt that asks for a JSON
+        object. Fields missing from or invalid in the reply are re-run with
+        their own per-task call.
+        """
+        prompt = f"""Complete the three tasks below for the same email and respond with a single JSON object of the form {{"category": ..., "actions": ..., "summary": ...}} and nothing else.
+
+### category
+{prompts['categorization']['content']}
+
+### actions
+{prompts['action_extraction']['content']}
+
+### summary
+{prompts.get('summary', {}).get('content', 'Summarize this email concisely:')}
+
+Email Content:
+From: {email_sender(email)}
+Subject: {email['subject']}
+Body: {self.prepared_body(email)}"""
+        
+        response = self.call_llm(prompt, "You are an email processing assistant. Respond only with JSON.", prompt_name=self.FUSED_PROMPT_NAME)
+        with metrics.timer('json', 'parse_fused_response'):
+            results = self.parse_fused_response(response)
+        
+        for task, field in self.PROCESS_TASKS.items():
+            if field not in results:
+                results[field] = self.run_task(email, task, prompts)
+        results['category_source'] = 'llm'
+        
+        results.update(self.provenance(email, prompts, list(self.PROCESS_TASKS)))
+        return results
+    
+    @staticmethod
+    def parse_fused_response(response):
+        #Parse a fused reply, keeping only the fields that pass validation
+        start = response.find('{')
+        end = response.rfind('}')
+        if start == -1 or end <= start:
+            return {}
+        try:
+            data = json.loads(response[start:end + 1])
+        except ValueError:
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        
+        results = {}
+        
+        category = EmailProcessor.clean_category(data.get('category'))
+        if category:
+            results['category'] = category
+        
+        actions = data.get('actions')
+        if isinstance(actions, list):
+            actions = {"tasks": actions}
+        if (isinstance(actions, dict) and isinstance(actions.get('tasks'), list)
+                and all(isinstance(task, dict) and isinstance(task.get('task'), str) for task in actions['tasks'])):
+            results['actions'] = actions
+        
+        summary = data.get('summary')
+        if isinstance(summary, list) and all(isinstance(line, str) for line in summary):
+            summary = '\n'.join(f"- {line}" for line in summary)
+        if isinstance(summary, str) and summary.strip():
+            results['summary'] = summary.strip()
+        
+        return results
+    
+    @staticmethod
+    def clean_category(value):
+        #A category name from a JSON reply, or None if it is not a plausible one
+        if isinstance(value, str) and value.strip() and len(value) <= 50:
+            return value.strip()
+        return None
+    
+    def packed_entry(self, email):
+        #An email as it appears in a packed categorization prompt
+        return f"From: {email_sender(email)}\nSubject: {email['subject']}\nBody: {self.prepared_body(email)}"
+    
+    def categorize_packed(self, emails, prompts):
+        """Categorize several emails in one request; returns {email_id: category}.
+
+        The emails are numbered 1..N in the prompt and the reply's numbers are
+        mapped back to ids, so the model never has to copy real ids. Emails
+        missing from the reply or given an invalid category are left out for
+        the caller to retry.
+        """
+        labels = {str(number): email for number, email in enumerate(emails, 1)}
+        sections = '\n\n'.join(f"### Email {label}\n{self.packed_entry(email)}" for label, email in labels.items())
+        prompt = f"""{prompts['categorization']['content']}
+
+Categorize each of the {len(emails)} emails below. Respond with a JSON object mapping each email's number to its category name, for example {{"1": "Newsletter", "2": "Important"}}, and nothing else.
+
+{sections}"""
+        
+        # Not cached: a pack retried with the same emails has the same prompt and needs a fresh reply
+        response = self.call_llm(
+            prompt,
+            "You are an email categorization assistant. Respond only with JSON.",
+            prompt_name=self.PACKED_PROMPT_NAME,
+            use_cache=False
+        )
+        with metrics.timer('json', 'parse_packed_response'):
+            categories = self.parse_packed_response(response, list(labels))
+        
+        metrics.packed_categorizations.inc(len(categories), result='categorized')
+        metrics.packed_categorizations.inc(len(emails) - len(categories), result='missing')
+        return {labels[label]['id']: category for label, category in categories.items()}
+    
+    @staticmethod
+    def parse_packed_response(response, labels):
+        """Parse a packed reply into {label: category}.
+
+        Unknown labels and invalid categories are dropped, and so is a label
+        given two different categories, since either could be another email's.
+        """
+        start = response.find('{')
+        end = response.rfind('}')
+        if start == -1 or end <= start:
+            return {}
+        try:
+            # Objects as lists of pairs, so repeated keys are not silently collapsed
+            data = json.loads(response[start:end + 1], object_pairs_hook=tuple)
+        except ValueError:
+            return {}
+        if not isinstance(data, tuple):
+            return {}
+        
+        known = set(labels)
+        results = {}
+        conflicting = set()
+        for key, value in data:
+            # Accept "Email 3" or "#3" for "3"
+            label = ''.join(character for character in str(key) if character.isdigit())
+            category = EmailProcessor.clean_category(value)
+            if label not in known or not category:
+                continue
+            if results.get(label, category) != category:
+                conflicting.add(label)
+            results[label] = category
+        return {label: category for label, category in results.items() if label not in conflicting}
+    
+    def summarize_thread(self, thread_id, prompts=None):
+        """Summarize a conversation, sending each message only once.
+
+        The summary is stored with the ids of the messages it covers. Later
+        calls send just the new messages, with quoted text stripped, together
+        with the previous summary. Long threads are folded in chunks.
+        """
+        thread = self.threads.get_thread(thread_id)
+        if thread is None:
+            return None
+        if prompts is None:
+            prompts = self.prompt_registry.get_prompts()
+        version = prompts.get('summary', {}).get('version')
+        
+        summary = None
+        covered = set()
+        if thread['summary'] and thread['summary_version'] == version:
+            summary = thread['summary']
+            covered = set((thread['summary_email_ids'] or '').split())
+        
+        emails = self.threads.get_thread_emails(thread_id)
+        new_emails = [email for email in emails if email['id'] not in covered]
+        if not new_emails:
+            return summary
+        
+        instructions = prompts.get('summary', {}).get('content', 'Summarize this email concisely:')
+        for start in range(0, len(new_emails), self.THREAD_SUMMARY_CHUNK):
+            chunk = new_emails[start:start + self.THREAD_SUMMARY_CHUNK]
+            messages = '\n\n'.join(
+                f"From: {email['sender']}\nDate: {email['date']}\n{self.prepared_body(email)}"
+                for email in chunk
+            )
+            if summary:
+                prompt = f"{instructions}\n\nThis is an ongoing conversation. Summary so far:\n{summary}\n\nNew messages:\n{messages}\n\nUpdated summary of the whole conversation:"
+            else:
+                prompt = f"{instructions}\n\nConversation (oldest first):\n{messages}"
+            summary = self.call_llm(prompt, "You are an email summarization assistant.", prompt_name='summary')
+            covered.update(email['id'] for email in chunk)
+        
+        self.threads.save_summary(thread_id, summary, sorted(covered), version)
+        return summary
+    
+    def thread_context(self, email):
+        #Summary of the earlier conversation an email belongs to, or None for a standalone email
+        thread_id = email.get('thread_id')
+        if not thread_id:
+            return None
+        thread = self.threads.get_thread(thread_id)
+        if not thread or thread['message_count'] < 2:
+            return None
+        return self.summarize_thread(thread_id)
+    
+    def chat_about_email(self, email, query, stream=False):
+        llm = self.stream_llm if stream else self.call_llm
+        return llm(self.build_email_chat_prompt(email, query), self.EMAIL_CHAT_SYSTEM_MESSAGE, prompt_name='chat_email')
+    
+    def build_email_chat_prompt(self, email, query):
+        context = f"""
+        Email Details:
+        From: {email_sender(email)}
+        Subject: {email['subject']}
+        Date: {email['date']}
+        Body: {self.prepared_body(email)}
+        
+        Processing Results:
+        Category: {email.get('category', 'Not categorized')}
+        Actions: {json.dumps(email.get('actions', {}), indent=2)}
+        Summary: {email.get('summary', 'Not summarized')}
+        """
+        
+        return f"Context:\n{context}\n\nUser Question: {query}"
+    
+    def chat_about_inbox(self, emails, query, total=None, stream=False, stats=None):
+        llm = self.stream_llm if stream else self.call_llm
+        return llm(self.build_inbox_chat_prompt(emails, query, total, stats), self.INBOX_CHAT_SYSTEM_MESSAGE, prompt_name='chat_inbox')
+    
+    @staticmethod
+    def format_inbox_stats(stats):
+        #Inbox-wide counts for the chat context, so questions about totals do not depend on which emails were retrieved
+        def counts(values):
+            return ', '.join(f"{name} {count}" for name, count in sorted(values.items(), key=lambda item: -item[1])) or 'none'
+        
+        lines = [
+            f"Total emails: {stats['emails']} ({stats['processed']} processed, {stats['unprocessed']} unprocessed)",
+            f"Emails by category: {counts(stats['categories'])}; uncategorized {stats['uncategorized']}",
+            f"Tasks by status: {counts(stats['tasks']['by_status'])}",
+            f"Open tasks by priority: {counts(stats['tasks']['open_by_priority'])}",
+            "Top senders: " + (', '.join(f"{sender['sender']} ({sender['count']})" for sender in stats['top_senders']) or 'none')
+        ]
+        return '\n'.join(lines) + '\n'
+    
+    def build_inbox_chat_prompt(self, emails, query, total=None, stats=None):
+        if stats:
+            inbox_context = self.format_inbox_stats(stats)
+        else:
+            inbox_context = f"Total emails: {total if total is not None else len(emails)}\n"
+        inbox_context += f"Most relevant emails for this question: {len(emails)}\n\n"
+        
+        for i, email in enumerate(emails):
+            inbox_context += f"{i+1}. From: {email_sender(email)}, Subject: {email['subject']}, Date: {email.get('date', 'Unknown')}, Category: {email.get('category') or 'Unknown'}\n"
+            if email.get('summary'):
+                inbox_context += f"   Summary: {email['summary']}\n"
+            elif email.get('excerpt'):
+                inbox_context += f"   Excerpt: {email['excerpt']}\n"
+        
+        return f"Inbox Overview:\n{inbox_context}\n\nUser Question: {query}"
+    
+    def generate_draft(self, original_email=None, instructions=""):
+        draft = self.call_llm(
+            self.build_draft_prompt(original_email, instructions),
+            self.DRAFT_SYSTEM_MESSAGE,
+            prompt_name='auto_reply',
+            use_cache=False  # Regenerating a draft should give a fresh one
+        )
+        return self.parse_draft(draft, original_email)
+    
+    def stream_draft(self, original_email=None, instructions=""):
+        #Yield the raw draft text as it is generated; parse it with parse_draft once complete
+        return self.stream_llm(
+            self.build_draft_prompt(original_email, instructions),
+            self.DRAFT_SYSTEM_MESSAGE,
+            prompt_name='auto_reply',
+            use_cache=False
+        )
+    
+    def build_draft_prompt(self, original_email=None, instructions=""):
+        prompts = self.prompt_registry.get_prompts()
+        draft_prefix = self.prompt_prefix(prompts, 'auto_reply')
+        
+        if original_email:
+            # In a conversation, the thread summary stands in for the earlier messages
+            conversation = self.thread_context(original_email)
+            body = self.prepared_body(original_email)
+            context = f"""
+            Original Email:
+            From: {email_sender(original_email)}
+            Subject: {original_email['subject']}
+            Body: {body}
+            
+            Additional Instructions: {instructions}
+            """
+            if conversation:
+                context = f"""
+            Conversation So Far (summary):
+            {conversation}
+            """ + context
+            return f"{draft_prefix}{context}"
+        return f"{draft_prefix}New Email Instructions: {instructions}"
+    
+    def parse_draft(self, draft, original_email=None):
+        # Parse the draft to extract subject and body
+        lines = draft.split('\n')
+        subject = "Draft Email"
+        body = draft
+        
+        for i, line in enumerate(lines):
+            if line.lower().startswith('subject:'):
+                subject = line.replace('Subject:', '').strip()
+                body = '\n'.join(lines[i+1:])
+                break
+        
+        return {
+            "subject": subject,
+            "body": body.strip(),
+            "to": email_sender(original_email) if original_email else "",
+            "in_reply_to": original_email['id'] if original_email else None
+
+        }
+
@@ -0,0 +1,69 @@
+"""Conditional GET and compression for JSON responses.
+
+Read endpoints tag their responses with an ETag built from a table version
+counter, so a client that sends the tag back in If-None-Match gets a 304
+before the endpoint reads any rows. Compressed responses get the encoding
+appended to their ETag, since a strong tag names one exact byte sequence.
+"""
+import gzip
+from flask import Response
+from werkzeug.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = ['br', 'gzip'] if brotli else ['gzip']
+
+
+def not_modified(request, etag, last_modified=None):
+    """A 304 response if the client's copy is current, else None.
+
+    If-None-Match takes precedence over If-Modified-Since, whose one second
+    resolution can miss changes made within the same second.
+    """
+    if request.if_none_match:
+        for tag in [etag] + [f"{etag}-{encoding}" for encoding in ENCODINGS]:
+            if request.if_none_match.contains_weak(tag):
+                return validated(Response(status=304), tag, last_modified)
+        return None
+    if last_modified is not None and request.if_modified_since is not None:
+        if last_modified <= request.if_modified_since.timestamp():
+            return validated(Response(status=304), etag, last_modified)
+    return None
+
+
+def validated(response, etag, last_modified=None):
+    #Attach validators; clients must revalidate before reusing the response
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def compress(request, response, min_size=1024, level=6):
+    """Compress a JSON response in place when it is large enough and the client accepts it"""
+    if (min_size <= 0 or response.status_code != 200 or response.direct_passthrough
+            or response.is_streamed or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if not encoding:
+        return response
+    body = response.get_data()
+    if len(body) < min_size:
+        return response
+
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=level))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=level))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak=weak)
+    return response
@@ -0,0 +1,227 @@
+import argparse
+import hashlib
+import json
+import re
+from datetime import datetime
+from email import policy
+from email.parser import BytesParser
+from email.utils import parsedate_to_datetime
+
+# Headers kept (as JSON) for later classification and threading
+KEPT_HEADERS = ['List-Unsubscribe', 'List-Id', 'Precedence', 'Auto-Submitted']
+
+MBOX_ESCAPED_FROM = re.compile(rb'^>(>*From )')
+
+
+def iter_mbox(path, max_message_bytes=1024 * 1024):
+    """Yield raw messages from an mbox file without loading the whole file.
+
+    Messages larger than max_message_bytes are truncated: the rest of the
+    message is skipped up to the next "From " separator, so memory stays
+    bounded by the largest allowed message.
+    """
+    with open(path, 'rb') as f:
+        lines = []
+        size = 0
+        previous_blank = True
+        for line in f:
+            if line.startswith(b'From ') and previous_blank:
+                if lines:
+                    yield b''.join(lines)
+                lines = []
+                size = 0
+                previous_blank = False
+                continue
+
+            previous_blank = line in (b'\n', b'\r\n')
+            if size >= max_message_bytes:
+                continue
+            # mboxrd escaping: ">From " in a body is stored as ">>From "
+            line = MBOX_ESCAPED_FROM.sub(rb'\1', line)[:max_message_bytes - size]
+            lines.append(line)
+            size += len(line)
+
+        if lines:
+            yield b''.join(lines)
+
+
+def parse_message(raw, max_body_chars=200000):
+    #Parse a raw RFC 822 message into an email record
+    message = BytesParser(policy=policy.default).parsebytes(raw)
+
+    message_id = (str(message.get('Message-ID', '')).strip().strip('<>') or None)
+    record = {
+        'id': message_id or hashlib.sha1(raw).hexdigest(),
+        'message_id': message_id,
+        'from': str(message.get('From', '')),
+        'subject': str(message.get('Subject', '')),
+        'date': normalize_date(message.get('Date')),
+        'body': extract_body(message)[:max_body_chars],
+        'in_reply_to': (str(message.get('In-Reply-To', '')).strip() or None),
+        'references': (' '.join(str(message.get('References', '')).split()) or None),
+        'headers': {name: str(message[name]) for name in KEPT_HEADERS if message[name] is not None}
+    }
+    return record
+
+
+def extract_body(message):
+    #Prefer the plain-text part; fall back to HTML
+    try:
+        part = message.get_body(preferencelist=('plain', 'html'))
+        if part is None:
+            return ''
+        return part.get_content()
+    except (KeyError, LookupError, ValueError):
+        # Unknown charset or malformed MIME: decode what we can
+        payload = message.get_payload(decode=True) if not message.is_multipart() else None
+        return payload.decode('utf-8', errors='replace') if payload else ''
+
+
+def normalize_date(value):
+    #Store dates as 'YYYY-MM-DD HH:MM:SS' so they sort as text, like the mock data
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(str(value)).strftime('%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_mbox_records(path, max_message_bytes=1024 * 1024):
+    for raw in iter_mbox(path, max_message_bytes):
+        try:
+            yield parse_message(raw)
+        except Exception as e:
+            print(f"Skipping unparseable message: {e}")
+
+
+def iter_jsonl_records(path):
+    """Yield records from a JSON-lines file shaped like mock_inbox.json entries"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                email = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping malformed line {number}: {e}")
+                continue
+            if not isinstance(email, dict):
+                print(f"Skipping line {number}: not a JSON object")
+                continue
+            message_id = (email.get('message_id') or '').strip('<>') or None
+            yield {
+                'id': str(email.get('id') or message_id or hashlib.sha1(line.encode('utf-8')).hexdigest()),
+                'message_id': message_id,
+                'from': email.get('from') or email.get('sender', ''),
+                'subject': email.get('subject', ''),
+                'date': email.get('date'),
+                'body': email.get('body', ''),
+                'in_reply_to': email.get('in_reply_to'),
+                'references': email.get('references'),
+                'headers': email.get('headers') or {}
+            }
+
+
+def detect_format(path):
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'mbox'
+
+
+def iter_records(path, file_format=None):
+    file_format = file_format or detect_format(path)
+    if file_format == 'mbox':
+        return iter_mbox_records(path)
+    if file_format == 'jsonl':
+        return iter_jsonl_records(path)
+    raise ValueError(f"Unsupported import format: {file_format}")
+
+
+class Ingester:
+    """Write email records to the database in large executemany batches"""
+
+    def __init__(self, db, batch_size=5000, threader=None, near_duplicates=None):
+        self.db = db
+        self.batch_size = batch_size
+        # ConversationThreader; new emails are threaded after every batch
+        self.threader = threader
+        # NearDuplicateIndex; new emails are hashed after every batch
+        self.near_duplicates = near_duplicates
+
+    def ingest(self, records, progress=None):
+        """Insert records, skipping ones already stored (same id or Message-ID).
+
+        progress, if given, is called with a stats dict after every batch.
+        """
+        stats = {'read': 0, 'inserted': 0, 'duplicates': 0}
+        batch = []
+        for record in records:
+            batch.append(record)
+            stats['read'] += 1
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch, stats)
+                batch = []
+                if progress:
+                    progress(dict(stats))
+
+        if batch:
+            self.write_batch(batch, stats)
+        if progress:
+            progress(dict(stats))
+        return stats
+
+    def write_batch(self, batch, stats):
+        now = datetime.now().isoformat()
+        rows = [(
+            record['id'],
+            record['message_id'],
+            record['from'],
+            record['subject'],
+            record['body'],
+            record['date'],
+            record['in_reply_to'],
+            record['references'],
+            json.dumps(record['headers']) if record['headers'] else None,
+            now
+        ) for record in batch]
+
+        conn = self.db.connect()
+        with conn:
+            cursor = conn.executemany('''
+                INSERT OR IGNORE INTO emails
+                    (id, message_id, sender, subject, body, date, in_reply_to, references_ids, headers, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            # rowcount counts rows the INSERT itself wrote, not trigger side effects
+            inserted = cursor.rowcount
+
+        stats['inserted'] += inserted
+        stats['duplicates'] += len(batch) - inserted
+        if self.threader and inserted:
+            self.threader.assign_unthreaded()
+        if self.near_duplicates and inserted:
+            self.near_duplicates.index_unindexed()
+
+
+if __name__ == '__main__':
+    from database import Database
+    from conversations import ConversationThreader
+    from near_duplicates import NearDuplicateIndex
+
+    parser = argparse.ArgumentParser(description='Import a mailbox export (mbox or JSON lines)')
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=['mbox', 'jsonl'], default=None)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    def report(stats):
+        print(f"read {stats['read']}, inserted {stats['inserted']}, duplicates {stats['duplicates']}", flush=True)
+
+    db = Database()
+    ingester = Ingester(
+        db,
+        batch_size=args.batch_size,
+        threader=ConversationThreader(db),
+        near_duplicates=NearDuplicateIndex(db)
+    )
+    ingester.ingest(iter_records(args.path, args.format), progress=report)
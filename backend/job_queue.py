@@ -0,0 +1,166 @@
+import json
+import random
+import time
+import uuid
+from datetime import datetime
+
+
+class PermanentJobError(Exception):
+    """Raised by a job handler when retrying cannot help, e.g. the email no longer exists"""
+
+
+class JobQueue:
+    """Durable job queue stored in the SQLite database.
+
+    Jobs are claimed inside an IMMEDIATE transaction, so several worker
+    processes can poll the same table without picking up the same job.
+    Failed jobs are retried with exponential backoff until max_attempts,
+    unless the failure is permanent.
+    """
+
+    def __init__(self, db, max_attempts=5, base_delay=2.0, max_delay=300.0, lock_timeout=600.0):
+        self.db = db
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # A running job whose worker has been silent this long is handed out again
+        self.lock_timeout = lock_timeout
+        self.init_db()
+
+    def init_db(self):
+        #Initialize jobs table
+        conn = self.db.connect()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT,
+                    payload TEXT,
+                    status TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    max_attempts INTEGER,
+                    run_after REAL,
+                    locked_by TEXT,
+                    locked_at REAL,
+                    result TEXT,
+                    error TEXT,
+                    created_at TEXT,
+                    updated_at TEXT
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs (status, run_after)')
+        self.db.ensure_column('jobs', 'progress', 'TEXT')
+
+    def enqueue(self, kind, payload):
+        #Add a job and return its id
+        job_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
+
+        conn = self.db.connect()
+        with conn:
+            conn.execute('''
+                INSERT INTO jobs (id, kind, payload, status, attempts, max_attempts, run_after, created_at, updated_at)
+                VALUES (?, ?, ?, 'queued', 0, ?, ?, ?, ?)
+            ''', (job_id, kind, json.dumps(payload), self.max_attempts, time.time(), now, now))
+        return job_id
+
+    def claim(self, worker_id):
+        #Atomically take the next runnable job, or return None
+        now = time.time()
+        conn = self.db.connect()
+
+        # Idle polls only read, so they don't compete with API writers for the write lock
+        runnable = conn.execute('''
+            SELECT 1 FROM jobs
+            WHERE (status = 'queued' AND run_after <= ?) OR (status = 'running' AND locked_at < ?)
+            LIMIT 1
+        ''', (now, now - self.lock_timeout)).fetchone()
+        if runnable is None:
+            return None
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # A job whose worker went silent on its last attempt is not handed out again
+            conn.execute('''
+                UPDATE jobs
+                SET status = 'failed', error = ?, locked_by = NULL, locked_at = NULL, updated_at = ?
+                WHERE status = 'running' AND locked_at < ? AND attempts >= max_attempts
+            ''', (f"Worker lost: no progress for {self.lock_timeout:g} seconds",
+                  datetime.now().isoformat(), now - self.lock_timeout))
+
+            row = conn.execute('''
+                SELECT id FROM jobs
+                WHERE (status = 'queued' AND run_after <= ?)
+                   OR (status = 'running' AND locked_at < ? AND attempts < max_attempts)
+                ORDER BY run_after
+                LIMIT 1
+            ''', (now, now - self.lock_timeout)).fetchone()
+
+            if row is None:
+                conn.commit()
+                return None
+
+            conn.execute('''
+                UPDATE jobs
+                SET status = 'running', attempts = attempts + 1, locked_by = ?, locked_at = ?, updated_at = ?
+                WHERE id = ?
+            ''', (worker_id, now, datetime.now().isoformat(), row['id']))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        return self.get_job(row['id'])
+
+    def complete(self, job_id, result):
+        #Mark a job as done and store its result
+        conn = self.db.connect()
+        with conn:
+            conn.execute('''
+                UPDATE jobs
+                SET status = 'completed', result = ?, error = NULL, locked_by = NULL, locked_at = NULL, updated_at = ?
+                WHERE id = ?
+            ''', (json.dumps(result), datetime.now().isoformat(), job_id))
+
+    def fail(self, job_id, error, retry=True):
+        #Record a failure and schedule a retry, or give up after max_attempts or if retry is False
+        job = self.get_job(job_id)
+        if job is None:
+            return
+
+        if not retry or job['attempts'] >= job['max_attempts']:
+            status = 'failed'
+            run_after = job['run_after']
+        else:
+            status = 'queued'
+            delay = min(self.max_delay, self.base_delay * 2 ** (job['attempts'] - 1))
+            # Jitter spreads out retries from jobs that failed together
+            run_after = time.time() + delay * random.uniform(0.5, 1.0)
+
+        conn = self.db.connect()
+        with conn:
+            conn.execute('''
+                UPDATE jobs
+                SET status = ?, error = ?, run_after = ?, locked_by = NULL, locked_at = NULL, updated_at = ?
+                WHERE id = ?
+            ''', (status, error, run_after, datetime.now().isoformat(), job_id))
+
+    def update_progress(self, job_id, progress):
+        #Store progress details for a running job
+        conn = self.db.connect()
+        with conn:
+            conn.execute('UPDATE jobs SET progress = ?, locked_at = ?, updated_at = ? WHERE id = ?',
+                         (json.dumps(progress), time.time(), datetime.now().isoformat(), job_id))
+
+    def get_job(self, job_id):
+        #Get a job by ID
+        conn = self.db.connect()
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job['payload'] = json.loads(job['payload']) if job['payload'] else None
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['progress'] = json.loads(job['progress']) if job.get('progress') else None
+        return job
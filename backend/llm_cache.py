@@ -0,0 +1,172 @@
+import hashlib
+import json
+import threading
+import time
+from config import Config
+from db_connection import ConnectionManager
+
+
+class LLMCache:
+    """Persistent, content-addressed cache of LLM responses"""
+
+    # Run eviction once every this many writes instead of on every insert
+    EVICT_EVERY = 100
+    # Hits note their access time in memory so reads stay read-only; the times are
+    # written with the next set(), or in one batch once this many keys are waiting
+    ACCESS_FLUSH_EVERY = 100
+
+    def __init__(self, db_path=None, max_entries=None, max_age_seconds=None):
+        self.db_path = db_path or Config.LLM_CACHE_PATH
+        self.max_entries = max_entries if max_entries is not None else Config.LLM_CACHE_MAX_ENTRIES
+        self.max_age_seconds = max_age_seconds if max_age_seconds is not None else Config.LLM_CACHE_MAX_AGE
+        self.hits = 0
+        self.misses = 0
+        self.writes_since_evict = 0
+        # key -> time of its latest hit not yet written to last_accessed
+        self.accessed = {}
+        self.lock = threading.Lock()
+        self.connections = ConnectionManager(self.db_path)
+        self.init_db()
+
+    def connect(self):
+        #Get a pooled connection for the calling thread
+        return self.connections.connect()
+
+    def close(self):
+        #Write pending access times and close all pooled connections
+        self.flush_access_times()
+        self.connections.close_all()
+
+    def init_db(self):
+        #Initialize cache table
+        conn = self.connect()
+        with conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT,
+                    prompt_name TEXT,
+                    model TEXT,
+                    created_at REAL,
+                    last_accessed REAL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_prompt ON llm_cache (prompt_name)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (last_accessed)')
+
+    @staticmethod
+    def make_key(model, system_message, prompt, temperature):
+        #Hash everything that determines the model's answer
+        payload = json.dumps([model, system_message, prompt, temperature], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        #Get a cached response, or None on a miss
+        now = time.time()
+        conn = self.connect()
+        row = conn.execute('SELECT response, created_at FROM llm_cache WHERE key = ?', (key,)).fetchone()
+        if row and self.max_age_seconds and now - row[1] > self.max_age_seconds:
+            # Expired: evict() deletes it, or the response stored after this miss replaces it
+            row = None
+
+        with self.lock:
+            if row:
+                self.hits += 1
+                self.accessed[key] = now
+                flush = len(self.accessed) >= self.ACCESS_FLUSH_EVERY
+            else:
+                self.misses += 1
+                flush = False
+        if flush:
+            self.flush_access_times()
+        return row[0] if row else None
+
+    def take_access_times(self):
+        #Pending (last_accessed, key) updates, which the caller must write
+        with self.lock:
+            accessed, self.accessed = self.accessed, {}
+        return [(accessed_at, key) for key, accessed_at in accessed.items()]
+
+    def flush_access_times(self):
+        #Write the access times of recent hits in one transaction
+        updates = self.take_access_times()
+        if not updates:
+            return
+        conn = self.connect()
+        with conn:
+            conn.executemany('UPDATE llm_cache SET last_accessed = ? WHERE key = ?', updates)
+
+    def set(self, key, response, prompt_name=None, model=None):
+        #Store a response
+        now = time.time()
+        conn = self.connect()
+        with conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                INSERT OR REPLACE INTO llm_cache (key, response, prompt_name, model, created_at, last_accessed)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (key, response, prompt_name, model, now, now))
+            # Already writing, so record recent hits in the same transaction
+            cursor.executemany('UPDATE llm_cache SET last_accessed = ? WHERE key = ?', self.take_access_times())
+
+        with self.lock:
+            self.writes_since_evict += 1
+            should_evict = self.writes_since_evict >= self.EVICT_EVERY
+            if should_evict:
+                self.writes_since_evict = 0
+        if should_evict:
+            self.evict()
+
+    def invalidate_prompt(self, prompt_name):
+        #Drop every response produced from a prompt template
+        conn = self.connect()
+        with conn:
+            cursor = conn.cursor()
+
+            cursor.execute('DELETE FROM llm_cache WHERE prompt_name = ?', (prompt_name,))
+            removed = cursor.rowcount
+        return removed
+
+    def evict(self):
+        #Remove expired entries, then the least recently used beyond max_entries
+        self.flush_access_times()
+        conn = self.connect()
+        with conn:
+            cursor = conn.cursor()
+
+            if self.max_age_seconds:
+                cursor.execute('DELETE FROM llm_cache WHERE created_at < ?', (time.time() - self.max_age_seconds,))
+
+            if self.max_entries:
+                cursor.execute('''
+                    DELETE FROM llm_cache WHERE key IN (
+                        SELECT key FROM llm_cache ORDER BY last_accessed DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (self.max_entries,))
+
+    def clear(self):
+        #Remove all cached responses
+        conn = self.connect()
+        with conn:
+            conn.execute('DELETE FROM llm_cache')
+
+    def stats(self):
+        #Get hit/miss counters and current size
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM llm_cache')
+        entries = cursor.fetchone()[0]
+
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'max_age_seconds': self.max_age_seconds
+            }
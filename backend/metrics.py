@@ -0,0 +1,237 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Seconds; spans a cached SQLite lookup (~50us) up to a slow model call
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self.lock:
+            return self.values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, rendered in Prometheus format"""
+
+    def __init__(self, name, description, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        self.observe_key(tuple(str(labels.get(name, '')) for name in self.labelnames), value)
+
+    def observe_key(self, key, value):
+        #observe() with the label values already in labelnames order
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self.lock:
+            series = self.series.get(key)
+            return series[2] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += bucket_count
+                    labels = format_labels(self.labelnames + ('le',), key + (f"{bound:g}" if bound != '+Inf' else bound,))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total:.6f}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Metrics:
+    """Process-wide instrumentation for routes, database calls and LLM requests.
+
+    Every observation is a dictionary update under a lock (a few microseconds),
+    so it stays enabled in production. Stage timings are also summed per
+    thread between begin_request() and end_request(), for the Server-Timing
+    header.
+    """
+
+    def __init__(self):
+        self.request_seconds = Histogram(
+            'email_agent_http_request_seconds', 'HTTP request latency by route', ['method', 'route', 'status']
+        )
+        self.stage_seconds = Histogram(
+            'email_agent_stage_seconds', 'Time spent per stage (db, json, llm) and operation', ['stage', 'operation']
+        )
+        self.llm_requests = Counter(
+            'email_agent_llm_requests_total', 'LLM requests by prompt type and outcome', ['prompt', 'outcome']
+        )
+        self.llm_tokens = Counter(
+            'email_agent_llm_tokens_total', 'LLM tokens by prompt type and direction', ['prompt', 'type']
+        )
+        self.llm_cost = Counter(
+            'email_agent_llm_cost_usd_total', 'Estimated LLM spend in USD by prompt type', ['prompt']
+        )
+        self.cache_lookups = Counter(
+            'email_agent_llm_cache_lookups_total', 'LLM response cache lookups by prompt type', ['prompt', 'result']
+        )
+        self.preprocess_bytes = Counter(
+            'email_agent_preprocess_bytes_total', 'Email body bytes before and after preprocessing', ['stage']
+        )
+        self.preprocess_tokens = Counter(
+            'email_agent_preprocess_tokens_total', 'Estimated email body tokens before and after preprocessing', ['stage']
+        )
+        self.preclassifier_decisions = Counter(
+            'email_agent_preclassifier_decisions_total', 'Categorizations by who decided (rules, model or llm)', ['source']
+        )
+        self.near_duplicate_lookups = Counter(
+            'email_agent_near_duplicate_lookups_total', 'Near-duplicate lookups before processing by result', ['result']
+        )
+        self.packed_categorizations = Counter(
+            'email_agent_packed_categorizations_total', 'Emails sent in packed categorization requests by result', ['result']
+        )
+        self.errors = Counter(
+            'email_agent_errors_total', 'Errors by where they happened and exception type', ['source', 'kind']
+        )
+        self.local = threading.local()
+
+    def observe_stage(self, stage, operation, seconds):
+        self.stage_seconds.observe_key((stage, operation), seconds)
+        timings = getattr(self.local, 'timings', None)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def stack(self):
+        #Per-thread stack of time spent in nested timers
+        try:
+            return self.local.stack
+        except AttributeError:
+            self.local.stack = []
+            return self.local.stack
+
+    @contextmanager
+    def timer(self, stage, operation):
+        #Time a block; time spent in nested timers is subtracted, so stages do not overlap
+        stack = self.stack()
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.observe_stage(stage, operation, elapsed - nested)
+
+    def timed(self, stage, operation=None):
+        """Decorator recording each call's duration under stage/operation"""
+        def decorator(fn):
+            name = operation or fn.__name__
+
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                # Same as `with self.timer(...)`, inlined since this wraps every database call
+                stack = self.stack()
+                stack.append(0.0)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    nested = stack.pop()
+                    if stack:
+                        stack[-1] += elapsed
+                    self.observe_stage(stage, name, elapsed - nested)
+            return wrapper
+        return decorator
+
+    def begin_request(self):
+        self.local.timings = {}
+        self.local.started = time.perf_counter()
+
+    def end_request(self, method, route, status):
+        #Record the request and return (total seconds, per-stage seconds)
+        timings = getattr(self.local, 'timings', None) or {}
+        total = time.perf_counter() - getattr(self.local, 'started', time.perf_counter())
+        self.local.timings = None
+        self.request_seconds.observe(total, method=method, route=route, status=status)
+        return total, timings
+
+    def record_llm(self, prompt, outcome, prompt_tokens=0, completion_tokens=0, cost=0.0):
+        prompt = prompt or 'other'
+        self.llm_requests.inc(prompt=prompt, outcome=outcome)
+        if prompt_tokens:
+            self.llm_tokens.inc(prompt_tokens, prompt=prompt, type='prompt')
+        if completion_tokens:
+            self.llm_tokens.inc(completion_tokens, prompt=prompt, type='completion')
+        if cost:
+            self.llm_cost.inc(cost, prompt=prompt)
+
+    def record_cache_lookup(self, prompt, hit):
+        self.cache_lookups.inc(prompt=prompt or 'other', result='hit' if hit else 'miss')
+
+    def record_preprocess(self, savings):
+        self.preprocess_bytes.inc(savings['bytes_before'], stage='before')
+        self.preprocess_bytes.inc(savings['bytes_after'], stage='after')
+        self.preprocess_tokens.inc(savings['tokens_before'], stage='before')
+        self.preprocess_tokens.inc(savings['tokens_after'], stage='after')
+
+    def record_error(self, source, error):
+        self.errors.inc(source=source, kind=type(error).__name__)
+
+    def render(self):
+        #Prometheus text exposition format
+        lines = []
+        for metric in (self.request_seconds, self.stage_seconds, self.llm_requests, self.llm_tokens,
+                       self.llm_cost, self.cache_lookups, self.preprocess_bytes, self.preprocess_tokens,
+                       self.preclassifier_decisions, self.near_duplicate_lookups, self.packed_categorizations,
+                       self.errors):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
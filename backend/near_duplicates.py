@@ -0,0 +1,233 @@
+import hashlib
+import re
+import threading
+from preprocess import clean_body
+from metrics import metrics
+
+WORD = re.compile(r'\w+')
+
+BITS = 64
+BANDS = 4
+BAND_BITS = BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def simhash(text, shingle=3, max_words=5000):
+    """64-bit SimHash of a text's word shingles.
+
+    Similar texts get hashes that differ in few bits. Each shingle votes on
+    every bit; the per-bit tallies are taken over the transposed bit strings
+    so the inner loop runs in C.
+    """
+    words = WORD.findall(text.lower())[:max_words]
+    if len(words) < shingle:
+        shingles = [' '.join(words)]
+    else:
+        shingles = {' '.join(words[i:i + shingle]) for i in range(len(words) - shingle + 1)}
+    bit_strings = [
+        format(int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'big'), '064b')
+        for item in shingles
+    ]
+    half = len(bit_strings) / 2
+    value = 0
+    for column in zip(*bit_strings):
+        value = (value << 1) | (column.count('1') > half)
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def to_signed(value):
+    #SQLite integers are signed 64-bit
+    return value - (1 << BITS) if value >= 1 << (BITS - 1) else value
+
+
+def to_unsigned(value):
+    return value + (1 << BITS) if value < 0 else value
+
+
+def bands(value):
+    return [(band, (value >> (band * BAND_BITS)) & BAND_MASK) for band in range(BANDS)]
+
+
+class NearDuplicateIndex:
+    """SimHash index over cleaned email bodies, for reusing processing results.
+
+    Each email's 64-bit hash is split into four 16-bit bands stored in
+    simhash_bands. Two hashes within 3 bits of each other share at least one
+    band exactly, so a lookup is four primary-key range reads followed by a
+    Hamming distance check on the few candidates; it does not scan the inbox.
+    Emails with fewer than min_words words are hashed but not indexed, since
+    short bodies ("Thanks!") match unrelated mail.
+    """
+
+    # Candidates examined per band; buckets of identical newsletters can be large
+    CANDIDATES_PER_BAND = 50
+
+    def __init__(self, db, max_distance=3, min_words=20):
+        self.db = db
+        # Four bands only guarantee to find matches within three bits
+        self.max_distance = max(0, min(max_distance, BANDS - 1))
+        self.min_words = min_words
+        self.stats = {'lookups': 0, 'hits': 0, 'exact_hits': 0}
+        self.lock = threading.Lock()
+        self.init_db()
+
+    def init_db(self):
+        #Initialize index tables
+        self.db.ensure_column('emails', 'simhash', 'INTEGER')
+        conn = self.db.connect()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS simhash_bands (
+                    band INTEGER NOT NULL,
+                    value INTEGER NOT NULL,
+                    email_id TEXT NOT NULL,
+                    PRIMARY KEY (band, value, email_id)
+                ) WITHOUT ROWID
+            ''')
+            # Keeps finding not-yet-indexed emails cheap however large the inbox gets
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_emails_simhash_pending ON emails (id) WHERE simhash IS NULL')
+
+    def compute(self, body):
+        #(hash, indexable) for an email body
+        text = clean_body(body)
+        return simhash(text), len(WORD.findall(text)) >= self.min_words
+
+    def index_unindexed(self, batch_size=1000):
+        """Hash and index every email without a hash yet; returns how many were indexed"""
+        conn = self.db.connect()
+        indexed = 0
+        while True:
+            rows = conn.execute(
+                'SELECT id, body FROM emails WHERE simhash IS NULL LIMIT ?', (batch_size,)
+            ).fetchall()
+            if not rows:
+                return indexed
+            with conn:
+                for row in rows:
+                    self.store(conn, row['id'], *self.compute(row['body']))
+            indexed += len(rows)
+
+    def ensure_indexed(self, email):
+        #The email's hash, computing and storing it if the index has not seen the email yet
+        if email.get('simhash') is not None:
+            return to_unsigned(email['simhash'])
+        value, indexable = self.compute(email.get('body'))
+        if email.get('id'):
+            conn = self.db.connect()
+            with conn:
+                self.store(conn, email['id'], value, indexable)
+        email['simhash'] = to_signed(value)
+        return value
+
+    @staticmethod
+    def store(conn, email_id, value, indexable):
+        conn.execute('UPDATE emails SET simhash = ? WHERE id = ?', (to_signed(value), email_id))
+        if indexable:
+            # Rows of an email replaced since are harmless: lookups check the current hash
+            conn.executemany(
+                'INSERT OR IGNORE INTO simhash_bands (band, value, email_id) VALUES (?, ?, ?)',
+                [(band, band_value, email_id) for band, band_value in bands(value)]
+            )
+
+    def is_indexed(self, email_id, value):
+        #Whether the email is in the band table (bodies below min_words are not)
+        conn = self.db.connect()
+        return conn.execute(
+            'SELECT 1 FROM simhash_bands WHERE band = 0 AND value = ? AND email_id = ?',
+            (value & BAND_MASK, email_id)
+        ).fetchone() is not None
+
+    @metrics.timed('db', 'near_duplicate_lookup')
+    def find_similar(self, email, max_distance=None, processed_only=True, limit=10, same_sender=False):
+        """Closest indexed emails to this one as (email_id, distance), nearest first.
+
+        With same_sender, only emails from exactly the same sender are candidates.
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+        value = self.ensure_indexed(email)
+        conn = self.db.connect()
+        filters = 'AND e.is_processed' if processed_only else ''
+        params = []
+        if same_sender:
+            filters += ' AND e.sender IS ?'
+            params.append(email.get('sender'))
+        matches = {}
+        for band, band_value in bands(value):
+            rows = conn.execute(f'''
+                SELECT e.id, e.simhash FROM simhash_bands b
+                JOIN emails e ON e.id = b.email_id
+                WHERE b.band = ? AND b.value = ? AND b.email_id != ? {filters}
+                LIMIT ?
+            ''', [band, band_value, email.get('id') or ''] + params + [self.CANDIDATES_PER_BAND]).fetchall()
+            for row in rows:
+                if row['simhash'] is None:
+                    continue
+                distance = hamming(value, to_unsigned(row['simhash']))
+                if distance <= max_distance:
+                    matches[row['id']] = distance
+            if any(distance == 0 for distance in matches.values()):
+                break
+        return sorted(matches.items(), key=lambda item: (item[1], item[0]))[:limit]
+
+    def record_lookup(self, distance):
+        with self.lock:
+            self.stats['lookups'] += 1
+            if distance is not None:
+                self.stats['hits'] += 1
+                if distance == 0:
+                    self.stats['exact_hits'] += 1
+        metrics.near_duplicate_lookups.inc(result='miss' if distance is None else 'hit')
+
+    def get_stats(self):
+        #Hit statistics since this process started, and the size of the index
+        conn = self.db.connect()
+        indexed = conn.execute('SELECT COUNT(DISTINCT email_id) FROM simhash_bands WHERE band = 0').fetchone()[0]
+        with self.lock:
+            stats = dict(self.stats)
+        stats.update({
+            'indexed': indexed,
+            'max_distance': self.max_distance,
+            'min_similarity': 1 - self.max_distance / BITS,
+            'min_words': self.min_words,
+            'hit_rate': stats['hits'] / stats['lookups'] if stats['lookups'] else 0.0
+        })
+        return stats
+
+
+class InFlightIndex:
+    """In-memory band index of the emails a batch job is currently sending to the model"""
+
+    def __init__(self):
+        self.buckets = {}
+        self.hashes = {}
+        self.senders = {}
+
+    def add(self, email_id, value, sender=None):
+        self.hashes[email_id] = value
+        self.senders[email_id] = sender
+        for key in bands(value):
+            self.buckets.setdefault(key, set()).add(email_id)
+
+    def remove(self, email_id):
+        value = self.hashes.pop(email_id, None)
+        self.senders.pop(email_id, None)
+        if value is None:
+            return
+        for key in bands(value):
+            bucket = self.buckets.get(key)
+            bucket.discard(email_id)
+            if not bucket:
+                del self.buckets[key]
+
+    def find(self, value, max_distance, sender=None):
+        #Id of an in-flight email from the same sender within max_distance bits, or None
+        for key in bands(value):
+            for email_id in self.buckets.get(key, ()):
+                if self.senders[email_id] == sender and hamming(value, self.hashes[email_id]) <= max_distance:
+                    return email_id
+        return None
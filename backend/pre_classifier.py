@@ -0,0 +1,329 @@
+import json
+import math
+import re
+import threading
+import zlib
+from array import array
+from collections import Counter, defaultdict
+from datetime import datetime
+from email.utils import parseaddr
+
+# Headers that mark bulk or mailing-list mail
+BULK_HEADERS = ('List-Unsubscribe', 'List-Id')
+BULK_PRECEDENCE = ('bulk', 'list', 'junk')
+
+WORD = re.compile(r'[a-z0-9]{2,20}')
+
+
+def sender_address(email):
+    return parseaddr(email.get('from') or email.get('sender') or '')[1].lower()
+
+
+def is_bulk(email):
+    headers = email.get('headers') or {}
+    if not isinstance(headers, dict):
+        return False
+    if any(name in headers for name in BULK_HEADERS):
+        return True
+    return str(headers.get('Precedence', '')).strip().lower() in BULK_PRECEDENCE
+
+
+def extract_features(email, body_chars=2000):
+    #Tokens describing an email: sender, bulk headers, subject and body words
+    address = sender_address(email)
+    local, _, domain = address.rpartition('@')
+    features = [f"from:{address}", f"domain:{domain}", f"local:{local}"]
+    if is_bulk(email):
+        features.append('header:bulk')
+    features.extend(f"s:{word}" for word in WORD.findall((email.get('subject') or '').lower()))
+    features.extend(f"b:{word}" for word in WORD.findall((email.get('body') or '')[:body_chars].lower()))
+    return features
+
+
+def is_held_out(email_id, share=5):
+    #Deterministic 1-in-`share` split, so evaluation does not depend on row order
+    return zlib.crc32(str(email_id).encode('utf-8')) % share == 0
+
+
+class NaiveBayes:
+    """Multinomial naive Bayes over hashed features"""
+
+    def __init__(self, categories, dimensions=2 ** 16):
+        self.categories = list(categories)
+        self.dimensions = dimensions
+        self.counts = [array('f', bytes(4 * dimensions)) for _ in self.categories]
+        self.documents = [0] * len(self.categories)
+        self.log_priors = None
+        self.log_likelihoods = None
+
+    def bucket(self, feature):
+        return zlib.crc32(feature.encode('utf-8')) % self.dimensions
+
+    def add(self, features, category):
+        index = self.categories.index(category)
+        counts = self.counts[index]
+        for feature in features:
+            counts[self.bucket(feature)] += 1
+        self.documents[index] += 1
+
+    def finish(self, alpha=1.0):
+        #Turn counts into smoothed log probabilities
+        total_documents = sum(self.documents)
+        self.log_priors = [math.log((count + 1) / (total_documents + len(self.categories))) for count in self.documents]
+        self.log_likelihoods = []
+        for counts in self.counts:
+            denominator = math.log(sum(counts) + alpha * self.dimensions)
+            self.log_likelihoods.append(array('f', (math.log(count + alpha) - denominator for count in counts)))
+        self.counts = None
+
+    def predict(self, features):
+        #(category, posterior probability)
+        buckets = [self.bucket(feature) for feature in features]
+        scores = [
+            prior + sum(likelihoods[bucket] for bucket in buckets)
+            for prior, likelihoods in zip(self.log_priors, self.log_likelihoods)
+        ]
+        best = max(range(len(scores)), key=scores.__getitem__)
+        total = sum(math.exp(score - scores[best]) for score in scores)
+        return self.categories[best], 1.0 / total
+
+    def to_blob(self):
+        flat = array('f', self.log_priors)
+        for likelihoods in self.log_likelihoods:
+            flat.extend(likelihoods)
+        return flat.tobytes()
+
+    @classmethod
+    def from_blob(cls, categories, dimensions, blob):
+        model = cls(categories, dimensions)
+        model.counts = None
+        flat = array('f')
+        flat.frombytes(blob)
+        count = len(model.categories)
+        model.log_priors = list(flat[:count])
+        model.log_likelihoods = [
+            flat[count + i * dimensions:count + (i + 1) * dimensions] for i in range(count)
+        ]
+        return model
+
+
+class PreClassifier:
+    """Local first tier for categorization, learned from LLM-labelled emails.
+
+    Training derives sender-domain and bulk-header rules (kept only when their
+    labels agree with the LLM at least min_accuracy of the time) and a naive
+    Bayes model. Held-out emails (1 in 5, by id) measure how often the local
+    answer matches the LLM label; the classifier only answers on its own when
+    that accuracy clears min_accuracy and, for the model, when its confidence
+    clears threshold. A model is tied to the categorization prompt version it
+    was trained for and is ignored once the prompt changes.
+    """
+
+    MIN_RULE_SUPPORT = 20
+    MIN_CATEGORY_EXAMPLES = 5
+    MIN_HELD_OUT = 20
+
+    def __init__(self, db, threshold=0.95, min_accuracy=0.95):
+        self.db = db
+        self.threshold = threshold
+        self.min_accuracy = min_accuracy
+        self.version = None
+        self.model = None
+        self.lock = threading.Lock()
+        self.init_db()
+
+    def init_db(self):
+        #Initialize model store
+        conn = self.db.connect()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS classifier_models (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    prompt_version INTEGER,
+                    categories TEXT,
+                    dimensions INTEGER,
+                    rules TEXT,
+                    weights BLOB,
+                    report TEXT,
+                    enabled BOOLEAN,
+                    created_at TEXT
+                )
+            ''')
+            conn.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('classifier_models', 0)")
+
+    def classify(self, email, prompt_version):
+        """(category, source) when the local tier is confident, else None"""
+        model = self.get_model()
+        if model is None or not model['enabled'] or model['prompt_version'] != prompt_version:
+            return None
+
+        domain = sender_address(email).rpartition('@')[2]
+        if domain in model['rules']['domains']:
+            return model['rules']['domains'][domain], 'rules'
+        if model['rules'].get('bulk') and is_bulk(email):
+            return model['rules']['bulk'], 'rules'
+
+        category, confidence = model['bayes'].predict(extract_features(email))
+        if confidence >= self.threshold:
+            return category, 'model'
+        return None
+
+    def get_model(self):
+        #Latest trained model, reloaded only when a new one has been saved
+        version = self.db.get_table_version('classifier_models')
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.model = self.load_latest()
+                    self.version = version
+        return self.model
+
+    def load_latest(self):
+        conn = self.db.connect()
+        row = conn.execute('SELECT * FROM classifier_models ORDER BY id DESC LIMIT 1').fetchone()
+        if row is None:
+            return None
+        categories = json.loads(row['categories'])
+        return {
+            'id': row['id'],
+            'prompt_version': row['prompt_version'],
+            'enabled': bool(row['enabled']),
+            'rules': json.loads(row['rules']),
+            'report': json.loads(row['report']),
+            'bayes': NaiveBayes.from_blob(categories, row['dimensions'], row['weights'])
+        }
+
+    def get_report(self):
+        model = self.get_model()
+        if model is None:
+            return None
+        report = dict(model['report'])
+        report.update({'id': model['id'], 'enabled': model['enabled'], 'prompt_version': model['prompt_version']})
+        return report
+
+    def training_rows(self, prompt_version):
+        #LLM-labelled emails produced with the current categorization prompt
+        conn = self.db.connect()
+        version_filter = "json_extract(prompt_versions, '$.categorization') = ?"
+        if prompt_version == 1:
+            # Emails processed before template versions were recorded used version 1
+            version_filter = f"(prompt_versions IS NULL OR {version_filter})"
+        return conn.execute(f'''
+            SELECT id, sender, subject, SUBSTR(body, 1, 2000) AS body, headers, category
+            FROM emails
+            WHERE category IS NOT NULL AND category != ''
+              AND (category_source IS NULL OR category_source = 'llm')
+              AND {version_filter}
+        ''', (prompt_version,))
+
+    def train(self, prompt_version, dimensions=2 ** 16):
+        """Train on LLM-labelled emails, evaluate on the held-out share and save the model"""
+        train_set = []
+        held_out = []
+        for row in self.training_rows(prompt_version):
+            email = dict(row)
+            try:
+                email['headers'] = json.loads(email['headers']) if email['headers'] else {}
+            except ValueError:
+                email['headers'] = {}
+            email['category'] = email['category'].strip()
+            (held_out if is_held_out(email['id']) else train_set).append(email)
+
+        label_counts = Counter(email['category'] for email in train_set)
+        categories = sorted(label for label, count in label_counts.items() if count >= self.MIN_CATEGORY_EXAMPLES)
+        if not categories:
+            raise ValueError("Not enough LLM-labelled emails to train on")
+
+        bayes = NaiveBayes(categories, dimensions)
+        domains = defaultdict(Counter)
+        bulk = Counter()
+        for email in train_set:
+            if email['category'] in categories:
+                bayes.add(extract_features(email), email['category'])
+            domains[sender_address(email).rpartition('@')[2]][email['category']] += 1
+            if is_bulk(email):
+                bulk[email['category']] += 1
+        bayes.finish()
+
+        rules = {'domains': {}, 'bulk': None}
+        for domain, counts in domains.items():
+            rule = self.confident_majority(counts)
+            if domain and rule in categories:
+                rules['domains'][domain] = rule
+        rule = self.confident_majority(bulk)
+        if rule in categories:
+            rules['bulk'] = rule
+
+        report = self.evaluate(held_out, bayes, rules)
+        report.update({
+            'trained_on': len(train_set),
+            'categories': categories,
+            'domain_rules': len(rules['domains']),
+            'bulk_rule': rules['bulk'],
+            'threshold': self.threshold,
+            'min_accuracy': self.min_accuracy
+        })
+        enabled = (report['held_out'] >= self.MIN_HELD_OUT
+                   and report['answered'] > 0
+                   and report['answered_accuracy'] >= self.min_accuracy)
+
+        conn = self.db.connect()
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO classifier_models
+                    (prompt_version, categories, dimensions, rules, weights, report, enabled, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (prompt_version, json.dumps(categories), dimensions, json.dumps(rules), bayes.to_blob(),
+                  json.dumps(report), enabled, datetime.now().isoformat()))
+            # Keep the latest few models only
+            cursor.execute('DELETE FROM classifier_models WHERE id NOT IN (SELECT id FROM classifier_models ORDER BY id DESC LIMIT 5)')
+            self.db.bump_table_version(cursor, 'classifier_models')
+
+        report['enabled'] = enabled
+        return report
+
+    def confident_majority(self, counts):
+        #Majority label when it has enough support and agrees with the LLM often enough
+        total = sum(counts.values())
+        if total < self.MIN_RULE_SUPPORT:
+            return None
+        label, count = counts.most_common(1)[0]
+        return label if count / total >= self.min_accuracy else None
+
+    def evaluate(self, held_out, bayes, rules):
+        #Compare local answers with the LLM labels of held-out emails
+        answered = 0
+        correct = 0
+        model_correct = 0
+        by_source = defaultdict(lambda: {'answered': 0, 'correct': 0})
+        for email in held_out:
+            predicted, confidence = bayes.predict(extract_features(email))
+            if predicted == email['category']:
+                model_correct += 1
+
+            domain = sender_address(email).rpartition('@')[2]
+            if domain in rules['domains']:
+                decision, source = rules['domains'][domain], 'rules'
+            elif rules['bulk'] and is_bulk(email):
+                decision, source = rules['bulk'], 'rules'
+            elif confidence >= self.threshold:
+                decision, source = predicted, 'model'
+            else:
+                continue
+
+            answered += 1
+            by_source[source]['answered'] += 1
+            if decision == email['category']:
+                correct += 1
+                by_source[source]['correct'] += 1
+
+        total = len(held_out)
+        return {
+            'held_out': total,
+            'model_accuracy': model_correct / total if total else 0.0,
+            'answered': answered,
+            'coverage': answered / total if total else 0.0,
+            'answered_accuracy': correct / answered if answered else 0.0,
+            'by_source': dict(by_source)
+        }
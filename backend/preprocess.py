@@ -0,0 +1,253 @@
+from html.parser import HTMLParser
+from tokens import estimate_tokens
+
+# Bump when the cleaning rules change, so cached clean bodies are recomputed
+PREPROCESS_VERSION = 2
+
+# Lines that start quoted history; everything after them is dropped
+REPLY_MARKERS = (
+    '-----original message-----',
+    '________________________________',
+)
+
+# Lines that start a forwarded message; its header block is dropped, its body kept
+FORWARD_MARKERS = (
+    '---------- forwarded message',
+    '----- forwarded message',
+    'begin forwarded message',
+)
+
+HEADER_PREFIXES = ('from:', 'sent:', 'date:', 'to:', 'cc:', 'subject:', 'reply-to:')
+
+# Paragraphs containing any of these are legal or mailing-list boilerplate
+DISCLAIMER_PHRASES = (
+    'confidentiality notice',
+    'this email and any attachments',
+    'this e-mail and any attachments',
+    'intended only for the',
+    'intended solely for the',
+    'if you are not the intended recipient',
+    'this message is confidential',
+    'unsubscribe from this list',
+    'to unsubscribe',
+    'you are receiving this email because',
+    'please consider the environment before printing',
+)
+
+SIGN_OFFS = (
+    'best regards', 'kind regards', 'regards', 'best', 'thanks', 'thank you', 'many thanks',
+    'cheers', 'sincerely', 'warm regards', 'all the best', 'thanks and regards',
+)
+
+MOBILE_SIGNATURES = ('sent from my ', 'get outlook for ', 'sent from mail for ', 'sent from yahoo mail')
+
+# Lines after a sign-off up to this many are treated as a signature block (name, title, phone...)
+MAX_SIGNATURE_LINES = 8
+
+POSTSCRIPTS = ('p.s', 'ps:', 'ps ', 'ps.', 'ps,', 'pps', 'p.p.s')
+
+# Words that make a line after a sign-off part of the message ("the review moved to 3pm Friday")
+# rather than contact details
+TIME_WORDS = {
+    'today', 'tonight', 'tomorrow', 'yesterday', 'morning', 'afternoon', 'evening', 'noon', 'midnight',
+    'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday',
+    'mon', 'tue', 'tues', 'wed', 'weds', 'thu', 'thur', 'thurs', 'fri', 'sat', 'sun',
+    'january', 'february', 'march', 'april', 'june', 'july', 'august', 'september', 'october',
+    'november', 'december', 'jan', 'feb', 'mar', 'apr', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct',
+    'nov', 'dec', 'am', 'pm', 'deadline', 'eod', 'asap', 'week', 'month',
+}
+
+# Longest line examined for markers; longer lines are body text
+MAX_MARKER_LINE = 200
+
+
+class TextExtractor(HTMLParser):
+    """Collect visible text from HTML, skipping scripts, styles and quoted blocks"""
+
+    SKIPPED = {'script', 'style', 'head', 'title', 'blockquote'}
+    BREAKS = {'br', 'p', 'div', 'tr', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'table', 'hr'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        # Tag being skipped and how deeply it is nested inside itself
+        self.skip_tag = None
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self.skip_depth:
+            if tag == self.skip_tag:
+                self.skip_depth += 1
+        elif tag in self.SKIPPED or (tag == 'div' and ('class', 'gmail_quote') in attrs):
+            self.skip_tag = tag
+            self.skip_depth = 1
+        elif tag in self.BREAKS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if self.skip_depth:
+            if tag == self.skip_tag:
+                self.skip_depth -= 1
+        elif tag in self.BREAKS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+    def text(self):
+        return ''.join(self.parts)
+
+
+def looks_like_html(body):
+    head = body[:2000].lower()
+    return '<html' in head or '<body' in head or '<div' in head or '<p>' in head or '<br' in head
+
+
+def html_to_text(body):
+    extractor = TextExtractor()
+    extractor.feed(body)
+    extractor.close()
+    return extractor.text()
+
+
+def is_reply_header(line, next_line):
+    #"On <date>, <name> wrote:" (sometimes wrapped onto a second line)
+    lower = line.lower()
+    if not lower.startswith('on '):
+        return False
+    return lower.rstrip().endswith('wrote:') or next_line.lower().rstrip().endswith('wrote:')
+
+
+def strip_lines(lines):
+    #Drop quoted history, forwarded headers and mobile signatures; one pass over the lines
+    kept = []
+    in_forward_header = False
+    count = len(lines)
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        lower = stripped[:MAX_MARKER_LINE].lower()
+
+        if in_forward_header:
+            if not stripped:
+                in_forward_header = False
+                continue
+            if lower.startswith(HEADER_PREFIXES):
+                continue
+            in_forward_header = False
+
+        if lower.startswith('>'):
+            continue
+        if lower.startswith(REPLY_MARKERS):
+            break
+        if lower.startswith(FORWARD_MARKERS):
+            in_forward_header = True
+            continue
+        next_line = lines[i + 1].strip()[:MAX_MARKER_LINE] if i + 1 < count else ''
+        if len(stripped) <= MAX_MARKER_LINE and is_reply_header(stripped, next_line):
+            break
+        # Outlook-style reply header without a separator line
+        if lower.startswith('from:') and next_line.lower().startswith(('sent:', 'date:')):
+            break
+        if stripped in ('--', '-- ') or line == '-- ':
+            break
+        if lower.startswith(MOBILE_SIGNATURES):
+            continue
+        kept.append(line.rstrip())
+    return kept
+
+
+def mentions_time(line):
+    #Whether a line names a day, date or time of day ("3pm", "10:30", "Friday", "tomorrow")
+    words = ''.join(character if character.isalnum() or character == ':' else ' ' for character in line.lower()).split()
+    for word in words:
+        if word in TIME_WORDS:
+            return True
+        if word.endswith(('am', 'pm')) and word[:-2].replace(':', '').isdigit():
+            return True
+        hours, _, minutes = word.partition(':')
+        if hours.isdigit() and minutes.isdigit() and len(minutes) == 2:
+            return True
+    return False
+
+
+def is_message_text(line):
+    #A line after a sign-off that carries the message on: a postscript, a question, a long line or a time
+    lower = line.strip().lower()
+    return lower.startswith(POSTSCRIPTS) or '?' in line or len(line) > 80 or mentions_time(line)
+
+
+def strip_signature(lines):
+    #Keep a sign-off and the name after it; drop a short trailing signature block
+    for i in range(len(lines) - 1, max(-1, len(lines) - MAX_SIGNATURE_LINES - 3), -1):
+        if lines[i].strip().lower().rstrip(',.!') in SIGN_OFFS:
+            tail = [line for line in lines[i + 1:] if line.strip()]
+            # A signature is a few short lines of contact details; anything else means the message goes on
+            looks_like_signature = not any(is_message_text(line) for line in tail)
+            if any(line.strip() for line in lines[:i]) and len(tail) <= MAX_SIGNATURE_LINES and looks_like_signature:
+                return lines[:i + 1] + tail[:1]
+            break
+    return lines
+
+
+def strip_disclaimers(lines):
+    #Drop paragraphs of legal or list boilerplate
+    kept = []
+    paragraph = []
+    for line in lines + ['']:
+        if line.strip():
+            paragraph.append(line)
+            continue
+        if paragraph:
+            text = ' '.join(paragraph).lower()
+            if not any(phrase in text for phrase in DISCLAIMER_PHRASES):
+                kept.extend(paragraph)
+                kept.append('')
+            paragraph = []
+    return kept
+
+
+def truncate(text, max_tokens):
+    #Cut text to roughly max_tokens, at a line or word boundary
+    if not max_tokens or estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max_tokens * 4
+    cut = text.rfind('\n', 0, limit)
+    if cut < limit // 2:
+        cut = text.rfind(' ', 0, limit)
+    if cut < limit // 2:
+        cut = limit
+    return text[:cut].rstrip() + '\n[truncated]'
+
+
+def clean_body(body, max_tokens=None):
+    """Strip quoted replies, forwarded headers, signatures, disclaimers and HTML.
+
+    Works line by line with plain string tests (no backtracking regexes), so
+    the cost is linear in the size of the body.
+    """
+    body = body or ''
+    if looks_like_html(body):
+        body = html_to_text(body)
+
+    lines = strip_signature(strip_disclaimers(strip_lines(body.splitlines())))
+
+    # Collapse runs of blank lines
+    cleaned = []
+    for line in lines:
+        if line.strip() or (cleaned and cleaned[-1].strip()):
+            cleaned.append(line)
+    text = '\n'.join(cleaned).strip()
+    if not text:
+        # Everything looked like boilerplate; better to send the original than nothing
+        text = body.strip()
+    return truncate(text, max_tokens)
+
+
+def savings(original, cleaned):
+    return {
+        'bytes_before': len(original.encode('utf-8')),
+        'bytes_after': len(cleaned.encode('utf-8')),
+        'tokens_before': estimate_tokens(original),
+        'tokens_after': estimate_tokens(cleaned)
+    }
@@ -0,0 +1,46 @@
+import threading
+
+
+class PromptRegistry:
+    """In-memory copy of the prompt templates, reloaded only when they change.
+
+    Triggers on the prompts table bump the 'prompts' counter in table_versions
+    in the same transaction as any write to it, so every process (API server and workers)
+    notices an edit on its next lookup by reading a single row instead of the
+    whole prompts table.
+    """
+
+    # How each template starts the prompt it is used in; rendered once per version
+    PREFIXES = {
+        'categorization': "{content}\n\nEmail Content:\n",
+        'action_extraction': "{content}\n\nEmail Content:\n",
+        'summary': "{content}\n\nEmail: ",
+        'auto_reply': "{content}\n\n"
+    }
+
+    def __init__(self, db):
+        self.db = db
+        self.version = None
+        self.prompts = {}
+        self.lock = threading.Lock()
+
+    def get_prompts(self):
+        #Get all templates, each with its 'version' and pre-rendered 'prefix'
+        version = self.db.get_table_version('prompts')
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.prompts = self.load(self.db.get_prompts())
+                    self.version = version
+        return self.prompts
+
+    def load(self, prompts):
+        for name, prompt in prompts.items():
+            template = self.PREFIXES.get(name, "{content}\n\n")
+            prompt['prefix'] = template.format(content=prompt['content'])
+        return prompts
+
+    def invalidate(self):
+        #Force a reload on the next lookup
+        with self.lock:
+            self.version = None
@@ -0,0 +1,200 @@
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+
+
+class LLMError(Exception):
+    """An LLM request failed (after any retries)"""
+
+
+class TokenBucket:
+    """Budget of `capacity` units per minute, refilled continuously"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        #Seconds until `amount` units are available (0 if they already are)
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def consume(self, amount):
+        # May go negative when actual usage exceeds the estimate; later requests wait it off
+        self.available -= amount
+
+
+def is_throttling_error(error):
+    #True for HTTP 429 / RateLimitError responses
+    if getattr(error, 'status_code', None) == 429:
+        return True
+    return type(error).__name__ == 'RateLimitError'
+
+
+def retry_after_seconds(error):
+    #Server-provided Retry-After delay, if any
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMScheduler:
+    """Client-side scheduler for LLM requests.
+
+    Enforces requests-per-minute and tokens-per-minute budgets with token
+    buckets, serves waiting 'interactive' requests before 'batch' ones, and
+    retries throttled requests with jittered exponential backoff. While a
+    backoff is in progress no other request is dispatched either, since the
+    whole API key is being throttled.
+    """
+
+    PRIORITIES = {'interactive': 0, 'batch': 1}
+
+    # Seconds between budget checks for coroutines waiting in aacquire()
+    ASYNC_POLL_INTERVAL = 0.01
+
+    def __init__(self, requests_per_minute=3500, tokens_per_minute=90000, max_retries=5,
+                 base_delay=1.0, max_delay=60.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.paused_until = 0.0
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.stats = {'requests': 0, 'throttled': 0, 'retries': 0, 'failed': 0, 'wait_seconds': 0.0}
+
+    def run(self, request, estimated_tokens, priority='interactive'):
+        #Call request() within the rate limits, retrying it while throttled
+        for attempt in range(self.max_retries + 1):
+            self.acquire(estimated_tokens, priority)
+            try:
+                return request()
+            except Exception as e:
+                self.pause(self.retry_delay(e, attempt))
+
+    async def arun(self, request, estimated_tokens, priority='interactive'):
+        """run() for a coroutine function; waits with asyncio.sleep, so no thread is blocked"""
+        for attempt in range(self.max_retries + 1):
+            await self.aacquire(estimated_tokens, priority)
+            try:
+                return await request()
+            except Exception as e:
+                delay = self.retry_delay(e, attempt)
+                self.set_pause(delay)
+                await asyncio.sleep(delay)
+
+    def retry_delay(self, error, attempt):
+        #Backoff before retrying a throttled request; re-raises other errors and the last attempt's
+        if not is_throttling_error(error):
+            raise error
+        with self.condition:
+            self.stats['throttled'] += 1
+        if attempt == self.max_retries:
+            with self.condition:
+                self.stats['failed'] += 1
+            raise LLMError(f"Rate limited after {self.max_retries} retries: {error}") from error
+
+        with self.condition:
+            self.stats['retries'] += 1
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+        return delay
+
+    def dispatch_wait(self, now, estimated_tokens):
+        #Seconds until a request of this size fits the budgets; call with the condition held
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return max(
+            self.paused_until - now,
+            self.requests.wait_time(1),
+            self.tokens.wait_time(estimated_tokens)
+        )
+
+    def dispatch(self, now, started, estimated_tokens):
+        #Charge a request to the budgets; call with the condition held
+        self.requests.consume(1)
+        self.tokens.consume(min(estimated_tokens, self.tokens.capacity))
+        self.stats['requests'] += 1
+        self.stats['wait_seconds'] += now - started
+
+    def acquire(self, estimated_tokens, priority='interactive'):
+        #Block until this request may be sent
+        started = time.monotonic()
+        entry = (self.PRIORITIES.get(priority, 1), next(self.sequence))
+
+        with self.condition:
+            heapq.heappush(self.waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self.waiting[0] == entry:
+                        wait = self.dispatch_wait(now, estimated_tokens)
+                        if wait <= 0:
+                            self.dispatch(now, started, estimated_tokens)
+                            return
+                        # Wake early if a higher-priority request arrives
+                        self.condition.wait(timeout=wait)
+                    else:
+                        self.condition.wait()
+            finally:
+                self.waiting.remove(entry)
+                heapq.heapify(self.waiting)
+                self.condition.notify_all()
+
+    async def aacquire(self, estimated_tokens, priority='interactive'):
+        """acquire() for coroutines.
+
+        Coroutines do not queue behind threads; they poll the budgets and
+        only step aside for blocked threads of a higher priority.
+        """
+        started = time.monotonic()
+        level = self.PRIORITIES.get(priority, 1)
+        while True:
+            with self.condition:
+                now = time.monotonic()
+                wait = self.dispatch_wait(now, estimated_tokens)
+                if wait <= 0 and not any(entry[0] < level for entry in self.waiting):
+                    self.dispatch(now, started, estimated_tokens)
+                    return
+            await asyncio.sleep(max(wait, self.ASYNC_POLL_INTERVAL))
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        #Correct the token bucket once the real usage is known
+        if actual_tokens is None:
+            return
+        with self.condition:
+            self.tokens.consume(actual_tokens - min(estimated_tokens, self.tokens.capacity))
+
+    def set_pause(self, seconds):
+        #Stop dispatching for a while after being throttled
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.condition.notify_all()
+
+    def pause(self, seconds):
+        self.set_pause(seconds)
+        time.sleep(seconds)
+
+    def get_stats(self):
+        with self.condition:
+            stats = dict(self.stats)
+            stats['queued'] = len(self.waiting)
+            return stats
@@ -0,0 +1,183 @@
+import hashlib
+import math
+import re
+import zlib
+from array import array
+from tokens import estimate_tokens
+
+
+# Common words that would match nearly every email in an OR query
+STOPWORDS = {
+    'a', 'about', 'all', 'am', 'an', 'and', 'any', 'are', 'as', 'at', 'be', 'by', 'can', 'could',
+    'did', 'do', 'does', 'for', 'from', 'has', 'have', 'how', 'i', 'if', 'in', 'is', 'it', 'me',
+    'my', 'of', 'on', 'or', 'our', 'should', 'so', 'that', 'the', 'there', 'this', 'to', 'was',
+    'we', 'were', 'what', 'when', 'where', 'which', 'who', 'why', 'will', 'with', 'you', 'your'
+}
+
+
+class HashingEmbedder:
+    """Deterministic local embedding: signed feature hashing of word unigrams and bigrams"""
+
+    def __init__(self, dimensions=256, max_chars=4000):
+        self.dimensions = dimensions
+        self.max_chars = max_chars
+        self.name = f"hashing-{dimensions}"
+
+    def embed(self, text):
+        words = re.findall(r'\w+', (text or '')[:self.max_chars].lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+        vector = [0.0] * self.dimensions
+        for feature in features:
+            # crc32 rather than hash(), which is randomized per process
+            h = zlib.crc32(feature.encode('utf-8'))
+            sign = 1.0 if h & 0x80000000 else -1.0
+            vector[h % self.dimensions] += sign
+
+        norm = math.sqrt(sum(value * value for value in vector))
+        if norm:
+            vector = [value / norm for value in vector]
+        return vector
+
+
+class InboxRetriever:
+    """Pick the emails most relevant to a question, within a token budget.
+
+    Candidates come from the FTS5 index (kept current by triggers as emails
+    arrive) plus the most recent emails. They are re-ranked by fusing the
+    bm25 rank with embedding similarity. Embeddings are computed once per
+    email content and stored in the email_embeddings table.
+    """
+
+    RRF_K = 60
+
+    def __init__(self, db, embedder=None, top_k=10, token_budget=2000, candidates=50, recent=20):
+        self.db = db
+        self.embedder = embedder or HashingEmbedder()
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self.candidates = candidates
+        self.recent = recent
+        self.init_db()
+
+    def init_db(self):
+        #Initialize embedding store
+        conn = self.db.connect()
+        cleaned = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'email_embeddings_delete'"
+        ).fetchone()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS email_embeddings (
+                    email_id TEXT PRIMARY KEY,
+                    model TEXT,
+                    content_hash TEXT,
+                    vector BLOB
+                )
+            ''')
+            # An email's embedding goes with it
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS email_embeddings_delete AFTER DELETE ON emails BEGIN
+                    DELETE FROM email_embeddings WHERE email_id = old.id;
+                END
+            ''')
+            if not cleaned:
+                # Embeddings of emails deleted before the trigger existed
+                conn.execute('DELETE FROM email_embeddings WHERE email_id NOT IN (SELECT id FROM emails)')
+
+    def retrieve(self, query, top_k=None, token_budget=None):
+        #Get the most relevant emails for a query, best first
+        top_k = top_k or self.top_k
+        token_budget = token_budget or self.token_budget
+
+        terms = [term for term in re.findall(r'\w+', query.lower()) if term not in STOPWORDS]
+        lexical, _ = self.db.search_emails(' '.join(terms), limit=self.candidates, match_any=True)
+        recent, _ = self.db.list_emails(limit=self.recent, fields=['id'])
+
+        lexical_rank = {row['id']: rank for rank, row in enumerate(lexical)}
+        snippets = {row['id']: row['snippet'] for row in lexical}
+        candidate_ids = list(lexical_rank) + [row['id'] for row in recent if row['id'] not in lexical_rank]
+        if not candidate_ids:
+            return []
+
+        emails = self.load_candidates(candidate_ids)
+        vectors = self.get_embeddings(emails)
+        query_vector = self.embedder.embed(query)
+        similarity = {
+            email_id: sum(a * b for a, b in zip(query_vector, vector))
+            for email_id, vector in vectors.items()
+        }
+        semantic_rank = {
+            email_id: rank
+            for rank, email_id in enumerate(sorted(similarity, key=similarity.get, reverse=True))
+        }
+
+        def fused_score(email_id):
+            score = 1.0 / (self.RRF_K + semantic_rank[email_id])
+            if email_id in lexical_rank:
+                score += 1.0 / (self.RRF_K + lexical_rank[email_id])
+            return score
+
+        ranked = sorted(emails, key=lambda email: fused_score(email['id']), reverse=True)
+
+        selected = []
+        used_tokens = 0
+        for email in ranked:
+            if len(selected) >= top_k:
+                break
+            email['excerpt'] = snippets.get(email['id']) or (email['body'] or '')[:300]
+            del email['body']
+            cost = estimate_tokens(' '.join(str(value) for value in email.values() if value))
+            if selected and used_tokens + cost > token_budget:
+                continue
+            selected.append(email)
+            used_tokens += cost
+
+        return selected
+
+    def load_candidates(self, email_ids):
+        conn = self.db.connect()
+        placeholders = ', '.join('?' for _ in email_ids)
+        rows = conn.execute(f'''
+            SELECT id, sender, subject, date, category, summary, body
+            FROM emails WHERE id IN ({placeholders})
+        ''', email_ids).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_embeddings(self, emails):
+        #Get stored embeddings, computing and saving any that are missing or stale
+        conn = self.db.connect()
+        email_ids = [email['id'] for email in emails]
+        placeholders = ', '.join('?' for _ in email_ids)
+        stored = {
+            row['email_id']: row
+            for row in conn.execute(f'''
+                SELECT email_id, content_hash, vector FROM email_embeddings
+                WHERE model = ? AND email_id IN ({placeholders})
+            ''', [self.embedder.name] + email_ids).fetchall()
+        }
+
+        vectors = {}
+        updates = []
+        for email in emails:
+            text = self.embedding_text(email)
+            content_hash = hashlib.sha1(text.encode('utf-8')).hexdigest()
+            row = stored.get(email['id'])
+            if row and row['content_hash'] == content_hash:
+                vectors[email['id']] = array('f', row['vector'])
+                continue
+            vector = self.embedder.embed(text)
+            vectors[email['id']] = vector
+            updates.append((email['id'], self.embedder.name, content_hash, array('f', vector).tobytes()))
+
+        if updates:
+            with conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO email_embeddings (email_id, model, content_hash, vector)
+                    VALUES (?, ?, ?, ?)
+                ''', updates)
+        return vectors
+
+    @staticmethod
+    def embedding_text(email):
+        return f"{email['subject'] or ''}\n{email['sender'] or ''}\n{email['summary'] or ''}\n{email['body'] or ''}"
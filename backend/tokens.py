@@ -0,0 +1,3 @@
+def estimate_tokens(text):
+    #Rough token estimate (~4 characters per token for English text)
+    return len(text or '') // 4 + 1
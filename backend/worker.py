@@ -0,0 +1,125 @@
+import argparse
+import os
+import socket
+import time
+from config import Config
+from database import Database
+from email_processor import EmailProcessor
+from job_queue import JobQueue, PermanentJobError
+from ingest import Ingester, detect_format, iter_records
+from db_connection import close_thread_connections
+
+
+class Worker:
+    """Consume jobs from the queue and run them outside the API process"""
+
+    def __init__(self, db=None, email_processor=None, queue=None, poll_interval=None):
+        self.db = db or Database()
+        self.email_processor = email_processor or EmailProcessor()
+        self.current_job_id = None
+        self.queue = queue or JobQueue(
+            self.db,
+            max_attempts=Config.JOB_MAX_ATTEMPTS,
+            base_delay=Config.JOB_RETRY_DELAY
+        )
+        self.poll_interval = poll_interval if poll_interval is not None else Config.WORKER_POLL_INTERVAL
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.handlers = {
+            'process_email': self.handle_process_email,
+            'import_mailbox': self.handle_import_mailbox,
+            'train_classifier': self.handle_train_classifier
+        }
+
+    def run(self):
+        print(f"Worker {self.worker_id} started")
+        try:
+            while True:
+                if not self.run_once():
+                    time.sleep(self.poll_interval)
+        finally:
+            close_thread_connections()
+
+    def run_once(self):
+        #Run the next available job; returns False when the queue is empty
+        job = self.queue.claim(self.worker_id)
+        if job is None:
+            return False
+
+        self.current_job_id = job['id']
+        finished = True
+        try:
+            handler = self.handlers.get(job['kind'])
+            if handler is None:
+                raise PermanentJobError(f"Unknown job kind: {job['kind']}")
+            self.queue.complete(job['id'], handler(job['payload']))
+        except PermanentJobError as e:
+            print(f"Job {job['id']} failed permanently: {e}")
+            self.queue.fail(job['id'], str(e), retry=False)
+        except Exception as e:
+            print(f"Job {job['id']} failed (attempt {job['attempts']}): {e}")
+            self.queue.fail(job['id'], str(e))
+            finished = job['attempts'] >= job['max_attempts']
+        if finished:
+            self.release_upload(job)
+        return True
+
+    def release_upload(self, job):
+        #Delete an uploaded mailbox once its import is over, whether it succeeded or not
+        payload = job['payload'] or {}
+        if job['kind'] == 'import_mailbox' and payload.get('uploaded') and os.path.exists(payload['path']):
+            os.remove(payload['path'])
+
+    def handle_process_email(self, payload):
+        email = self.db.get_email(payload['email_id'])
+        if not email:
+            raise PermanentJobError(f"Email not found: {payload['email_id']}")
+        try:
+            self.email_processor.select_tasks(payload.get('type', 'all'))
+        except ValueError as e:
+            raise PermanentJobError(str(e)) from e
+
+        with self.email_processor.priority('batch'):
+            result = self.email_processor.process_email(
+                email,
+                payload.get('type', 'all'),
+                fused=payload.get('fused', False),
+                incremental=payload.get('incremental', False)
+            )
+        self.db.update_email_processing(payload['email_id'], result)
+        return result
+
+
+    def handle_import_mailbox(self, payload):
+        job_id = self.current_job_id
+        file_format = payload.get('format') or detect_format(payload['path'])
+        if file_format not in ('mbox', 'jsonl'):
+            raise PermanentJobError(f"Unsupported import format: {file_format}")
+        if not os.path.exists(payload['path']):
+            raise PermanentJobError(f"Import file not found: {payload['path']}")
+        ingester = Ingester(
+            self.db,
+            batch_size=Config.IMPORT_BATCH_SIZE,
+            threader=self.email_processor.threads,
+            near_duplicates=self.email_processor.near_duplicates
+        )
+        # Progress updates also refresh the job lock, so long imports are not handed to another worker
+        return ingester.ingest(
+            iter_records(payload['path'], file_format),
+            progress=lambda stats: self.queue.update_progress(job_id, stats)
+        )
+
+    def handle_train_classifier(self, payload):
+        #Returns the held-out evaluation report
+        try:
+            return self.email_processor.train_pre_classifier()
+        except ValueError as e:
+            # Too few labelled emails; retrying within minutes won't label more
+            raise PermanentJobError(str(e)) from e
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Email processing job worker')
+    parser.add_argument('--poll-interval', type=float, default=None, help='Seconds to wait when the queue is empty')
+    args = parser.parse_args()
+
+    Worker(poll_interval=args.poll_interval).run()
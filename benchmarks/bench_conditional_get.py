@@ -0,0 +1,90 @@
+"""Compare full, compressed and conditional (304) responses on the read endpoints.
+
+Each endpoint is requested three ways through the Flask test client: without
+Accept-Encoding, with Accept-Encoding: gzip (and br when brotli is
+installed), and with the ETag from a previous response in If-None-Match, as
+the frontend does when it polls.
+
+Usage: python benchmarks/bench_conditional_get.py [--emails 5000] [--iterations 200] [--json results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'backend'))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_hot_paths import measure, populate
+
+ENDPOINTS = [
+    '/api/emails?limit=100&fields=id,sender,subject,date,category,is_processed',
+    '/api/emails?limit=500',
+    '/api/emails/synthetic-0',
+    '/api/prompts'
+]
+
+
+def run_endpoint(client, path, iterations, accept_encoding):
+    variants = {
+        'full': {},
+        'compressed': {'Accept-Encoding': accept_encoding}
+    }
+    etag = client.get(path, headers=variants['compressed']).headers.get('ETag')
+    variants['not_modified'] = {'Accept-Encoding': accept_encoding, 'If-None-Match': etag}
+
+    results = {}
+    for name, headers in variants.items():
+        response = client.get(path, headers=headers)
+        results[name] = {
+            'status': response.status_code,
+            'bytes': len(response.get_data()),
+            'content_encoding': response.headers.get('Content-Encoding'),
+            **measure(lambda i: client.get(path, headers=headers), iterations)
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--emails', type=int, default=5000)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-conditional-')
+    os.chdir(workdir)
+    os.makedirs('data')
+
+    # Importing the app creates its database in workdir/data
+    import app as backend_app
+    from http_cache import ENCODINGS
+
+    populate(backend_app.db, args.emails, seed=0)
+    client = backend_app.app.test_client()
+    accept_encoding = ', '.join(ENCODINGS)
+
+    results = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'emails': args.emails,
+        'accept_encoding': accept_encoding,
+        'endpoints': {path: run_endpoint(client, path, args.iterations, accept_encoding) for path in ENDPOINTS}
+    }
+
+    print(f"{args.emails} emails, {args.iterations} requests per variant, Accept-Encoding: {accept_encoding}")
+    print(f"{'variant':<14}{'status':>8}{'bytes':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for path, variants in results['endpoints'].items():
+        print(path)
+        for name, run in variants.items():
+            print(f"  {name:<12}{run['status']:>8}{run['bytes']:>10}{run['p50_ms']:>10}{run['p95_ms']:>10}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
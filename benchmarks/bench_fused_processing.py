@@ -0,0 +1,109 @@
+"""Compare split (three requests) and fused (one request) email processing.
+
+Near-duplicate reuse and the response cache are off in both modes, so every
+email is sent to the stub model. The run checks the request counts: three
+per email split, and one per email fused plus one for each field a
+malformed fused reply got wrong, and that every email ends up with a
+category, actions and a summary.
+
+Usage: python benchmarks/bench_fused_processing.py [--emails 50] [--latency 0.02]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'backend'))
+sys.path.insert(0, BENCH_DIR)
+
+from stub_llm import NoCache, StubOpenAIClient
+from synthetic import generate_emails
+
+
+def run_mode(fused, emails, latency, malformed_rate):
+    from email_processor import EmailProcessor
+
+    workdir = tempfile.mkdtemp(prefix='bench-fused-')
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        processor = EmailProcessor()
+        # Synthetic emails share template bodies, which the cache would answer after the first
+        processor.cache = NoCache()
+        processor.client = StubOpenAIClient(latency=latency, malformed_rate=malformed_rate)
+        prompts = processor.prompt_registry.get_prompts()
+
+        start = time.perf_counter()
+        results = [processor.process_email(email, 'all', prompts=prompts, fused=fused) for email in emails]
+        elapsed = time.perf_counter() - start
+    finally:
+        os.chdir(previous)
+
+    stats = processor.client.stats()
+    stats['incomplete'] = sum(1 for result in results if not complete(result))
+    stats['seconds'] = round(elapsed, 3)
+    stats['emails_per_second'] = round(len(emails) / elapsed, 2) if elapsed else None
+    return stats
+
+
+def complete(result):
+    #Whether a processed email has a valid category, actions and summary
+    actions = result.get('actions')
+    return (isinstance(result.get('category'), str)
+            and isinstance(actions, dict) and isinstance(actions.get('tasks'), list)
+            and isinstance(result.get('summary'), str) and bool(result['summary']))
+
+
+def check(results):
+    """Raise AssertionError if a mode made unexpected requests or left an email incomplete"""
+    emails = results['emails']
+    split, fused = results['split'], results['fused']
+    assert split['requests'] == 3 * emails, f"split: {split['requests']} requests for {emails} emails"
+    assert fused['requests'] == emails + fused['malformed_replies'], (
+        f"fused: {fused['requests']} requests for {emails} emails and {fused['malformed_replies']} malformed replies"
+    )
+    for mode in ('split', 'fused'):
+        assert results[mode]['incomplete'] == 0, f"{mode}: {results[mode]['incomplete']} incomplete emails"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--emails', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.02, help='Stub model latency per request (seconds)')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='Share of fused replies with an invalid field')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    from config import Config
+    Config.NEAR_DUPLICATE_REUSE = False
+
+    emails = list(generate_emails(args.emails))
+    results = {
+        'emails': args.emails,
+        'latency': args.latency,
+        'split': run_mode(False, emails, args.latency, args.malformed_rate),
+        'fused': run_mode(True, emails, args.latency, args.malformed_rate)
+    }
+
+    print(f"{'mode':<8}{'requests':>10}{'input tok':>12}{'output tok':>12}{'malformed':>11}{'seconds':>10}")
+    for mode in ('split', 'fused'):
+        r = results[mode]
+        print(f"{mode:<8}{r['requests']:>10}{r['input_tokens']:>12}{r['output_tokens']:>12}"
+              f"{r['malformed_replies']:>11}{r['seconds']:>10}")
+    split, fused = results['split'], results['fused']
+    print(f"\nfused/split: requests {fused['requests'] / split['requests']:.2f}x, "
+          f"input tokens {fused['input_tokens'] / split['input_tokens']:.2f}x, "
+          f"time {fused['seconds'] / split['seconds']:.2f}x")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    check(results)
+
+
+if __name__ == '__main__':
+    main()
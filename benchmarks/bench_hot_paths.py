@@ -0,0 +1,281 @@
+"""Time the backend hot paths on synthetic inboxes, against a stub LLM.
+
+Each inbox size runs in its own process and temporary directory, so peak RSS
+is measured per size and the real data/ directory is never touched.
+
+Usage:
+    python benchmarks/bench_hot_paths.py [--sizes 1000,100000,1000000] [--latency 0.0]
+        [--json results.json] [--baseline benchmarks/baseline.json] [--save-baseline]
+        [--fail-on-regression]
+
+Timings depend on the machine, so the baseline is not checked in: save one
+with --save-baseline on the machine that runs the comparison, with the same
+--sizes, --seed and --latency. With --fail-on-regression, a missing baseline
+or a size the baseline does not cover fails the run (exit status 2) instead
+of passing with nothing compared.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCH_DIR, '..', 'backend')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+
+def percentile(sorted_values, pct):
+    #Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def measure(fn, iterations):
+    #Call fn(i) `iterations` times and summarize the latencies
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        call_start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'seconds': round(elapsed, 4),
+        'ops_per_second': round(iterations / elapsed, 2) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3)
+    }
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return round(peak / 1024, 1)
+
+
+def populate(db, size, seed):
+    #Bulk-load a synthetic inbox the way a mailbox import would
+    from ingest import Ingester
+    from synthetic import generate_emails
+
+    records = (
+        {
+            'id': email['id'],
+            'message_id': None,
+            'from': email['from'],
+            'subject': email['subject'],
+            'body': email['body'],
+            'date': email['date'],
+            'in_reply_to': None,
+            'references': None,
+            'headers': None
+        }
+        for email in generate_emails(size, seed)
+    )
+    Ingester(db).ingest(records)
+
+
+def run_size(size, args):
+    """Benchmark one inbox size; runs inside the child process"""
+    from synthetic import generate_emails
+    from stub_llm import StubOpenAIClient
+
+    workdir = tempfile.mkdtemp(prefix=f'bench-hot-{size}-')
+    os.chdir(workdir)
+    os.makedirs('data')
+
+    # Importing the app creates its database, processor and queue in workdir/data
+    import app as backend_app
+    from llm_cache import LLMCache
+    from rate_limiter import LLMScheduler
+
+    db = backend_app.db
+    processor = backend_app.email_processor
+    processor.client = StubOpenAIClient(latency=args.latency, seed=args.seed)
+    # Measure the backend, not the client-side rate limiter
+    processor.scheduler = LLMScheduler(requests_per_minute=10 ** 9, tokens_per_minute=10 ** 12)
+    client = backend_app.app.test_client()
+
+    results = {'size': size}
+    start = time.perf_counter()
+    populate(db, size, args.seed)
+    results['populate_seconds'] = round(time.perf_counter() - start, 2)
+
+    rng = random.Random(args.seed)
+    ids = [f"synthetic-{rng.randrange(size)}" for _ in range(args.iterations)]
+    # Distinct emails for LLM paths so every request misses the response cache
+    llm_ids = [f"synthetic-{i}" for i in rng.sample(range(size), min(size, args.llm_iterations * 2))]
+    llm_direct, llm_route = llm_ids[0::2], llm_ids[1::2]
+    processed = {
+        'category': 'Important',
+        'actions': {'tasks': [{'task': 'Review', 'deadline': 'Friday', 'priority': 'medium'}]},
+        'summary': '- Key point',
+        'prompt_versions': {'categorization': 1, 'action_extraction': 1, 'summary': 1}
+    }
+
+    with open('data/mock_inbox.json', 'w') as f:
+        json.dump(list(generate_emails(min(size, args.mock_size), args.seed)), f)
+
+    ops = {}
+    ops['get_email'] = measure(lambda i: db.get_email(ids[i]), args.iterations)
+    ops['update_email_processing'] = measure(
+        lambda i: db.update_email_processing(ids[i], processed), args.iterations
+    )
+    ops['load_mock_data'] = measure(lambda i: db.load_mock_data(), args.scan_iterations)
+    ops['route_list_emails_page'] = measure(
+        lambda i: client.get('/api/emails?limit=50&fields=id,sender,subject,date,category,is_processed'),
+        args.iterations
+    )
+
+    if size <= args.full_scan_limit:
+        ops['get_emails'] = measure(lambda i: db.get_emails(), args.scan_iterations)
+        ops['route_list_emails'] = measure(lambda i: client.get('/api/emails'), args.scan_iterations)
+    else:
+        results['skipped'] = ['get_emails', 'route_list_emails']
+
+    processor.cache = LLMCache(os.path.join(workdir, 'bench_llm_cache.db'))
+    ops['process_email'] = measure(
+        lambda i: processor.process_email(db.get_email(llm_direct[i]), 'all'), len(llm_direct)
+    )
+    ops['route_process_email'] = measure(
+        lambda i: client.post(f'/api/emails/{llm_route[i]}/process', json={'type': 'all', 'sync': True}),
+        len(llm_route)
+    )
+
+    results['llm'] = processor.client.stats()
+    results['operations'] = ops
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return (size, operation, metric, baseline, current, change) rows that regressed"""
+    previous = {str(run['size']): run for run in baseline.get('runs', [])}
+    regressions = []
+    for run in results['runs']:
+        base_run = previous.get(str(run['size']))
+        if not base_run:
+            continue
+        for name, current in run['operations'].items():
+            base = base_run['operations'].get(name)
+            if not base:
+                continue
+            for metric in ('p50_ms', 'p95_ms'):
+                if base[metric] and current[metric] > base[metric] * (1 + tolerance):
+                    change = current[metric] / base[metric] - 1
+                    regressions.append((run['size'], name, metric, base[metric], current[metric], change))
+    return regressions
+
+
+def print_report(results):
+    for run in results['runs']:
+        print(f"\n{run['size']} emails (populated in {run['populate_seconds']}s, peak RSS {run['peak_rss_mb']} MB)")
+        print(f"{'operation':<26}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name, op in run['operations'].items():
+            print(f"{name:<26}{op['ops_per_second']:>10}{op['p50_ms']:>10}{op['p95_ms']:>10}{op['p99_ms']:>10}")
+        if run.get('skipped'):
+            print(f"skipped (above --full-scan-limit): {', '.join(run['skipped'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000', help='Comma-separated inbox sizes, e.g. 1000,100000,1000000')
+    parser.add_argument('--iterations', type=int, default=500, help='Calls per point operation')
+    parser.add_argument('--scan-iterations', type=int, default=5, help='Calls per full-inbox operation')
+    parser.add_argument('--llm-iterations', type=int, default=50, help='Emails processed per LLM path')
+    parser.add_argument('--latency', type=float, default=0.0, help='Stub model latency per request (seconds)')
+    parser.add_argument('--mock-size', type=int, default=1000, help='Emails in the mock_inbox.json used by load_mock_data')
+    parser.add_argument('--full-scan-limit', type=int, default=100000,
+                        help='Skip unpaginated listings for larger inboxes (they hold every row in memory)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown before reporting a regression')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='Exit with status 1 on regressions, or 2 when the baseline is missing or does not cover a size')
+    parser.add_argument('--run-size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_size is not None:
+        # Child process: report one size as JSON on the last line of stdout
+        print(json.dumps(run_size(args.run_size, args)))
+        return
+
+    child_args = [arg for arg in sys.argv[1:] if arg != '--save-baseline' and arg != '--fail-on-regression']
+    results = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'latency': args.latency,
+        'seed': args.seed,
+        'runs': []
+    }
+    for size in [int(size) for size in args.sizes.split(',') if size.strip()]:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run-size', str(size)] + child_args,
+            check=True, stdout=subprocess.PIPE, text=True
+        ).stdout
+        results['runs'].append(json.loads(output.strip().splitlines()[-1]))
+
+    print_report(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    uncovered = []
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('latency') != args.latency:
+            print(f"\nWarning: baseline used stub latency {baseline.get('latency')}, this run {args.latency}")
+        regressions = compare(results, baseline, args.tolerance)
+        covered = {str(run['size']) for run in baseline.get('runs', [])}
+        uncovered = [run['size'] for run in results['runs'] if str(run['size']) not in covered]
+        if regressions:
+            print(f"\nRegressions beyond {args.tolerance:.0%} against {args.baseline}:")
+            for size, name, metric, base, current, change in regressions:
+                print(f"  {size} {name} {metric}: {base} -> {current} (+{change:.0%})")
+        else:
+            print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+        if uncovered:
+            print(f"Baseline has no results for size(s) {', '.join(map(str, uncovered))}")
+    else:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+        uncovered = [run['size'] for run in results['runs']]
+
+    if args.fail_on_regression:
+        if uncovered:
+            # Nothing to compare against is not a pass
+            sys.exit(2)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
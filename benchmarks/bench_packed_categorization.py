@@ -0,0 +1,113 @@
+"""Compare per-email and packed categorization in batch jobs, and check the id mapping.
+
+The stub model categorizes each email from its subject (stub_llm.category_for)
+and answers packed requests with its categories shuffled; with
+--malformed-rate it also drops some, gives invalid categories or uses numbers
+that were not in the prompt. Every stored category is checked against the
+expected one, so an email given another email's category shows up as a
+mismatch.
+
+Usage: python benchmarks/bench_packed_categorization.py [--emails 500] [--malformed-rate 0.2] [--latency 0.0]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'backend'))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_hot_paths import populate
+from stub_llm import StubOpenAIClient, category_for
+
+
+def run_mode(backend_app, name, packed, latency, malformed_rate, concurrency):
+    from llm_cache import LLMCache
+    from metrics import metrics
+
+    db = backend_app.db
+    processor = backend_app.email_processor
+    # A fresh cache per mode so no run is served from another's responses
+    processor.cache = LLMCache(os.path.join(os.getcwd(), f"llm_cache_{name}.db"))
+    processor.client = StubOpenAIClient(latency=latency, malformed_rate=malformed_rate)
+    conn = db.connect()
+    with conn:
+        conn.execute('UPDATE emails SET category = NULL, is_processed = FALSE')
+    missing_before = metrics.packed_categorizations.get(result='missing')
+
+    start = time.perf_counter()
+    job = backend_app.batch_processor.start_job(
+        email_ids=db.get_email_ids(), process_type='categorize', concurrency=concurrency, packed=packed
+    )
+    while job['status'] not in ('completed', 'failed'):
+        time.sleep(0.05)
+        job = backend_app.batch_processor.get_job(job['id'])
+    elapsed = time.perf_counter() - start
+
+    rows = conn.execute('SELECT subject, category FROM emails').fetchall()
+    stats = processor.client.stats()
+    stats.update({
+        'seconds': round(elapsed, 3),
+        'processed': job['processed'],
+        'failed': job['failed'],
+        'mismatched': sum(1 for row in rows if row['category'] != category_for(row['subject'])),
+        'retried_from_packs': metrics.packed_categorizations.get(result='missing') - missing_before
+    })
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--emails', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.0, help='Stub model latency per request (seconds)')
+    parser.add_argument('--malformed-rate', type=float, default=0.2, help='Share of emails mishandled in packed replies')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-packed-')
+    os.chdir(workdir)
+    os.makedirs('data')
+
+    # Importing the app creates its database in workdir/data
+    import app as backend_app
+    from config import Config
+    from rate_limiter import LLMScheduler
+
+    # Synthetic emails share template bodies; reusing near-duplicates' categories would hide the mapping
+    Config.NEAR_DUPLICATE_REUSE = False
+    backend_app.email_processor.scheduler = LLMScheduler(requests_per_minute=10 ** 9, tokens_per_minute=10 ** 12)
+    populate(backend_app.db, args.emails, seed=0)
+
+    modes = [
+        ('per_email', False, 0.0),
+        ('packed', True, 0.0),
+        ('packed_malformed', True, args.malformed_rate)
+    ]
+    results = {
+        'emails': args.emails,
+        'latency': args.latency,
+        'malformed_rate': args.malformed_rate,
+        'max_emails_per_request': Config.PACKED_CATEGORIZATION_MAX_EMAILS,
+        'token_budget': Config.PACKED_CATEGORIZATION_TOKEN_BUDGET
+    }
+    for name, packed, malformed_rate in modes:
+        results[name] = run_mode(backend_app, name, packed, args.latency, malformed_rate, args.concurrency)
+
+    print(f"{args.emails} emails, up to {Config.PACKED_CATEGORIZATION_MAX_EMAILS} per packed request")
+    print(f"{'mode':<18}{'requests':>10}{'input tok':>11}{'seconds':>9}{'retried':>9}{'mismatched':>12}{'failed':>8}")
+    for name, _, _ in modes:
+        run = results[name]
+        print(f"{name:<18}{run['requests']:>10}{run['input_tokens']:>11}{run['seconds']:>9}"
+              f"{run['retried_from_packs']:>9}{run['mismatched']:>12}{run['failed']:>8}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""Load-test the Flask and ASGI servers with concurrent LLM-bound requests against a stub model.
+
+Each server runs in its own process and temporary directory, with the model
+replaced by a stub that takes --latency seconds per request. Every request
+is a /api/chat question that misses the response cache, so it waits on the
+stub model for the full latency.
+
+Usage:
+    python benchmarks/load_test_server.py [--servers flask,asgi] [--concurrency 50,200,500]
+        [--requests 1000] [--latency 1.0] [--json results.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCH_DIR, '..', 'backend')
+
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_hot_paths import percentile
+
+
+def serve(server, port, latency):
+    """Run one server with a stub model; runs inside the child process"""
+    from stub_llm import AsyncStubOpenAIClient, StubOpenAIClient
+
+    workdir = tempfile.mkdtemp(prefix=f'load-test-{server}-')
+    os.chdir(workdir)
+    os.makedirs('data')
+
+    # Importing the app creates its database, processor and queue in workdir/data
+    import app as backend_app
+    from rate_limiter import LLMScheduler
+
+    processor = backend_app.email_processor
+    processor.client = StubOpenAIClient(latency=latency)
+    processor.async_client = AsyncStubOpenAIClient(latency=latency)
+    # Measure the server, not the client-side rate limiter
+    processor.scheduler = LLMScheduler(requests_per_minute=10 ** 9, tokens_per_minute=10 ** 12)
+
+    if server == 'flask':
+        # The current server: app.run() as in backend/app.py, one thread per request
+        backend_app.app.run(port=port, threaded=True)
+    else:
+        import uvicorn
+        import asgi_app
+        uvicorn.run(asgi_app.app, host='127.0.0.1', port=port, log_level='warning', backlog=4096)
+
+
+def request(port, method, path, body=None, timeout=120):
+    #(status, seconds); status 0 for connection errors
+    start = time.perf_counter()
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+        payload = json.dumps(body) if body is not None else None
+        conn.request(method, path, body=payload, headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        status = response.status
+    except (OSError, http.client.HTTPException):
+        status = 0
+    return status, time.perf_counter() - start
+
+
+def wait_until_ready(port, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        if request(port, 'GET', '/api/metrics', timeout=2)[0] == 200:
+            return
+        time.sleep(0.2)
+    raise RuntimeError("Server did not start in time")
+
+
+def run_load(port, concurrency, total, label):
+    #Send `total` chat requests with `concurrency` in flight at a time
+    counter = iter(range(total))
+    lock = threading.Lock()
+    results = []
+
+    def client():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            # Unique questions, so every request misses the response cache
+            results.append(request(port, 'POST', '/api/chat', {'query': f"{label} question {i}"}))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(client)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(seconds for status, seconds in results if status == 200)
+    errors = sum(1 for status, _ in results if status != 200)
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'errors': errors,
+        'seconds': round(elapsed, 2),
+        'requests_per_second': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1) if latencies else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--servers', default='flask,asgi', help='Comma-separated servers: flask, asgi')
+    parser.add_argument('--concurrency', default='50,200,500', help='Comma-separated numbers of requests in flight')
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per concurrency level')
+    parser.add_argument('--latency', type=float, default=1.0, help='Stub model latency per request (seconds)')
+    parser.add_argument('--port', type=int, default=5901)
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--serve', choices=['flask', 'asgi'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.latency)
+        return
+
+    results = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'latency': args.latency,
+        'servers': {}
+    }
+    for server in [name.strip() for name in args.servers.split(',') if name.strip()]:
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', server,
+             '--port', str(args.port), '--latency', str(args.latency)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_until_ready(args.port, process)
+            request(args.port, 'POST', '/api/emails/load-mock')
+            results['servers'][server] = [
+                run_load(args.port, int(concurrency), args.requests, f"{server}-{concurrency}")
+                for concurrency in args.concurrency.split(',') if concurrency.strip()
+            ]
+        finally:
+            process.terminate()
+            process.wait()
+
+    print(f"Stub model latency {args.latency}s, {args.requests} requests per level")
+    print(f"{'server':<8}{'in flight':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for server, runs in results['servers'].items():
+        for run in runs:
+            print(f"{server:<8}{run['concurrency']:>10}{run['requests_per_second']:>10}"
+                  f"{str(run['p50_ms']):>10}{str(run['p95_ms']):>10}{str(run['p99_ms']):>10}{run['errors']:>8}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
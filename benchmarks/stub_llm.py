@@ -0,0 +1,173 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+CATEGORIES = ['Important', 'Newsletter', 'Spam', 'To-Do', 'Project Update']
+SUBJECT = re.compile(r'^Subject: (.*)$', re.MULTILINE)
+PACKED_EMAIL = re.compile(r'^### Email (\d+)\nFrom: .*\nSubject: (.*)$', re.MULTILINE)
+
+
+def count_tokens(text):
+    #Rough token count (~4 characters per token), matching the backend's estimate
+    return len(text or '') // 4 + 1
+
+
+def category_for(subject):
+    #The category the stub model gives an email, so callers can check where results ended up
+    return CATEGORIES[zlib.crc32(subject.encode('utf-8')) % len(CATEGORIES)]
+
+
+class StubOpenAIClient:
+    """Deterministic stand-in for the OpenAI client with injected latency.
+
+    Mirrors the ``client.chat.completions.create`` surface used by
+    EmailProcessor and counts requests and tokens.
+    """
+
+    def __init__(self, latency=0.0, malformed_rate=0.0, seed=0):
+        self.latency = latency
+        self.malformed_rate = malformed_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        # Fused replies given an invalid field, each of which costs a fallback request
+        self.malformed_replies = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, temperature=None, stream=False, **kwargs):
+        response = self.respond(messages, stream)
+        if self.latency:
+            time.sleep(self.latency)
+        return iter(response) if stream else response
+
+    def respond(self, messages, stream=False):
+        #Count the request and build its response (a list of chunks when streaming)
+        prompt = messages[-1]['content']
+        text = self.reply(prompt)
+        prompt_tokens = sum(count_tokens(message['content']) for message in messages)
+        completion_tokens = count_tokens(text)
+
+        with self.lock:
+            self.requests += 1
+            self.input_tokens += prompt_tokens
+            self.output_tokens += completion_tokens
+
+        if stream:
+            return [
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + ' '))])
+                for word in text.split(' ')
+            ]
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+    def reply(self, prompt):
+        tasks = {"tasks": [{"task": "Review the request", "deadline": "Friday", "priority": "medium"}]}
+        summary = "- Key point of the email\n- Follow-up required"
+
+        if "mapping each email's number" in prompt:
+            return self.packed_reply(prompt)
+        if 'single JSON object' in prompt:
+            with self.lock:
+                malformed = self.random.random() < self.malformed_rate
+            if malformed:
+                # Valid JSON with an unusable summary, to exercise per-field fallback
+                with self.lock:
+                    self.malformed_replies += 1
+                return json.dumps({"category": "Important", "actions": tasks, "summary": 42})
+            return json.dumps({"category": "Important", "actions": tasks, "summary": summary})
+        if 'Respond in JSON format' in prompt:
+            return json.dumps(tasks)
+        if 'Categorize' in prompt:
+            subject = SUBJECT.search(prompt)
+            return category_for(subject.group(1)) if subject else "Important"
+        return summary
+
+    def packed_reply(self, prompt):
+        """Categories keyed by email number, in shuffled order.
+
+        With malformed_rate, that share of emails is dropped, given an invalid
+        category or keyed by a number that is not in the prompt.
+        """
+        entries = PACKED_EMAIL.findall(prompt)
+        with self.lock:
+            self.random.shuffle(entries)
+            faults = [self.random.random() < self.malformed_rate and self.random.choice(['drop', 'invalid', 'unknown'])
+                      for _ in entries]
+        reply = {}
+        for (label, subject), fault in zip(entries, faults):
+            if fault == 'drop':
+                continue
+            if fault == 'invalid':
+                reply[label] = 42
+            elif fault == 'unknown':
+                reply[str(len(entries) + int(label))] = category_for(subject)
+            else:
+                reply[f"Email {label}" if int(label) % 2 else label] = category_for(subject)
+        return f"Here are the categories:\n{json.dumps(reply)}"
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'input_tokens': self.input_tokens,
+                'output_tokens': self.output_tokens,
+                'malformed_replies': self.malformed_replies
+            }
+
+
+class NoCache:
+    """Stand-in for LLMCache that never hits, so every call reaches the stub model"""
+
+    @staticmethod
+    def make_key(model, system_message, prompt, temperature):
+        return None
+
+    def get(self, key):
+        return None
+
+    def set(self, key, response, prompt_name=None, model=None):
+        pass
+
+
+class AsyncStubOpenAIClient(StubOpenAIClient):
+    """Stand-in for AsyncOpenAI: ``await client.chat.completions.create(...)`` with non-blocking latency"""
+
+    async def create(self, model, messages, temperature=None, stream=False, **kwargs):
+        response = self.respond(messages, stream)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if stream:
+            return AsyncChunks(response)
+        return response
+
+
+class AsyncChunks:
+    """Async iterator over stream chunks, closable like the OpenAI async stream"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self):
+        self.chunks = iter(())
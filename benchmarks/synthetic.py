@@ -0,0 +1,29 @@
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+MOCK_INBOX = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'mock_inbox.json')
+
+
+def load_templates():
+    with open(MOCK_INBOX, 'r') as f:
+        return json.load(f)
+
+
+def generate_emails(count, seed=0):
+    """Yield mock_inbox.json-shaped emails, varied so that no two are identical"""
+    rng = random.Random(seed)
+    templates = load_templates()
+    start = datetime(2024, 1, 1)
+
+    for i in range(count):
+        template = templates[i % len(templates)]
+        date = start + timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+        yield {
+            'id': f"synthetic-{i}",
+            'from': template['from'],
+            'subject': f"{template['subject']} #{i}",
+            'body': f"{template['body']}\n\nReference: {i}-{rng.randint(0, 10 ** 9)}",
+            'date': date.strftime('%Y-%m-%d %H:%M:%S')
+        }
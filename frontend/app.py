@@ -1,347 +1,561 @@
-import streamlit as st
-import requests
-import json
-from datetime import datetime
-
-# Configuration
-BACKEND_URL = "http://localhost:5000"
-
-def init_session_state():
-    if 'emails' not in st.session_state:
-        st.session_state.emails = []
-    if 'selected_email' not in st.session_state:
-        st.session_state.selected_email = None
-    if 'prompts' not in st.session_state:
-        st.session_state.prompts = {}
-    if 'chat_history' not in st.session_state:
-        st.session_state.chat_history = []
-
-def call_backend(endpoint, method='GET', data=None):
-    try:
-        url = f"{BACKEND_URL}{endpoint}"
-        if method == 'GET':
-            response = requests.get(url)
-        elif method == 'POST':
-            response = requests.post(url, json=data)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Backend error: {response.text}")
-            return None
-    except Exception as e:
-        st.error(f"Connection error: {str(e)}")
-        return None
-
-def load_emails():
-    result = call_backend('/api/emails')
-    if result:
-        st.session_state.emails = result
-
-def load_prompts():
-    result = call_backend('/api/prompts')
-    if result:
-        st.session_state.prompts = result
-
-def main():
-    st.set_page_config(
-        page_title="Email Productivity Agent",
-        page_icon="📧",
-        layout="wide"
-    )
-    
-    st.title("Email Productivity Agent")
-    st.markdown("---")
-    
-    init_session_state()
-    
-    # Load data on startup
-    if not st.session_state.emails:
-        load_emails()
-    if not st.session_state.prompts:
-        load_prompts()
-    
-    # Sidebar
-    with st.sidebar:
-        st.header("Navigation")
-        page = st.radio("Go to", ["Inbox", "Prompt Configuration", "Email Agent Chat", "Draft Composer"])
-        
-        st.markdown("---")
-        st.header("Actions")
-        
-        if st.button("Load Mock Inbox"):
-            result = call_backend('/api/emails/load-mock', 'POST')
-            if result:
-                st.success("Mock inbox loaded!")
-                load_emails()
-        
-        if st.button("Refresh Data"):
-            load_emails()
-            load_prompts()
-            st.success("Data refreshed!")
-    
-    # Main content based on selected page
-    if page == "Inbox":
-        show_inbox()
-    elif page == "Prompt Configuration":
-        show_prompt_config()
-    elif page == "Email Agent Chat":
-        show_email_agent()
-    elif page == "Draft Composer":
-        show_draft_composer()
-
-def show_inbox():
-    st.header("Email Inbox")
-    
-    if not st.session_state.emails:
-        st.info("No emails loaded. Click 'Load Mock Inbox' to get started.")
-        return
-    
-    # Email list
-    col1, col2 = st.columns([1, 2])
-    
-    with col1:
-        st.subheader("Emails")
-        for email in st.session_state.emails:
-            with st.container():
-                # Display email preview
-                is_selected = st.session_state.selected_email and st.session_state.selected_email['id'] == email['id']
-                
-                if st.button(
-                    f"**{email['subject']}**\n"
-                    f"From: {email['sender']}\n"
-                    f"Date: {email['date'][:16]}\n"
-                    f"Category: {email.get('category', 'Not processed')}",
-                    key=f"email_{email['id']}",
-                    use_container_width=True
-                ):
-                    st.session_state.selected_email = email
-                    st.rerun()
-    
-    with col2:
-        if st.session_state.selected_email:
-            show_email_detail(st.session_state.selected_email)
-
-def show_email_detail(email):
-    st.subheader(email['subject'])
-    
-    # Email metadata
-    st.write(f"From: {email['sender']}")
-    st.write(f"Date: {email['date']}")
-    st.write(f"Category: {email.get('category', 'Not categorized')}")
-    
-    # Processing actions
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        if st.button("Process Email"):
-            with st.spinner("Processing email..."):
-                result = call_backend(f"/api/emails/{email['id']}/process", 'POST', {'type': 'all'})
-                if result:
-                    st.success("Email processed!")
-                    load_emails()
-    
-    with col2:
-        if st.button("Extract Actions"):
-            with st.spinner("Extracting actions..."):
-                result = call_backend(f"/api/emails/{email['id']}/process", 'POST', {'type': 'actions'})
-                if result:
-                    st.success("Actions extracted!")
-                    load_emails()
-    
-    with col3:
-        if st.button("Generate Reply"):
-            with st.spinner("Generating draft..."):
-                result = call_backend("/api/drafts/generate", 'POST', {'email_id': email['id']})
-                if result:
-                    st.session_state.generated_draft = result
-                    st.success("Draft generated!")
-    
-    # Email body
-    st.markdown("---")
-    st.subheader("Email Content")
-    st.text_area("Body", email['body'], height=200, key=f"body_{email['id']}")
-    
-    # Processing results
-    if email.get('category'):
-        st.markdown("---")
-        st.subheader("Processing Results")
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.write("Summary:")
-            st.write(email.get('summary', 'No summary available'))
-        
-        with col2:
-            st.write("Action Items:")
-            actions = email.get('actions', {}).get('tasks', [])
-            if actions:
-                for i, action in enumerate(actions, 1):
-                    st.write(f"{i}. {action.get('task', 'Unknown task')}")
-                    if action.get('deadline'):
-                        st.write(f"   Deadline: {action['deadline']}")
-                    if action.get('priority'):
-                        st.write(f"   Priority: {action['priority']}")
-            else:
-                st.write("No action items found")
-
-def show_prompt_config():
-    st.header("Prompt Brain Configuration")
-    
-    if not st.session_state.prompts:
-        st.error("No prompts loaded")
-        return
-    
-    for prompt_name, prompt_data in st.session_state.prompts.items():
-        with st.expander(f"{prompt_name.replace('_', ' ').title()}"):
-            st.write(f"Description: {prompt_data['description']}")
-            
-            new_content = st.text_area(
-                f"Content for {prompt_name}",
-                value=prompt_data['content'],
-                height=200,
-                key=f"prompt_{prompt_name}"
-            )
-            
-            if st.button(f"Update {prompt_name}", key=f"update_{prompt_name}"):
-                result = call_backend('/api/prompts', 'POST', {
-                    'name': prompt_name,
-                    'content': new_content
-                })
-                if result:
-                    st.success(f"{prompt_name} updated successfully!")
-                    load_prompts()
-
-def show_email_agent():
-    st.header("Email Agent Chat")
-    
-    # Chat configuration
-    col1, col2 = st.columns([2, 1])
-    
-    with col1:
-        email_options = {email['id']: f"{email['subject']} - {email['sender']}" 
-                        for email in st.session_state.emails}
-        selected_email_id = st.selectbox(
-            "Select email to chat about (optional):",
-            options=[""] + list(email_options.keys()),
-            format_func=lambda x: "General inbox query" if x == "" else email_options[x]
-        )
-    
-    with col2:
-        st.write("")
-        st.write("")
-        if st.button("Clear Chat History"):
-            st.session_state.chat_history = []
-    
-    # Chat interface
-    st.markdown("---")
-    
-    # Display chat history
-    for message in st.session_state.chat_history:
-        with st.chat_message(message["role"]):
-            st.write(message["content"])
-    
-    # Chat input
-    if prompt := st.chat_input("Ask about your emails..."):
-        # Add user message to chat
-        st.session_state.chat_history.append({"role": "user", "content": prompt})
-        
-        with st.chat_message("user"):
-            st.write(prompt)
-        
-        # Get agent response
-        with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                response = call_backend('/api/chat', 'POST', {
-                    'email_id': selected_email_id if selected_email_id else None,
-                    'query': prompt
-                })
-                
-                if response and 'response' in response:
-                    st.write(response['response'])
-                    st.session_state.chat_history.append({
-                        "role": "assistant", 
-                        "content": response['response']
-                    })
-                else:
-                    st.error("Failed to get response from agent")
-
-def show_draft_composer():
-    st.header("Draft Composer")
-    
-    # Draft generation options
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.subheader("Generate from Email")
-        email_options = {email['id']: f"{email['subject']} - {email['sender']}" 
-                        for email in st.session_state.emails}
-        selected_email_id = st.selectbox(
-            "Select email to reply to:",
-            options=[""] + list(email_options.keys()),
-            format_func=lambda x: "New email" if x == "" else email_options[x]
-        )
-        
-        instructions = st.text_area(
-            "Additional instructions for draft generation:",
-            placeholder="E.g., 'Make it more formal', 'Ask for clarification on timeline', etc."
-        )
-        
-        if st.button("Generate Draft"):
-            with st.spinner("Generating draft..."):
-                result = call_backend("/api/drafts/generate", 'POST', {
-                    'email_id': selected_email_id if selected_email_id else None,
-                    'instructions': instructions
-                })
-                if result:
-                    st.session_state.current_draft = result
-                    st.success("Draft generated!")
-    
-    with col2:
-        st.subheader("Manual Draft")
-        manual_subject = st.text_input("Subject:", key="manual_subject")
-        manual_body = st.text_area("Body:", height=300, key="manual_body")
-        manual_to = st.text_input("To:", key="manual_to")
-        
-        if st.button("Save Manual Draft"):
-            if manual_subject and manual_body:
-                result = call_backend("/api/drafts", 'POST', {
-                    'subject': manual_subject,
-                    'body': manual_body,
-                    'to': manual_to
-                })
-                if result:
-                    st.success("Draft saved successfully!")
-            else:
-                st.error("Subject and body are required")
-    
-    # Display generated draft
-    if 'current_draft' in st.session_state:
-        st.markdown("---")
-        st.subheader("Generated Draft")
-        
-        draft = st.session_state.current_draft
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            edited_subject = st.text_input("Subject:", value=draft['subject'])
-            edited_to = st.text_input("To:", value=draft['to'])
-        
-        with col2:
-            edited_body = st.text_area("Body:", value=draft['body'], height=200)
-        
-        if st.button("Save Generated Draft"):
-            result = call_backend("/api/drafts", 'POST', {
-                'subject': edited_subject,
-                'body': edited_body,
-                'to': edited_to,
-                'in_reply_to': draft.get('in_reply_to')
-            })
-            if result:
-                st.success("Draft saved successfully!")
-                del st.session_state.current_draft
-
-if __name__ == "__main__":
+import streamlit as st
+import requests
+import json
+import time
+from datetime import datetime, timedelta
+
+# Configuration
+BACKEND_URL = "http://localhost:5000"
+EMAIL_PAGE_SIZE = 100
+# The inbox list only needs these columns; bodies are fetched per email
+EMAIL_LIST_FIELDS = "id,sender,subject,date,category,is_processed"
+JOB_POLL_INTERVAL = 0.5
+JOB_TIMEOUT = 300
+# GET responses kept for conditional requests (If-None-Match)
+HTTP_CACHE_SIZE = 200
+
+def init_session_state():
+    if 'emails' not in st.session_state:
+        st.session_state.emails = []
+    if 'emails_cursor' not in st.session_state:
+        st.session_state.emails_cursor = None
+    if 'emails_seq' not in st.session_state:
+        st.session_state.emails_seq = None
+    if 'selected_email' not in st.session_state:
+        st.session_state.selected_email = None
+    if 'prompts' not in st.session_state:
+        st.session_state.prompts = {}
+    if 'chat_history' not in st.session_state:
+        st.session_state.chat_history = []
+    if 'http_cache' not in st.session_state:
+        st.session_state.http_cache = {}
+
+@st.cache_resource
+def get_http_session():
+    """One keep-alive session for all backend calls, shared across reruns"""
+    return requests.Session()
+
+def call_backend(endpoint, method='GET', data=None):
+    try:
+        url = f"{BACKEND_URL}{endpoint}"
+        session = get_http_session()
+        if method == 'GET':
+            return cached_get(session, url)
+        elif method == 'POST':
+            response = session.post(url, json=data)
+        
+        if response.status_code in (200, 202):
+            return response.json()
+        else:
+            st.error(f"Backend error: {response.text}")
+            return None
+    except Exception as e:
+        st.error(f"Connection error: {str(e)}")
+        return None
+
+def cached_get(session, url):
+    """GET that revalidates a cached copy with its ETag, so unchanged data comes back as an empty 304"""
+    cache = st.session_state.http_cache
+    cached = cache.get(url)
+    headers = {'If-None-Match': cached[0]} if cached else {}
+    response = session.get(url, headers=headers)
+    
+    if response.status_code == 304 and cached:
+        # Parsed again on every hit, so callers can modify what they get back
+        return json.loads(cached[1])
+    if response.status_code not in (200, 202):
+        st.error(f"Backend error: {response.text}")
+        return None
+    
+    etag = response.headers.get('ETag')
+    if etag:
+        cache.pop(url, None)
+        if len(cache) >= HTTP_CACHE_SIZE:
+            cache.pop(next(iter(cache)))
+        cache[url] = (etag, response.content)
+    return response.json()
+
+def stream_backend(endpoint, data=None):
+    """POST to a Server-Sent Events endpoint and yield (event, payload) pairs as they arrive"""
+    try:
+        with get_http_session().post(f"{BACKEND_URL}{endpoint}", json=data, stream=True) as response:
+            if response.status_code != 200:
+                st.error(f"Backend error: {response.text}")
+                return
+            
+            event = 'message'
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    event = 'message'
+                elif line.startswith('event:'):
+                    event = line[len('event:'):].strip()
+                elif line.startswith('data:'):
+                    yield event, json.loads(line[len('data:'):].strip())
+    except Exception as e:
+        st.error(f"Connection error: {str(e)}")
+
+def render_stream(endpoint, data, placeholder):
+    """Render streamed deltas into a placeholder; returns the final 'done' payload"""
+    text = ""
+    for event, payload in stream_backend(endpoint, data):
+        if event == 'error':
+            st.error(payload.get('error', 'Streaming failed'))
+            return None
+        if event == 'done':
+            placeholder.markdown(text)
+            return payload
+        text += payload.get('delta', '')
+        placeholder.markdown(text + "▌")
+    return None
+
+def wait_for_job(job_id):
+    """Poll a background job until it finishes; returns its result or None"""
+    deadline = time.time() + JOB_TIMEOUT
+    while time.time() < deadline:
+        job = call_backend(f"/api/jobs/{job_id}")
+        if not job:
+            return None
+        if job['status'] == 'completed':
+            return job['result']
+        if job['status'] == 'failed':
+            st.error(f"Processing failed: {job.get('error')}")
+            return None
+        time.sleep(JOB_POLL_INTERVAL)
+    st.error("Processing is taking longer than expected; refresh later to see the results.")
+    return None
+
+def process_email_job(email_id, process_type):
+    job = call_backend(f"/api/emails/{email_id}/process", 'POST', {'type': process_type})
+    if job:
+        return wait_for_job(job['job_id'])
+    return None
+
+def fetch_email_page(cursor=None):
+    endpoint = f"/api/emails?limit={EMAIL_PAGE_SIZE}&fields={EMAIL_LIST_FIELDS}"
+    if cursor:
+        endpoint += f"&cursor={cursor}"
+    return call_backend(endpoint)
+
+def load_emails():
+    # Take the change sequence first, so changes made during the load are picked up by the next sync
+    changes = call_backend('/api/emails/changes')
+    result = fetch_email_page()
+    if result:
+        st.session_state.emails = result['emails']
+        st.session_state.emails_cursor = result['next_cursor']
+        st.session_state.emails_seq = changes['next_since'] if changes else None
+        refresh_selected_email()
+
+def email_sort_key(email):
+    return (email['date'] or '', email['id'])
+
+def sync_emails():
+    """Merge emails inserted, updated or deleted since the last load into the loaded list"""
+    if st.session_state.emails_seq is None:
+        load_emails()
+        return
+    
+    result = call_backend(f"/api/emails/changes?since={st.session_state.emails_seq}&fields={EMAIL_LIST_FIELDS}")
+    if not result:
+        return
+    if result['has_more']:
+        # Too much changed to merge; start over
+        load_emails()
+        return
+    
+    emails = {email['id']: email for email in st.session_state.emails}
+    # New emails older than the last loaded one belong to pages not loaded yet
+    oldest = min(map(email_sort_key, emails.values())) if st.session_state.emails_cursor and emails else None
+    changed_ids = set()
+    for change in result['changes']:
+        if change['op'] == 'delete':
+            emails.pop(change['id'], None)
+            changed_ids.add(change['id'])
+            continue
+        email = change['email']
+        changed_ids.add(email['id'])
+        if email['id'] in emails or oldest is None or email_sort_key(email) >= oldest:
+            emails[email['id']] = email
+    
+    st.session_state.emails = sorted(emails.values(), key=email_sort_key, reverse=True)
+    st.session_state.emails_seq = result['next_since']
+    
+    selected = st.session_state.selected_email
+    if selected and selected['id'] in changed_ids:
+        if selected['id'] in emails:
+            refresh_selected_email()
+        else:
+            st.session_state.selected_email = None
+
+def load_more_emails():
+    result = fetch_email_page(st.session_state.emails_cursor)
+    if result:
+        st.session_state.emails.extend(result['emails'])
+        st.session_state.emails_cursor = result['next_cursor']
+
+def load_email_detail(email_id):
+    return call_backend(f"/api/emails/{email_id}")
+
+def refresh_selected_email():
+    if st.session_state.get('selected_email'):
+        email = load_email_detail(st.session_state.selected_email['id'])
+        if email:
+            st.session_state.selected_email = email
+
+def load_prompts():
+    result = call_backend('/api/prompts')
+    if result:
+        st.session_state.prompts = result
+
+def main():
+    st.set_page_config(
+        page_title="Email Productivity Agent",
+        page_icon="📧",
+        layout="wide"
+    )
+    
+    st.title("Email Productivity Agent")
+    st.markdown("---")
+    
+    init_session_state()
+    
+    # Load data on startup
+    if not st.session_state.emails:
+        load_emails()
+    if not st.session_state.prompts:
+        load_prompts()
+    
+    # Sidebar
+    with st.sidebar:
+        st.header("Navigation")
+        page = st.radio("Go to", ["Inbox", "Tasks", "Prompt Configuration", "Email Agent Chat", "Draft Composer"])
+        
+        st.markdown("---")
+        st.header("Actions")
+        
+        if st.button("Load Mock Inbox"):
+            result = call_backend('/api/emails/load-mock', 'POST')
+            if result:
+                st.success("Mock inbox loaded!")
+                sync_emails()
+        
+        if st.button("Refresh Data"):
+            sync_emails()
+            load_prompts()
+            st.success("Data refreshed!")
+    
+    # Main content based on selected page
+    if page == "Inbox":
+        show_inbox()
+    elif page == "Tasks":
+        show_tasks()
+    elif page == "Prompt Configuration":
+        show_prompt_config()
+    elif page == "Email Agent Chat":
+        show_email_agent()
+    elif page == "Draft Composer":
+        show_draft_composer()
+
+def show_inbox():
+    st.header("Email Inbox")
+    
+    if not st.session_state.emails:
+        st.info("No emails loaded. Click 'Load Mock Inbox' to get started.")
+        return
+    
+    # Email list
+    col1, col2 = st.columns([1, 2])
+    
+    with col1:
+        st.subheader("Emails")
+        for email in st.session_state.emails:
+            with st.container():
+                # Display email preview
+                is_selected = st.session_state.selected_email and st.session_state.selected_email['id'] == email['id']
+                
+                if st.button(
+                    f"**{email['subject']}**\n"
+                    f"From: {email['sender']}\n"
+                    f"Date: {email['date'][:16]}\n"
+                    f"Category: {email.get('category', 'Not processed')}",
+                    key=f"email_{email['id']}",
+                    use_container_width=True
+                ):
+                    st.session_state.selected_email = load_email_detail(email['id'])
+                    st.rerun()
+        
+        if st.session_state.emails_cursor and st.button("Load More", use_container_width=True):
+            load_more_emails()
+            st.rerun()
+    
+    with col2:
+        if st.session_state.selected_email:
+            show_email_detail(st.session_state.selected_email)
+
+def show_email_detail(email):
+    st.subheader(email['subject'])
+    
+    # Email metadata
+    st.write(f"From: {email['sender']}")
+    st.write(f"Date: {email['date']}")
+    st.write(f"Category: {email.get('category', 'Not categorized')}")
+    
+    # Processing actions
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        if st.button("Process Email"):
+            with st.spinner("Processing email..."):
+                result = process_email_job(email['id'], 'all')
+                if result:
+                    st.success("Email processed!")
+                    sync_emails()
+    
+    with col2:
+        if st.button("Extract Actions"):
+            with st.spinner("Extracting actions..."):
+                result = process_email_job(email['id'], 'actions')
+                if result:
+                    st.success("Actions extracted!")
+                    sync_emails()
+    
+    with col3:
+        if st.button("Generate Reply"):
+            with st.spinner("Generating draft..."):
+                result = call_backend("/api/drafts/generate", 'POST', {'email_id': email['id']})
+                if result:
+                    st.session_state.generated_draft = result
+                    st.success("Draft generated!")
+    
+    # Email body
+    st.markdown("---")
+    st.subheader("Email Content")
+    st.text_area("Body", email['body'], height=200, key=f"body_{email['id']}")
+    
+    # Processing results
+    if email.get('category'):
+        st.markdown("---")
+        st.subheader("Processing Results")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.write("Summary:")
+            st.write(email.get('summary', 'No summary available'))
+        
+        with col2:
+            st.write("Action Items:")
+            actions = email.get('actions', {}).get('tasks', [])
+            if actions:
+                for i, action in enumerate(actions, 1):
+                    st.write(f"{i}. {action.get('task', 'Unknown task')}")
+                    if action.get('deadline'):
+                        st.write(f"   Deadline: {action['deadline']}")
+                    if action.get('priority'):
+                        st.write(f"   Priority: {action['priority']}")
+            else:
+                st.write("No action items found")
+
+def show_tasks():
+    st.header("Tasks")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        due = st.selectbox("Due", ["Any time", "Today", "Next 7 days", "Next 30 days"])
+    with col2:
+        priorities = st.multiselect("Priority", ["high", "medium", "low"])
+    with col3:
+        status = st.selectbox("Status", ["open", "done", "all"])
+    
+    endpoint = "/api/tasks?limit=100"
+    if due != "Any time":
+        days = {"Today": 0, "Next 7 days": 7, "Next 30 days": 30}[due]
+        today = datetime.now().date()
+        endpoint += f"&due_from={today.isoformat()}&due_to={(today + timedelta(days=days)).isoformat()}"
+    if priorities:
+        endpoint += f"&priority={','.join(priorities)}"
+    if status != "all":
+        endpoint += f"&status={status}"
+    
+    result = call_backend(endpoint)
+    if not result:
+        return
+    if not result['tasks']:
+        st.info("No tasks match these filters. Extract actions from emails to fill this list.")
+        return
+    
+    for task in result['tasks']:
+        col1, col2 = st.columns([5, 1])
+        with col1:
+            deadline = task['deadline'] or task['deadline_text'] or "No deadline"
+            st.write(f"**{task['task']}**")
+            st.caption(f"Due: {deadline} | Priority: {task['priority'] or 'unset'} | From: {task['email_subject']}")
+        with col2:
+            done = task['status'] == 'done'
+            if st.button("Reopen" if done else "Done", key=f"task_{task['id']}"):
+                call_backend(f"/api/tasks/{task['id']}/status", 'POST', {'status': 'open' if done else 'done'})
+                st.rerun()
+
+def show_prompt_config():
+    st.header("Prompt Brain Configuration")
+    
+    if not st.session_state.prompts:
+        st.error("No prompts loaded")
+        return
+    
+    for prompt_name, prompt_data in st.session_state.prompts.items():
+        with st.expander(f"{prompt_name.replace('_', ' ').title()}"):
+            st.write(f"Description: {prompt_data['description']}")
+            
+            new_content = st.text_area(
+                f"Content for {prompt_name}",
+                value=prompt_data['content'],
+                height=200,
+                key=f"prompt_{prompt_name}"
+            )
+            
+            if st.button(f"Update {prompt_name}", key=f"update_{prompt_name}"):
+                result = call_backend('/api/prompts', 'POST', {
+                    'name': prompt_name,
+                    'content': new_content
+                })
+                if result:
+                    st.success(f"{prompt_name} updated successfully!")
+                    load_prompts()
+    
+    st.subheader("Reprocess Inbox")
+    st.write("Re-run only the results whose prompt, model or email changed since they were produced.")
+    if st.button("Reprocess changed results"):
+        job = call_backend('/api/emails/process-batch', 'POST', {'incremental': True})
+        if job:
+            st.success(f"Reprocessing started for {job['total']} emails (job {job['id']})")
+
+def show_email_agent():
+    st.header("Email Agent Chat")
+    
+    # Chat configuration
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        email_options = {email['id']: f"{email['subject']} - {email['sender']}" 
+                        for email in st.session_state.emails}
+        selected_email_id = st.selectbox(
+            "Select email to chat about (optional):",
+            options=[""] + list(email_options.keys()),
+            format_func=lambda x: "General inbox query" if x == "" else email_options[x]
+        )
+    
+    with col2:
+        st.write("")
+        st.write("")
+        if st.button("Clear Chat History"):
+            st.session_state.chat_history = []
+    
+    # Chat interface
+    st.markdown("---")
+    
+    # Display chat history
+    for message in st.session_state.chat_history:
+        with st.chat_message(message["role"]):
+            st.write(message["content"])
+    
+    # Chat input
+    if prompt := st.chat_input("Ask about your emails..."):
+        # Add user message to chat
+        st.session_state.chat_history.append({"role": "user", "content": prompt})
+        
+        with st.chat_message("user"):
+            st.write(prompt)
+        
+        # Get agent response
+        with st.chat_message("assistant"):
+            response = render_stream('/api/chat/stream', {
+                'email_id': selected_email_id if selected_email_id else None,
+                'query': prompt
+            }, st.empty())
+            
+            if response and 'response' in response:
+                st.session_state.chat_history.append({
+                    "role": "assistant", 
+                    "content": response['response']
+                })
+            else:
+                st.error("Failed to get response from agent")
+
+def show_draft_composer():
+    st.header("Draft Composer")
+    
+    # Draft generation options
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.subheader("Generate from Email")
+        email_options = {email['id']: f"{email['subject']} - {email['sender']}" 
+                        for email in st.session_state.emails}
+        selected_email_id = st.selectbox(
+            "Select email to reply to:",
+            options=[""] + list(email_options.keys()),
+            format_func=lambda x: "New email" if x == "" else email_options[x]
+        )
+        
+        instructions = st.text_area(
+            "Additional instructions for draft generation:",
+            placeholder="E.g., 'Make it more formal', 'Ask for clarification on timeline', etc."
+        )
+        
+        if st.button("Generate Draft"):
+            result = render_stream("/api/drafts/generate/stream", {
+                'email_id': selected_email_id if selected_email_id else None,
+                'instructions': instructions
+            }, st.empty())
+            if result:
+                st.session_state.current_draft = result
+                st.success("Draft generated!")
+    
+    with col2:
+        st.subheader("Manual Draft")
+        manual_subject = st.text_input("Subject:", key="manual_subject")
+        manual_body = st.text_area("Body:", height=300, key="manual_body")
+        manual_to = st.text_input("To:", key="manual_to")
+        
+        if st.button("Save Manual Draft"):
+            if manual_subject and manual_body:
+                result = call_backend("/api/drafts", 'POST', {
+                    'subject': manual_subject,
+                    'body': manual_body,
+                    'to': manual_to
+                })
+                if result:
+                    st.success("Draft saved successfully!")
+            else:
+                st.error("Subject and body are required")
+    
+    # Display generated draft
+    if 'current_draft' in st.session_state:
+        st.markdown("---")
+        st.subheader("Generated Draft")
+        
+        draft = st.session_state.current_draft
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            edited_subject = st.text_input("Subject:", value=draft['subject'])
+            edited_to = st.text_input("To:", value=draft['to'])
+        
+        with col2:
+            edited_body = st.text_area("Body:", value=draft['body'], height=200)
+        
+        if st.button("Save Generated Draft"):
+            result = call_backend("/api/drafts", 'POST', {
+                'subject': edited_subject,
+                'body': edited_body,
+                'to': edited_to,
+                'in_reply_to': draft.get('in_reply_to')
+            })
+            if result:
+                st.success("Draft saved successfully!")
+                del st.session_state.current_draft
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,43 +1,72 @@
-import subprocess
-import sys
-import os
-import time
-
-def start_backend():
-    print("Starting backend server...")
-    backend_process = subprocess.Popen([
-        sys.executable, "backend/app.py"
-    ], cwd=os.getcwd())
-    return backend_process
-
-def start_frontend():
-    print("Starting frontend...")
-    time.sleep(2)
-    frontend_process = subprocess.Popen([
-        "streamlit", "run", "frontend/app.py"
-    ], cwd=os.getcwd())
-    return frontend_process
-
-if __name__ == "__main__":
-    print("Starting Email Productivity Agent...")
-    
-    backend_process = start_backend()
-    frontend_process = start_frontend()
-    
-    try:
-        print("Application started successfully!")
-        print("Backend: http://localhost:5000")
-        print("Frontend: http://localhost:8501")
-        print("\nPress Ctrl+C to stop the application")
-        
-        backend_process.wait()
-        frontend_process.wait()
-        
-    except KeyboardInterrupt:
-        print("\n Stopping application...")
-        backend_process.terminate()
-        frontend_process.terminate()
-        backend_process.wait()
-        frontend_process.wait()
-
-        print("Application stopped")
+import subprocess
+import sys
+import os
+import time
+
+def start_backend(server='flask', workers=1):
+    if server == 'asgi':
+        # Async chat/draft routes; the rest of the API is the same Flask app
+        print(f"Starting backend server (ASGI, {workers} worker(s))...")
+        return subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "asgi_app:app",
+            "--app-dir", "backend",
+            "--host", "127.0.0.1",
+            "--port", "5000",
+            "--workers", str(workers)
+        ], cwd=os.getcwd())
+    
+    print("Starting backend server...")
+    backend_process = subprocess.Popen([
+        sys.executable, "backend/app.py"
+    ], cwd=os.getcwd())
+    return backend_process
+
+def start_workers(count):
+    print(f"Starting {count} job worker(s)...")
+    return [
+        subprocess.Popen([sys.executable, "backend/worker.py"], cwd=os.getcwd())
+        for _ in range(count)
+    ]
+
+def start_frontend():
+    print("Starting frontend...")
+    time.sleep(2)
+    frontend_process = subprocess.Popen([
+        "streamlit", "run", "frontend/app.py"
+    ], cwd=os.getcwd())
+    return frontend_process
+
+if __name__ == "__main__":
+    print("Starting Email Productivity Agent...")
+    
+    server = os.getenv('BACKEND_SERVER', 'flask')
+    backend_workers = int(os.getenv('ASGI_WORKERS', '1')) if server == 'asgi' else 1
+    worker_count = int(os.getenv('WORKER_PROCESSES', '2'))
+    # Every backend and worker process enforces the LLM rate limits on its own; split them evenly
+    os.environ.setdefault('LLM_PROCESSES', str(backend_workers + worker_count))
+    
+    backend_process = start_backend(server=server, workers=backend_workers)
+    worker_processes = start_workers(worker_count)
+    frontend_process = start_frontend()
+    
+    try:
+        print("Application started successfully!")
+        print("Backend: http://localhost:5000")
+        print("Frontend: http://localhost:8501")
+        print("\nPress Ctrl+C to stop the application")
+        
+        backend_process.wait()
+        frontend_process.wait()
+        
+    except KeyboardInterrupt:
+        print("\n Stopping application...")
+        backend_process.terminate()
+        frontend_process.terminate()
+        for worker_process in worker_processes:
+            worker_process.terminate()
+        backend_process.wait()
+        frontend_process.wait()
+        for worker_process in worker_processes:
+            worker_process.wait()
+
+        print("Application stopped")
@@ -0,0 +1,77 @@
+import os
+import shutil
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    #An empty working directory with the data/ folder the backend writes to
+    (tmp_path / 'data').mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(scope='session')
+def backend_app(tmp_path_factory):
+    """The Flask app module, with its databases in a temporary directory.
+
+    The backend's data paths are relative, so the session stays in that
+    directory; tests using `workdir` return to it when they finish.
+    """
+    appdir = tmp_path_factory.mktemp('app')
+    (appdir / 'data').mkdir()
+    shutil.copy(os.path.join(ROOT, 'data', 'mock_inbox.json'), appdir / 'data')
+    os.chdir(appdir)
+
+    import app
+    return app
+
+
+@pytest.fixture
+def processor(workdir, monkeypatch):
+    """An EmailProcessor in workdir that answers from the stub model.
+
+    Rate limits and near-duplicate reuse are off, so every email gets its
+    own model calls.
+    """
+    from config import Config
+    from email_processor import EmailProcessor
+    from rate_limiter import LLMScheduler
+    from stub_llm import StubOpenAIClient
+
+    monkeypatch.setattr(Config, 'NEAR_DUPLICATE_REUSE', False)
+    processor = EmailProcessor()
+    processor.client = StubOpenAIClient()
+    processor.scheduler = LLMScheduler(requests_per_minute=10 ** 9, tokens_per_minute=10 ** 12)
+    yield processor
+    processor.db.close()
+
+
+@pytest.fixture
+def add_emails():
+    """Store `count` emails with distinct bodies (so none is served from the cache); returns their ids"""
+    from ingest import Ingester
+
+    def add(db, count, subject='Quarterly report'):
+        records = [
+            {
+                'id': f"email-{i}",
+                'message_id': None,
+                'from': f"sender{i}@example.com",
+                'subject': f"{subject} {i}",
+                'body': f"Please review section {i} of the quarterly report before the meeting.",
+                'date': '2024-01-15T10:00:00',
+                'in_reply_to': None,
+                'references': None,
+                'headers': None
+            }
+            for i in range(count)
+        ]
+        Ingester(db).ingest(records)
+        return [record['id'] for record in records]
+    return add
@@ -0,0 +1,76 @@
+from datetime import date
+import pytest
+from action_items import normalize_deadline, normalize_priority, task_rows
+
+# A Wednesday and a Friday
+WEDNESDAY = date(2024, 1, 17)
+FRIDAY = date(2024, 1, 19)
+
+
+@pytest.mark.parametrize('text, reference, expected', [
+    # Weekdays win over same-day words
+    ('EOD Thursday', WEDNESDAY, '2024-01-18'),
+    ('ASAP, by Friday', WEDNESDAY, '2024-01-19'),
+    ('end of day tomorrow', WEDNESDAY, '2024-01-18'),
+    ('EOD', WEDNESDAY, '2024-01-17'),
+    ('asap', WEDNESDAY, '2024-01-17'),
+    ('today', WEDNESDAY, '2024-01-17'),
+    # Abbreviations
+    ('thurs', WEDNESDAY, '2024-01-18'),
+    ('Thu.', WEDNESDAY, '2024-01-18'),
+    ('tues', WEDNESDAY, '2024-01-23'),
+    ('weds', FRIDAY, '2024-01-24'),
+    ('by Fri', WEDNESDAY, '2024-01-19'),
+    ('Monday', WEDNESDAY, '2024-01-22'),
+    # A weekday on that same day
+    ('Friday', FRIDAY, '2024-01-19'),
+    ('next Friday', FRIDAY, '2024-01-26'),
+    ('next friday', WEDNESDAY, '2024-01-19'),
+    # Relative phrases
+    ('next week', WEDNESDAY, '2024-01-26'),
+    ('end of week', WEDNESDAY, '2024-01-19'),
+    ('end of month', WEDNESDAY, '2024-01-31'),
+    ('in 3 days', WEDNESDAY, '2024-01-20'),
+    ('within 2 weeks', WEDNESDAY, '2024-01-31'),
+    # Dates, with and without a year
+    ('2024-02-05', WEDNESDAY, '2024-02-05'),
+    ('March 3rd', WEDNESDAY, '2024-03-03'),
+    ('3 March', WEDNESDAY, '2024-03-03'),
+    ('Feb 29', WEDNESDAY, '2024-02-29'),
+    ('Jan 5, 2025', WEDNESDAY, '2025-01-05'),
+    ('2/14', WEDNESDAY, '2024-02-14'),
+    ('2/14/25', WEDNESDAY, '2025-02-14'),
+    ('ASAP, by Feb 2', WEDNESDAY, '2024-02-02'),
+    # No day, or garbage
+    (None, WEDNESDAY, None),
+    ('', WEDNESDAY, None),
+    ('N/A', WEDNESDAY, None),
+    ('TBD', WEDNESDAY, None),
+    ('when you get a chance', WEDNESDAY, None),
+    ('2024-02-30', WEDNESDAY, None),
+    ('13/45', WEDNESDAY, None),
+    ('}{!!', WEDNESDAY, None),
+])
+def test_normalize_deadline(text, reference, expected):
+    assert normalize_deadline(text, reference) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('High', 'high'), (' urgent ', 'high'), ('normal', 'medium'), ('minor', 'low'), ('soon', None), (3, None)
+])
+def test_normalize_priority(value, expected):
+    assert normalize_priority(value) == expected
+
+
+def test_task_rows_skips_invalid_items():
+    actions = {'tasks': [
+        {'task': ' Send report ', 'deadline': 'EOD Thursday', 'priority': 'High'},
+        {'task': ''},
+        'not a task',
+        {'task': 'Book room', 'deadline': None}
+    ]}
+    assert task_rows(actions, '2024-01-17T09:30:00') == [
+        (0, 'Send report', '2024-01-18', 'EOD Thursday', 'high'),
+        (1, 'Book room', None, None, None)
+    ]
+    assert task_rows('garbage', '2024-01-17') == []
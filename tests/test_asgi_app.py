@@ -0,0 +1,169 @@
+import asyncio
+import json
+import pytest
+from stub_llm import AsyncStubOpenAIClient, NoCache, StubOpenAIClient
+
+
+@pytest.fixture
+def asgi(backend_app, monkeypatch):
+    """The ASGI app, recording which of its two apps handled each request"""
+    import asgi_app
+
+    processor = backend_app.email_processor
+    monkeypatch.setattr(processor, 'client', StubOpenAIClient())
+    monkeypatch.setattr(processor, 'async_client', AsyncStubOpenAIClient())
+    monkeypatch.setattr(processor, 'cache', NoCache())
+    backend_app.app.test_client().post('/api/emails/load-mock')
+
+    dispatcher = asgi_app.app
+    handled = []
+
+    def spy(name, inner):
+        async def app(scope, receive, send):
+            handled.append((name, scope['type']))
+            await inner(scope, receive, send)
+        return app
+
+    monkeypatch.setattr(dispatcher, 'async_app', spy('quart', dispatcher.async_app))
+    monkeypatch.setattr(dispatcher, 'wsgi_app', spy('flask', dispatcher.wsgi_app))
+    dispatcher.handled = handled
+    return dispatcher
+
+
+def request(app, method, path, body=None, headers=None):
+    """Send one HTTP request through an ASGI app; returns (status, headers, body).
+
+    body is sent as JSON: a dict is encoded, bytes are sent as they are.
+    """
+    raw_body = json.dumps(body).encode() if isinstance(body, dict) else (body or b'')
+    header_list = [(b'host', b'localhost')]
+    if body is not None:
+        header_list.append((b'content-type', b'application/json'))
+    header_list += [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': header_list, 'client': ('127.0.0.1', 1234), 'server': ('localhost', 5000), 'extensions': {}
+    }
+
+    async def run():
+        messages = []
+        done = asyncio.Event()
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': raw_body, 'more_body': False}
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body'):
+                done.set()
+
+        await asyncio.wait_for(app(scope, receive, send), timeout=10)
+        return messages
+
+    messages = asyncio.run(run())
+    start = next(message for message in messages if message['type'] == 'http.response.start')
+    response_headers = {name.decode().lower(): value.decode() for name, value in start['headers']}
+    content = b''.join(message.get('body', b'') for message in messages if message['type'] == 'http.response.body')
+    return start['status'], response_headers, content
+
+
+@pytest.mark.parametrize('method, path, app', [
+    ('POST', '/api/chat', 'quart'),
+    ('POST', '/api/chat/stream', 'quart'),
+    ('POST', '/api/drafts/generate', 'quart'),
+    ('POST', '/api/drafts/generate/stream', 'quart'),
+    # The same paths with other methods, and every other route, are the Flask app's
+    ('GET', '/api/chat', 'flask'),
+    ('OPTIONS', '/api/chat', 'flask'),
+    ('GET', '/api/emails?limit=5', 'flask'),
+    ('POST', '/api/drafts', 'flask'),
+    ('GET', '/api/unknown', 'flask'),
+])
+def test_requests_are_dispatched_by_method_and_path(asgi, method, path, app):
+    body = {'query': 'What is due?', 'email_id': '1'} if method == 'POST' else None
+    request(asgi, method, path, body)
+    assert asgi.handled == [(app, 'http')]
+
+
+def test_cors_preflight_is_answered_by_flask(asgi):
+    status, headers, _ = request(asgi, 'OPTIONS', '/api/chat/stream', headers={
+        'Origin': 'http://localhost:8501',
+        'Access-Control-Request-Method': 'POST',
+        'Access-Control-Request-Headers': 'content-type'
+    })
+    assert asgi.handled == [('flask', 'http')]
+    assert status == 200
+    assert headers['access-control-allow-origin'] in ('*', 'http://localhost:8501')
+    assert 'POST' in headers['access-control-allow-methods']
+
+
+def test_async_routes_send_cors_headers(asgi):
+    _, headers, _ = request(asgi, 'POST', '/api/chat', {'query': 'What is due?'}, headers={'Origin': 'http://localhost:8501'})
+    assert headers['access-control-allow-origin'] == '*'
+
+
+def test_lifespan_goes_to_quart(asgi):
+    async def run():
+        events = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return events.pop(0) if events else await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message['type'])
+
+        await asyncio.wait_for(asgi({'type': 'lifespan', 'asgi': {'version': '3.0'}}, receive, send), timeout=5)
+        return sent
+
+    assert asyncio.run(run()) == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+    assert asgi.handled == [('quart', 'lifespan')]
+
+
+@pytest.mark.parametrize('path, body', [
+    ('/api/chat', {'query': 'What is due?', 'email_id': '1'}),
+    ('/api/chat', {'query': 'Anything urgent?'}),
+    ('/api/chat', {'email_id': '1'}),
+    ('/api/chat', b'{not json'),
+    ('/api/chat', b'null'),
+    ('/api/drafts/generate', {'email_id': '1', 'instructions': 'Accept the invitation'}),
+    ('/api/drafts/generate', {'instructions': 'Ask for the agenda'}),
+    ('/api/drafts/generate', b'{not json'),
+])
+def test_async_routes_respond_like_the_flask_ones(asgi, backend_app, path, body):
+    flask_client = backend_app.app.test_client()
+    if isinstance(body, dict):
+        expected = flask_client.post(path, json=body)
+    else:
+        expected = flask_client.post(path, data=body, content_type='application/json')
+
+    status, headers, content = request(asgi, 'POST', path, body)
+
+    assert asgi.handled == [('quart', 'http')]
+    assert status == expected.status_code
+    assert headers['content-type'] == 'application/json'
+    data = json.loads(content)
+    if status == 200:
+        assert data == expected.get_json()
+    else:
+        assert set(data) == set(expected.get_json()) == {'error'}
+
+
+@pytest.mark.parametrize('path', ['/api/chat/stream', '/api/drafts/generate/stream'])
+def test_stream_routes_return_json_errors_before_streaming(asgi, backend_app, path):
+    status, headers, content = request(asgi, 'POST', path, b'{not json')
+    assert status == 500
+    assert headers['content-type'] == 'application/json'
+    assert 'error' in json.loads(content)
+
+    # The Flask versions answer the same way
+    response = backend_app.app.test_client().post(path, data=b'{not json', content_type='application/json')
+    assert response.status_code == 500 and 'error' in response.get_json()
@@ -0,0 +1,62 @@
+import os
+import threading
+import time
+import pytest
+from batch_processor import BatchProcessor
+
+EMAILS = 24
+CONCURRENCY = 8
+LATENCY = 0.2
+
+
+@pytest.fixture
+def batch(processor, add_emails):
+    processor.client.latency = LATENCY
+    add_emails(processor.db, EMAILS)
+    return BatchProcessor(processor.db, processor, max_concurrency=CONCURRENCY)
+
+
+def run_job(batch, **options):
+    job = batch.start_job(email_ids=batch.db.get_email_ids(), **options)
+    while job['status'] not in ('completed', 'failed'):
+        time.sleep(0.01)
+        job = batch.get_job(job['id'])
+    return job
+
+
+def test_model_calls_overlap_up_to_the_concurrency(batch):
+    start = time.perf_counter()
+    job = run_job(batch, process_type='categorize', concurrency=CONCURRENCY)
+    elapsed = time.perf_counter() - start
+
+    assert job['status'] == 'completed' and job['processed'] == EMAILS
+    assert batch.email_processor.client.requests == EMAILS
+    # About EMAILS / CONCURRENCY rounds of LATENCY each, far below one call after another
+    assert EMAILS / CONCURRENCY * LATENCY * 0.9 <= elapsed < EMAILS * LATENCY / 3
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='needs /proc to count file descriptors')
+def test_jobs_do_not_leak_connections(batch):
+    run_job(batch, process_type='categorize', concurrency=CONCURRENCY)
+    before = len(os.listdir('/proc/self/fd'))
+    for _ in range(3):
+        run_job(batch, process_type='categorize', concurrency=CONCURRENCY)
+    assert len(os.listdir('/proc/self/fd')) <= before + 2
+
+
+def test_pool_threads_keep_their_connections_for_the_whole_job(batch, monkeypatch):
+    import db_connection
+
+    opened = []
+    connect = db_connection.sqlite3.connect
+
+    def counting_connect(path, *args, **kwargs):
+        opened.append((threading.get_ident(), path))
+        return connect(path, *args, **kwargs)
+
+    monkeypatch.setattr(db_connection.sqlite3, 'connect', counting_connect)
+    job = run_job(batch, process_type='all', concurrency=CONCURRENCY)
+
+    assert job['processed'] == EMAILS
+    # Each thread opens each database once, however many emails it works on
+    assert opened and len(opened) == len(set(opened))
@@ -0,0 +1,121 @@
+import pytest
+from database import Database
+
+
+def test_rewriting_unchanged_values_logs_no_change(workdir, add_emails):
+    db = Database('data/emails.db')
+    add_emails(db, 3)
+    conn = db.connect()
+    seq, version = db.get_change_seq(), db.get_table_version('emails')
+
+    # Re-threading rewrites thread_id on every row, mostly to the value it already has
+    with conn:
+        conn.execute('UPDATE emails SET thread_id = thread_id, subject = subject')
+    assert db.get_change_seq() == seq
+    assert db.get_table_version('emails') == version
+
+    with conn:
+        conn.execute("UPDATE emails SET category = 'Work' WHERE id = 'email-1'")
+    changes, _, _ = db.get_email_changes(seq)
+    assert [(change['op'], change['email']['id']) for change in changes] == [('update', 'email-1')]
+    assert db.get_table_version('emails') > version
+    db.close()
+
+
+def test_null_to_value_is_a_change(workdir, add_emails):
+    db = Database('data/emails.db')
+    add_emails(db, 1)
+    conn = db.connect()
+    with conn:
+        conn.execute("UPDATE emails SET category = NULL")
+    seq = db.get_change_seq()
+
+    with conn:
+        conn.execute("UPDATE emails SET category = NULL")
+    assert db.get_change_seq() == seq
+    with conn:
+        conn.execute("UPDATE emails SET category = 'Work'")
+    assert db.get_change_seq() > seq
+    db.close()
+
+
+def test_update_trigger_without_comparison_is_replaced(workdir, add_emails):
+    db = Database('data/emails.db')
+    add_emails(db, 1)
+    conn = db.connect()
+    with conn:
+        conn.execute('DROP TRIGGER email_changes_update')
+        conn.execute('''
+            CREATE TRIGGER email_changes_update AFTER UPDATE OF thread_id ON emails BEGIN
+                INSERT OR REPLACE INTO email_changes (email_id, op) VALUES (new.id, 'update');
+            END
+        ''')
+    db.close()
+
+    db = Database('data/emails.db')
+    seq = db.get_change_seq()
+    conn = db.connect()
+    with conn:
+        conn.execute('UPDATE emails SET thread_id = thread_id')
+    assert db.get_change_seq() == seq
+    db.close()
+
+
+@pytest.fixture
+def client(backend_app, monkeypatch):
+    from stub_llm import NoCache, StubOpenAIClient
+
+    processor = backend_app.email_processor
+    monkeypatch.setattr(processor, 'client', StubOpenAIClient())
+    monkeypatch.setattr(processor, 'cache', NoCache())
+    client = backend_app.app.test_client()
+    client.post('/api/emails/load-mock')
+    return client
+
+
+def test_reprocessing_with_an_edited_prompt_changes_the_etag(client):
+    client.post('/api/emails/1/process', json={'sync': True})
+    response = client.get('/api/emails/1')
+    etag = response.headers['ETag']
+    assert client.get('/api/emails/1', headers={'If-None-Match': etag}).status_code == 304
+
+    original = client.get('/api/prompts').get_json()['summary']['content']
+    client.post('/api/prompts', json={'name': 'summary', 'content': original + '\nBe brief.'})
+    try:
+        client.post('/api/emails/1/process', json={'sync': True, 'type': 'summary', 'incremental': True})
+        updated = client.get('/api/emails/1', headers={'If-None-Match': etag})
+        assert updated.status_code == 200
+        assert updated.headers['ETag'] != etag
+        assert updated.get_json()['prompt_versions'] != response.get_json()['prompt_versions']
+    finally:
+        client.post('/api/prompts', json={'name': 'summary', 'content': original})
+
+
+@pytest.mark.parametrize('column, value', [
+    ('category_source', 'classifier'),
+    ('prompt_versions', '{"summary": 9}'),
+    ('headers', '{"X-Test": "1"}')
+])
+def test_served_columns_change_the_etags(client, backend_app, column, value):
+    email_etag = client.get('/api/emails/2').headers['ETag']
+    listing_etag = client.get('/api/emails').headers['ETag']
+
+    conn = backend_app.db.connect()
+    with conn:
+        conn.execute(f"UPDATE emails SET {column} = ? WHERE id = '2'", (value,))
+
+    email = client.get('/api/emails/2', headers={'If-None-Match': email_etag})
+    assert email.status_code == 200 and email.headers['ETag'] != email_etag
+    listing = client.get('/api/emails', headers={'If-None-Match': listing_etag})
+    assert listing.status_code == 200 and listing.headers['ETag'] != listing_etag
+
+
+def test_cache_columns_are_not_changes(workdir, add_emails):
+    db = Database('data/emails.db')
+    add_emails(db, 1)
+    seq = db.get_change_seq()
+    conn = db.connect()
+    with conn:
+        conn.execute("UPDATE emails SET clean_body = 'cleaned', clean_version = 99")
+    assert db.get_change_seq() == seq
+    db.close()
@@ -0,0 +1,142 @@
+import pytest
+from conversations import ConversationThreader, normalize_subject, parse_message_ids
+from database import Database
+from ingest import Ingester
+
+
+def record(email_id, subject, date, message_id=None, in_reply_to=None, references=None):
+    return {
+        'id': email_id,
+        'message_id': message_id,
+        'from': 'alice@example.com',
+        'subject': subject,
+        'body': f"Body of {email_id}",
+        'date': date,
+        'in_reply_to': in_reply_to,
+        'references': references,
+        'headers': None
+    }
+
+
+@pytest.fixture
+def db(workdir):
+    db = Database('data/emails.db')
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def threader(db):
+    return ConversationThreader(db, subject_window_days=30)
+
+
+@pytest.fixture
+def ingest(db, threader):
+    ingester = Ingester(db, threader=threader)
+
+    def ingest(*records):
+        ingester.ingest(list(records))
+    return ingest
+
+
+def thread_of(db, email_id):
+    return db.connect().execute('SELECT thread_id FROM emails WHERE id = ?', (email_id,)).fetchone()[0]
+
+
+def test_subjects_and_message_ids_are_normalized():
+    assert normalize_subject('RE: Fwd: [team-list] AW:  Budget   Review') == 'budget review'
+    assert normalize_subject(None) == ''
+    assert parse_message_ids('<a@example.com> <b@example.com>') == ['a@example.com', 'b@example.com']
+    assert parse_message_ids('a@example.com b@example.com') == ['a@example.com', 'b@example.com']
+    assert parse_message_ids(None) == []
+
+
+def test_replies_join_by_in_reply_to_and_references(db, threader, ingest):
+    ingest(
+        record('root', 'Budget', '2024-01-10 09:00:00', message_id='<root@example.com>'),
+        # Different subjects, so only the headers can link them
+        record('reply', 'Numbers attached', '2024-01-10 10:00:00', message_id='<reply@example.com>',
+               in_reply_to='<root@example.com>'),
+        record('deep', 'Final figures', '2024-01-10 11:00:00', message_id='<deep@example.com>',
+               references='<root@example.com> <reply@example.com>')
+    )
+    thread_id = thread_of(db, 'root')
+    assert thread_of(db, 'reply') == thread_of(db, 'deep') == thread_id
+    assert [email['id'] for email in threader.get_thread_emails(thread_id)] == ['root', 'reply', 'deep']
+
+    thread = threader.get_thread(thread_id)
+    assert (thread['message_count'], thread['first_date'], thread['last_date']) == (
+        3, '2024-01-10 09:00:00', '2024-01-10 11:00:00'
+    )
+
+
+def test_a_parent_arriving_after_its_reply_joins_the_thread(db, ingest):
+    ingest(record('reply', 'Re: Offsite', '2024-01-10 10:00:00', message_id='<reply@example.com>',
+                  in_reply_to='<root@example.com>'))
+    ingest(record('root', 'Offsite plans', '2024-01-10 09:00:00', message_id='<root@example.com>'))
+    assert thread_of(db, 'root') == thread_of(db, 'reply')
+
+
+def test_replies_without_headers_fall_back_to_the_subject(db, ingest):
+    ingest(record('root', 'Quarterly review', '2024-01-10 09:00:00'))
+    ingest(
+        record('reply', 'Re: [team] Quarterly  review', '2024-01-20 09:00:00'),
+        # Same subject but not a reply: a separate conversation
+        record('unrelated', 'Quarterly review', '2024-01-21 09:00:00'),
+        # A reply outside the subject window starts a new thread
+        record('late', 'Re: Quarterly review', '2024-06-01 09:00:00')
+    )
+    assert thread_of(db, 'reply') == thread_of(db, 'root')
+    assert thread_of(db, 'unrelated') != thread_of(db, 'root')
+    assert thread_of(db, 'late') not in (thread_of(db, 'root'), thread_of(db, 'unrelated'))
+
+
+def test_headers_take_precedence_over_the_subject(db, ingest):
+    ingest(
+        record('budget', 'Re: Budget', '2024-01-10 09:00:00', message_id='<budget@example.com>'),
+        record('offsite', 'Offsite', '2024-01-10 09:30:00', message_id='<offsite@example.com>')
+    )
+    ingest(record('reply', 'Re: Budget', '2024-01-10 10:00:00', in_reply_to='<offsite@example.com>'))
+    assert thread_of(db, 'reply') == thread_of(db, 'offsite')
+    assert thread_of(db, 'reply') != thread_of(db, 'budget')
+
+
+def test_a_linking_message_merges_two_threads(db, threader, ingest):
+    ingest(
+        record('a1', 'Launch checklist', '2024-01-10 09:00:00', message_id='<a1@example.com>'),
+        record('a2', 'Re: Launch checklist', '2024-01-10 10:00:00', message_id='<a2@example.com>',
+               in_reply_to='<a1@example.com>'),
+        record('b1', 'Press release', '2024-01-11 09:00:00', message_id='<b1@example.com>')
+    )
+    first, second = thread_of(db, 'a1'), thread_of(db, 'b1')
+    assert first != second
+    threader.save_summary(first, 'Checklist discussion', ['a1', 'a2'], 1)
+
+    ingest(record('link', 'Launch and press', '2024-01-12 09:00:00', message_id='<link@example.com>',
+                  references='<a2@example.com> <b1@example.com>'))
+
+    # The larger thread absorbs the smaller one
+    assert {thread_of(db, email_id) for email_id in ('a1', 'a2', 'b1', 'link')} == {first}
+    assert threader.get_thread(second) is None
+    thread = threader.get_thread(first)
+    assert (thread['message_count'], thread['last_date']) == (4, '2024-01-12 09:00:00')
+    # The summary covered only one of the merged threads
+    assert thread['summary'] is None
+
+    # Later replies to either side land in the merged thread
+    ingest(record('late', 'Re: Press release', '2024-01-13 09:00:00', in_reply_to='<b1@example.com>'))
+    assert thread_of(db, 'late') == first
+    assert db.connect().execute(
+        'SELECT COUNT(*) FROM thread_refs WHERE thread_id != ?', (first,)
+    ).fetchone()[0] == 0
+
+
+def test_rebuild_reproduces_the_threads(db, threader, ingest):
+    ingest(
+        record('root', 'Hiring', '2024-01-10 09:00:00', message_id='<root@example.com>'),
+        record('reply', 'Re: Hiring', '2024-01-10 10:00:00', in_reply_to='<root@example.com>'),
+        record('other', 'Lunch', '2024-01-10 11:00:00')
+    )
+    before = {email_id: thread_of(db, email_id) for email_id in ('root', 'reply', 'other')}
+    assert threader.rebuild() == 3
+    assert {email_id: thread_of(db, email_id) for email_id in before} == before
@@ -0,0 +1,84 @@
+import os
+import threading
+import pytest
+from db_connection import ConnectionManager, close_thread_connections
+
+FD_DIR = '/proc/self/fd'
+pytestmark = pytest.mark.skipif(not os.path.isdir(FD_DIR), reason='needs /proc to count file descriptors')
+
+
+def open_fds():
+    return len(os.listdir(FD_DIR))
+
+
+def on_new_thread(target, count):
+    #Run target once on each of `count` short-lived threads, as a thread-per-request server does
+    for _ in range(count):
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+
+
+def test_connections_of_finished_threads_are_closed(workdir):
+    manager = ConnectionManager('data/test.db')
+    manager.connect().execute('CREATE TABLE items (id INTEGER)')
+
+    def query():
+        manager.connect().execute('SELECT COUNT(*) FROM items').fetchone()
+
+    on_new_thread(query, 10)
+    before = open_fds()
+    on_new_thread(query, 200)
+
+    # At most the last thread's connection is still waiting to be closed
+    assert len(manager.connections) <= 2
+    assert open_fds() <= before + 3
+    manager.close_all()
+
+
+def test_close_thread_connections_closes_every_manager(workdir):
+    first = ConnectionManager('data/first.db')
+    second = ConnectionManager('data/second.db')
+    first.connect()
+    second.connect()
+
+    close_thread_connections()
+    assert first.connections == {} and second.connections == {}
+    assert first.connect() is not None
+
+
+def test_fd_count_stays_flat_across_requests(backend_app):
+    client = backend_app.app.test_client()
+    paths = ['/api/emails?limit=10', '/api/tasks', '/api/stats', '/api/prompts', '/api/cache/stats']
+
+    def request():
+        for path in paths:
+            assert client.get(path).status_code == 200
+
+    on_new_thread(request, 10)
+    before = open_fds()
+    on_new_thread(request, 200)
+    assert open_fds() <= before + 3
+
+
+def test_requests_on_one_thread_reuse_its_connections(backend_app, monkeypatch):
+    import db_connection
+
+    client = backend_app.app.test_client()
+    paths = ['/api/emails?limit=10', '/api/tasks', '/api/stats', '/api/prompts']
+    for path in paths:
+        client.get(path)
+    conn = backend_app.db.connect()
+
+    opened = []
+    connect = db_connection.sqlite3.connect
+
+    def counting_connect(*args, **kwargs):
+        opened.append(args[0])
+        return connect(*args, **kwargs)
+
+    monkeypatch.setattr(db_connection.sqlite3, 'connect', counting_connect)
+    for path in paths * 2:
+        assert client.get(path).status_code == 200
+    assert opened == []
+    assert backend_app.db.connect() is conn
@@ -0,0 +1,66 @@
+import json
+import pytest
+from email_processor import EmailProcessor
+from stub_llm import StubOpenAIClient
+
+TASKS = [{'task': 'Send the report', 'deadline': 'Friday', 'priority': 'high'}]
+
+
+@pytest.mark.parametrize('response, expected', [
+    (json.dumps({'category': 'Important', 'actions': {'tasks': TASKS}, 'summary': '- Report due'}),
+     {'category': 'Important', 'actions': {'tasks': TASKS}, 'summary': '- Report due'}),
+    # A bare task list and a list of summary lines are accepted
+    ('Result: ' + json.dumps({'category': ' Spam ', 'actions': TASKS, 'summary': ['One', 'Two']}),
+     {'category': 'Spam', 'actions': {'tasks': TASKS}, 'summary': '- One\n- Two'}),
+    # Invalid fields are dropped, for the caller to re-run on their own
+    (json.dumps({'category': 42, 'actions': {'tasks': TASKS}, 'summary': 42}), {'actions': {'tasks': TASKS}}),
+    (json.dumps({'category': 'Spam', 'actions': {'tasks': ['do it']}, 'summary': '  '}), {'category': 'Spam'}),
+    (json.dumps({'category': 'x' * 51, 'actions': 'none', 'summary': None}), {}),
+    # Not a JSON object
+    ('Important. Send the report. Report due.', {}),
+    (json.dumps(['Important', TASKS, 'Report due']), {}),
+    ('{"category": "Important", "summary": ', {}),
+])
+def test_parse_fused_response(response, expected):
+    assert EmailProcessor.parse_fused_response(response) == expected
+
+
+class ProseFusedReplies(StubOpenAIClient):
+    """The stub model, except that fused requests get a reply that is not JSON"""
+
+    def reply(self, prompt):
+        if 'single JSON object' in prompt:
+            return 'Sorry, I cannot help with that.'
+        return super().reply(prompt)
+
+
+@pytest.fixture
+def email(processor, add_emails):
+    email_id = add_emails(processor.db, 1)[0]
+    return processor.db.get_email(email_id)
+
+
+def test_fused_processing_makes_one_request(processor, email):
+    results = processor.process_email(email, 'all', fused=True)
+    assert processor.client.requests == 1
+    assert results['category'] == 'Important'
+    assert results['actions']['tasks'] and results['summary']
+
+
+def test_invalid_fused_field_is_rerun_on_its_own(processor, email):
+    # Every fused reply has an unusable summary
+    processor.client.malformed_rate = 1.0
+    results = processor.process_email(email, 'all', fused=True)
+
+    assert processor.client.requests == 2
+    assert processor.client.malformed_replies == 1
+    assert isinstance(results['summary'], str) and results['summary']
+    assert results['category'] == 'Important' and results['actions']['tasks']
+
+
+def test_unparseable_fused_reply_falls_back_to_split_requests(processor, email):
+    processor.client = ProseFusedReplies()
+    results = processor.process_email(email, 'all', fused=True)
+
+    assert processor.client.requests == 1 + 3
+    assert set(results) >= {'category', 'actions', 'summary'}
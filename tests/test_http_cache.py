@@ -0,0 +1,95 @@
+import gzip
+import pytest
+from config import Config
+
+
+@pytest.fixture
+def client(backend_app):
+    client = backend_app.app.test_client()
+    client.post('/api/emails/load-mock')
+    return client
+
+
+@pytest.mark.parametrize('path', ['/api/emails', '/api/emails?limit=5', '/api/emails/3', '/api/prompts'])
+def test_matching_etag_gets_304(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    cached = client.get(path, headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+    assert cached.get_data() == b''
+    assert cached.headers['ETag'] == response.headers['ETag']
+
+
+def test_email_change_gets_200_with_new_etag(client, backend_app):
+    listing = client.get('/api/emails?limit=5')
+    email = client.get('/api/emails/3')
+
+    conn = backend_app.db.connect()
+    with conn:
+        conn.execute("UPDATE emails SET category = 'Changed' WHERE id = '3'")
+
+    for path, before in (('/api/emails?limit=5', listing), ('/api/emails/3', email)):
+        response = client.get(path, headers={'If-None-Match': before.headers['ETag']})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != before.headers['ETag']
+    assert client.get('/api/emails/3').get_json()['category'] == 'Changed'
+
+
+def test_prompt_change_gets_200_with_new_etag(client):
+    before = client.get('/api/prompts')
+    content = before.get_json()['summary']['content']
+    client.post('/api/prompts', json={'name': 'summary', 'content': content + ' Keep it short.'})
+    try:
+        response = client.get('/api/prompts', headers={'If-None-Match': before.headers['ETag']})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != before.headers['ETag']
+    finally:
+        client.post('/api/prompts', json={'name': 'summary', 'content': content})
+
+
+def test_new_default_prompt_changes_the_prompts_etag(client, backend_app):
+    before = client.get('/api/prompts')
+    with backend_app.db.connect() as conn:
+        conn.execute("INSERT INTO prompts (name, content) VALUES ('test_only', 'Added by a newer release')")
+    try:
+        assert client.get('/api/prompts', headers={'If-None-Match': before.headers['ETag']}).status_code == 200
+    finally:
+        with backend_app.db.connect() as conn:
+            conn.execute("DELETE FROM prompts WHERE name = 'test_only'")
+
+
+def test_if_modified_since_gets_304(client):
+    response = client.get('/api/emails')
+    cached = client.get('/api/emails', headers={'If-Modified-Since': response.headers['Last-Modified']})
+    assert cached.status_code == 304
+
+
+def test_gzip_response(client):
+    plain = client.get('/api/emails')
+    response = client.get('/api/emails', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+    # A strong ETag names one byte sequence, so the compressed body has its own
+    assert response.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+    # Either tag validates the client's copy
+    cached = client.get('/api/emails', headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+
+
+def test_no_compression_below_threshold(client):
+    path = '/api/emails?limit=1&fields=id'
+    response = client.get(path, headers={'Accept-Encoding': 'gzip'})
+    assert len(response.get_data()) < Config.RESPONSE_COMPRESSION_MIN_BYTES
+    assert 'Content-Encoding' not in response.headers
+    # Still varies: a larger page of the same listing would be compressed
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+
+def test_no_compression_without_accept_encoding(client):
+    response = client.get('/api/emails')
+    assert len(response.get_data()) >= Config.RESPONSE_COMPRESSION_MIN_BYTES
+    assert 'Content-Encoding' not in response.headers
@@ -0,0 +1,132 @@
+import pytest
+from database import Database
+from ingest import Ingester
+
+
+def record(email_id, sender='alice@example.com'):
+    return {
+        'id': email_id,
+        'message_id': None,
+        'from': sender,
+        'subject': f"Subject of {email_id}",
+        'body': 'Body',
+        'date': '2024-01-15 10:00:00',
+        'in_reply_to': None,
+        'references': None,
+        'headers': None
+    }
+
+
+def actions(*tasks):
+    return {'tasks': [{'task': task, 'priority': priority} for task, priority in tasks]}
+
+
+@pytest.fixture
+def db(workdir):
+    db = Database('data/emails.db')
+    Ingester(db).ingest([
+        record('1'), record('2'), record('3', sender='bob@example.com'), record('4', sender='carol@example.com')
+    ])
+    db.update_email_processing('1', {'category': 'Work', 'actions': actions(('Send the report', 'high'), ('Book a room', None))})
+    db.update_email_processing('2', {'category': 'Personal', 'actions': actions(('Buy a gift', 'low'))})
+    yield db
+    db.close()
+
+
+def assert_consistent(db):
+    assert db.check_inbox_stats() == {'consistent': True, 'differences': [], 'repaired': False}
+
+
+def execute(db, sql, *params):
+    conn = db.connect()
+    with conn:
+        conn.execute(sql, params)
+
+
+def test_stats_after_inserts_and_processing(db):
+    assert_consistent(db)
+    stats = db.get_inbox_stats()
+    assert (stats['emails'], stats['processed'], stats['unprocessed'], stats['uncategorized']) == (4, 2, 2, 2)
+    assert stats['categories'] == {'Work': 1, 'Personal': 1}
+    assert stats['tasks'] == {'by_status': {'open': 3}, 'open_by_priority': {'high': 1, 'low': 1, 'unset': 1}}
+    assert stats['top_senders'][0] == {'sender': 'alice@example.com', 'count': 2}
+    assert len(db.get_inbox_stats(top_senders=1)['top_senders']) == 1
+
+
+@pytest.mark.parametrize('change', [
+    lambda db: execute(db, "UPDATE emails SET category = 'Work' WHERE id = '2'"),
+    lambda db: execute(db, "UPDATE emails SET category = NULL WHERE id = '1'"),
+    lambda db: execute(db, "UPDATE emails SET sender = 'dave@example.com' WHERE id = '1'"),
+    lambda db: execute(db, "UPDATE emails SET is_processed = FALSE WHERE id = '1'"),
+    lambda db: execute(db, "UPDATE emails SET is_processed = TRUE"),
+    lambda db: execute(db, "DELETE FROM emails WHERE id = '1'"),
+    lambda db: execute(db, "DELETE FROM emails"),
+    lambda db: execute(db, '''
+        INSERT OR REPLACE INTO emails (id, sender, subject, body, date, category)
+        VALUES ('2', 'erin@example.com', 'Replaced', 'Body', '2024-01-16 10:00:00', 'Newsletter')
+    '''),
+    lambda db: db.update_email_processing('3', {'category': 'Work', 'actions': actions(('Reply', 'medium'))}),
+    # Re-extraction replaces the email's tasks
+    lambda db: db.update_email_processing('1', {'actions': actions(('Send the report', 'low'))}),
+    lambda db: execute(db, "UPDATE tasks SET status = 'done' WHERE task = 'Send the report'"),
+    lambda db: execute(db, "UPDATE tasks SET priority = 'low' WHERE task = 'Book a room'"),
+    lambda db: execute(db, "DELETE FROM tasks WHERE task = 'Buy a gift'")
+], ids=[
+    'recategorize', 'uncategorize', 'sender', 'unprocess', 'process-all', 'delete', 'delete-all', 'replace',
+    'process', 'reextract', 'task-status', 'task-priority', 'task-delete'
+])
+def test_triggers_keep_stats_consistent(db, change):
+    change(db)
+    assert_consistent(db)
+
+
+def test_status_changes_move_open_priorities(db):
+    task_id = db.list_tasks(priorities=['high'])[0][0]['id']
+    db.update_task_status(task_id, 'done')
+    tasks = db.get_inbox_stats()['tasks']
+    assert tasks == {'by_status': {'open': 2, 'done': 1}, 'open_by_priority': {'low': 1, 'unset': 1}}
+
+
+def test_repair_fixes_drift(db):
+    execute(db, "UPDATE inbox_stats SET value = value + 5 WHERE metric = 'category' AND key = 'Work'")
+    execute(db, "DELETE FROM inbox_stats WHERE metric = 'sender' AND key = 'bob@example.com'")
+
+    report = db.check_inbox_stats()
+    assert not report['consistent'] and not report['repaired']
+    assert report['differences'] == [
+        {'metric': 'category', 'key': 'Work', 'stored': 6, 'actual': 1},
+        {'metric': 'sender', 'key': 'bob@example.com', 'stored': 0, 'actual': 1}
+    ]
+    # Checking alone changes nothing
+    assert db.get_inbox_stats()['categories']['Work'] == 6
+
+    assert db.check_inbox_stats(repair=True)['repaired']
+    assert_consistent(db)
+    assert db.get_inbox_stats()['categories']['Work'] == 1
+
+
+def test_stats_are_built_for_an_existing_inbox(workdir):
+    db = Database('data/emails.db')
+    Ingester(db).ingest([record('1'), record('2', sender='bob@example.com')])
+    execute(db, 'DROP TABLE inbox_stats')
+    db.close()
+
+    db = Database('data/emails.db')
+    assert_consistent(db)
+    assert db.get_inbox_stats()['emails'] == 2
+    db.close()
+
+
+def test_api(backend_app):
+    client = backend_app.app.test_client()
+    client.post('/api/emails/load-mock')
+    assert client.get('/api/stats/check').get_json()['consistent']
+    assert client.get('/api/stats').get_json()['emails'] == len(backend_app.db.get_email_ids())
+    assert client.get('/api/stats', query_string={'top_senders': 'many'}).status_code == 400
+
+    execute(backend_app.db, "UPDATE inbox_stats SET value = value + 1 WHERE metric = 'emails'")
+    # GET only reports; POST with repair rebuilds
+    assert not client.get('/api/stats/check').get_json()['repaired']
+    assert not client.post('/api/stats/check', json={}).get_json()['repaired']
+    assert client.post('/api/stats/check', json={'repair': True}).get_json()['repaired']
+    assert client.get('/api/stats/check').get_json() == {'consistent': True, 'differences': [], 'repaired': False}
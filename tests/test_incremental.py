@@ -0,0 +1,104 @@
+import time
+import pytest
+from batch_processor import BatchProcessor
+from stub_llm import NoCache
+
+# System message of each sub-task's request
+TASK_SYSTEMS = {
+    'You are an email categorization assistant.': 'categorize',
+    'You are an action item extraction assistant.': 'actions',
+    'You are an email summarization assistant.': 'summary'
+}
+
+
+@pytest.fixture
+def calls(processor, monkeypatch):
+    """Sub-tasks sent to the stub model, in order"""
+    calls = []
+    create = processor.client.create
+
+    def recording_create(model, messages, **kwargs):
+        calls.append(TASK_SYSTEMS.get(messages[0]['content'], messages[0]['content']))
+        return create(model, messages, **kwargs)
+
+    monkeypatch.setattr(processor.client.chat.completions, 'create', recording_create)
+    processor.cache = NoCache()
+    return calls
+
+
+def process(processor, email_id, **options):
+    result = processor.process_email(processor.db.get_email(email_id), **options)
+    processor.db.update_email_processing(email_id, result)
+    return result
+
+
+def test_unchanged_email_makes_no_calls(processor, calls, add_emails):
+    email_id, = add_emails(processor.db, 1)
+    process(processor, email_id)
+    assert sorted(calls) == ['actions', 'categorize', 'summary']
+
+    calls.clear()
+    process(processor, email_id, incremental=True)
+    assert calls == []
+
+
+def test_prompt_edit_reruns_only_its_task(processor, calls, add_emails):
+    email_id, = add_emails(processor.db, 1)
+    process(processor, email_id)
+    before = processor.db.get_email(email_id)
+
+    processor.db.update_prompt('summary', 'Summarize in one line.')
+    calls.clear()
+    result = process(processor, email_id, incremental=True)
+    assert calls == ['summary']
+    assert set(result['fingerprints']) == {'summary'}
+
+    after = processor.db.get_email(email_id)
+    assert after['prompt_versions']['summary'] == before['prompt_versions']['summary'] + 1
+    # The other results and their provenance are kept
+    assert after['fingerprints']['category'] == before['fingerprints']['category']
+    assert after['fingerprints']['actions'] == before['fingerprints']['actions']
+    assert after['fingerprints']['summary'] != before['fingerprints']['summary']
+
+    calls.clear()
+    process(processor, email_id, incremental=True)
+    assert calls == []
+
+
+def test_content_change_reruns_every_task(processor, calls, add_emails):
+    email_id, = add_emails(processor.db, 1)
+    process(processor, email_id)
+
+    with processor.db.connect() as conn:
+        conn.execute("UPDATE emails SET body = 'Rescheduled: the review moves to Monday.' WHERE id = ?", (email_id,))
+    calls.clear()
+    process(processor, email_id, incremental=True)
+    assert sorted(calls) == ['actions', 'categorize', 'summary']
+
+
+def test_incremental_batch_skips_current_emails(processor, calls, add_emails):
+    email_ids = add_emails(processor.db, 4)
+    batch = BatchProcessor(processor.db, processor)
+
+    def run(**options):
+        job = batch.start_job(email_ids=email_ids, **options)
+        while job['status'] not in ('completed', 'failed'):
+            time.sleep(0.01)
+            job = batch.get_job(job['id'])
+        return job
+
+    run()
+    processor.db.update_prompt('categorization', 'Pick exactly one category.')
+    with processor.db.connect() as conn:
+        conn.execute("UPDATE emails SET subject = 'Changed subject' WHERE id = ?", (email_ids[0],))
+
+    calls.clear()
+    job = run(incremental=True)
+    # Every email's category is stale; only the edited email needs the rest again
+    assert sorted(calls) == ['actions'] + ['categorize'] * 4 + ['summary']
+    assert (job['processed'], job['skipped']) == (4, 0)
+
+    calls.clear()
+    job = run(incremental=True)
+    assert calls == []
+    assert (job['processed'], job['skipped']) == (0, 4)
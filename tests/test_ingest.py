@@ -0,0 +1,164 @@
+import io
+import json
+import os
+import pytest
+from config import Config
+from database import Database
+from ingest import Ingester, iter_jsonl_records, iter_mbox, iter_mbox_records
+
+
+def message(number, message_id=None, body=None):
+    message_id = message_id or f"msg-{number}@example.com"
+    return (
+        f"From sender{number}@example.com Mon Jan 15 10:00:00 2024\n"
+        f"Message-ID: <{message_id}>\n"
+        f"From: Sender {number} <sender{number}@example.com>\n"
+        f"Subject: Message {number}\n"
+        f"Date: Mon, 15 Jan 2024 10:{number:02d}:00 +0000\n"
+        "\n"
+        f"{body or f'Body of message {number}.'}\n"
+        "\n"
+    )
+
+
+@pytest.fixture
+def db(workdir):
+    db = Database('data/emails.db')
+    yield db
+    db.close()
+
+
+def write(path, text):
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_mbox_messages_are_split_on_from_lines(workdir):
+    body = "Quoted:\n>From the minutes of the meeting\nFrom here on, it is plain text."
+    path = write(workdir / 'inbox.mbox', message(1) + message(2, body=body) + message(3))
+
+    records = list(iter_mbox_records(path))
+    assert [record['subject'] for record in records] == ['Message 1', 'Message 2', 'Message 3']
+    assert records[0]['id'] == records[0]['message_id'] == 'msg-1@example.com'
+    assert records[0]['date'] == '2024-01-15 10:01:00'
+    # mboxrd un-escaping, and a "From " line inside a paragraph is not a separator
+    assert 'From the minutes of the meeting\nFrom here on' in records[1]['body']
+
+
+def test_large_mbox_messages_are_truncated(workdir):
+    path = write(workdir / 'inbox.mbox', message(1, body='x' * 5000) + message(2))
+
+    raw = list(iter_mbox(path, max_message_bytes=1024))
+    assert len(raw) == 2
+    assert len(raw[0]) <= 1024
+    assert b'Subject: Message 2' in raw[1]
+
+
+def test_mbox_is_read_lazily(workdir, monkeypatch):
+    data = ''.join(message(i) for i in range(1, 4)).encode()
+    lines_read = []
+
+    class CountingFile(io.BytesIO):
+        def __iter__(self):
+            for line in data.splitlines(keepends=True):
+                lines_read.append(line)
+                yield line
+
+    monkeypatch.setattr('builtins.open', lambda *args, **kwargs: CountingFile())
+    first = next(iter_mbox('inbox.mbox'))
+    assert b'Message 1' in first
+    # Only read up to the second message's separator
+    assert len(lines_read) < len(data.splitlines()) / 2
+
+
+def test_malformed_jsonl_lines_are_skipped(workdir):
+    lines = [
+        json.dumps({'id': 'a', 'sender': 'a@example.com', 'subject': 'First', 'body': 'One'}),
+        '{"id": "broken", "subject": ',
+        '["not", "an", "object"]',
+        '',
+        json.dumps({'id': 'b', 'from': 'b@example.com', 'subject': 'Second', 'body': 'Two', 'message_id': '<b@example.com>'})
+    ]
+    path = write(workdir / 'inbox.jsonl', '\n'.join(lines) + '\n')
+
+    records = list(iter_jsonl_records(path))
+    assert [record['id'] for record in records] == ['a', 'b']
+    assert records[0]['from'] == 'a@example.com'
+    assert records[1]['message_id'] == 'b@example.com'
+
+
+def test_ingest_writes_batches_and_skips_duplicates(db, workdir):
+    path = write(workdir / 'inbox.mbox', ''.join(message(i) for i in range(1, 6)))
+    progress = []
+
+    stats = Ingester(db, batch_size=2).ingest(iter_mbox_records(path), progress=progress.append)
+    assert stats == {'read': 5, 'inserted': 5, 'duplicates': 0}
+    # After each full batch, and once at the end
+    assert [update['read'] for update in progress] == [2, 4, 5]
+
+    stats = Ingester(db, batch_size=2).ingest(iter_mbox_records(path))
+    assert stats == {'read': 5, 'inserted': 0, 'duplicates': 5}
+    assert len(db.get_email_ids()) == 5
+
+
+def test_ingest_dedupes_on_message_id(db, workdir):
+    write(workdir / 'inbox.mbox', message(1, message_id='shared@example.com'))
+    Ingester(db).ingest(iter_mbox_records(str(workdir / 'inbox.mbox')))
+
+    # The same message exported again under another id
+    line = json.dumps({'id': 'other-id', 'message_id': '<shared@example.com>', 'subject': 'Message 1', 'body': 'Again'})
+    path = write(workdir / 'inbox.jsonl', line + '\n')
+    stats = Ingester(db).ingest(iter_jsonl_records(path))
+
+    assert stats == {'read': 1, 'inserted': 0, 'duplicates': 1}
+    assert db.get_email('other-id') is None
+
+
+@pytest.fixture
+def import_worker(backend_app, monkeypatch):
+    from stub_llm import StubOpenAIClient
+    from worker import Worker
+
+    monkeypatch.setattr(backend_app.email_processor, 'client', StubOpenAIClient())
+    return Worker(db=backend_app.db, email_processor=backend_app.email_processor, queue=backend_app.job_queue)
+
+
+def run_job(worker, job_id):
+    while worker.queue.get_job(job_id)['status'] not in ('completed', 'failed'):
+        assert worker.run_once()
+    return worker.queue.get_job(job_id)
+
+
+def list_imports():
+    return os.listdir(Config.IMPORT_DIR) if os.path.isdir(Config.IMPORT_DIR) else []
+
+
+def test_uploads_are_deleted_after_their_import(backend_app, import_worker):
+    client = backend_app.app.test_client()
+    mbox = (message(71, message_id='upload-71@example.com') + message(72, message_id='upload-72@example.com')).encode()
+    response = client.post('/api/emails/import', data={'file': (io.BytesIO(mbox), 'inbox.mbox')})
+    assert response.status_code == 202
+
+    job = run_job(import_worker, response.get_json()['job_id'])
+    assert job['status'] == 'completed'
+    assert job['result']['inserted'] == 2
+    assert backend_app.db.get_email('upload-71@example.com') is not None
+    assert not any(name.endswith('inbox.mbox') for name in list_imports())
+
+
+def test_rejected_uploads_are_not_kept(backend_app):
+    client = backend_app.app.test_client()
+    response = client.post('/api/emails/import', data={'file': (io.BytesIO(b'a,b\n'), 'inbox.csv'), 'format': 'csv'})
+    assert response.status_code == 400
+    assert not any(name.endswith('inbox.csv') for name in list_imports())
+
+
+def test_files_already_in_the_import_directory_are_kept(backend_app, import_worker):
+    os.makedirs(Config.IMPORT_DIR, exist_ok=True)
+    path = os.path.join(Config.IMPORT_DIR, 'kept.jsonl')
+    with open(path, 'w') as f:
+        f.write(json.dumps({'id': 'kept-1', 'subject': 'Kept', 'body': 'Imported from the import directory'}) + '\n')
+
+    response = backend_app.app.test_client().post('/api/emails/import', json={'path': 'kept.jsonl'})
+    assert run_job(import_worker, response.get_json()['job_id'])['status'] == 'completed'
+    assert os.path.exists(path)
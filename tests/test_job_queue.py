@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+import sqlite3
+import pytest
+import job_queue
+from database import Database
+from job_queue import JobQueue
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(job_queue, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def queue(workdir, clock):
+    db = Database()
+    yield JobQueue(db, max_attempts=2, base_delay=1.0, lock_timeout=60.0)
+    db.close()
+
+
+def claim_and_die(worker_id):
+    #A worker process that is killed after claiming a job
+    queue = JobQueue(Database(), max_attempts=2, lock_timeout=60.0)
+    queue.claim(worker_id)
+    os._exit(1)
+
+
+def kill_worker_mid_job(worker_id):
+    process = multiprocessing.get_context('fork').Process(target=claim_and_die, args=(worker_id,))
+    process.start()
+    process.join()
+    assert process.exitcode == 1
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_job_of_a_killed_worker_is_retried_then_failed(queue, clock):
+    job_id = queue.enqueue('process_email', {'email_id': '1'})
+
+    kill_worker_mid_job('worker-1')
+    job = queue.get_job(job_id)
+    assert (job['status'], job['attempts'], job['locked_by']) == ('running', 1, 'worker-1')
+    # Still locked by the lost worker until the lock times out
+    assert queue.claim('worker-2') is None
+
+    clock.now += 61
+    job = queue.claim('worker-2')
+    assert (job['id'], job['attempts'], job['locked_by']) == (job_id, 2, 'worker-2')
+
+    # Lost again on the last attempt: failed rather than left running
+    clock.now += 61
+    assert queue.claim('worker-3') is None
+    job = queue.get_job(job_id)
+    assert job['status'] == 'failed'
+    assert job['error'].startswith('Worker lost')
+    assert job['locked_by'] is None
+
+
+def test_failed_jobs_are_retried_with_backoff(queue, clock, monkeypatch):
+    monkeypatch.setattr(job_queue.random, 'uniform', lambda low, high: high)
+    job_id = queue.enqueue('process_email', {'email_id': '1'})
+
+    queue.fail(queue.claim('worker')['id'], 'model timed out')
+    job = queue.get_job(job_id)
+    assert (job['status'], job['error']) == ('queued', 'model timed out')
+    assert queue.claim('worker') is None
+
+    clock.now += 1
+    queue.fail(queue.claim('worker')['id'], 'model timed out')
+    assert queue.get_job(job_id)['status'] == 'failed'
+
+
+def test_completed_jobs_are_not_claimed_again(queue, clock):
+    job_id = queue.enqueue('train_classifier', {})
+    queue.complete(queue.claim('worker')['id'], {'trained': True})
+
+    clock.now += 3600
+    assert queue.claim('worker') is None
+    assert queue.get_job(job_id)['result'] == {'trained': True}
+
+
+def test_idle_polls_do_not_take_the_write_lock(queue, clock):
+    queue.enqueue('process_email', {'email_id': '1'})
+    queue.complete(queue.claim('worker')['id'], {})
+    # Fail fast instead of waiting for the lock if claim() tries to write
+    queue.db.connect().execute('PRAGMA busy_timeout = 50')
+
+    writer = sqlite3.connect(queue.db.db_path)
+    writer.execute('BEGIN IMMEDIATE')
+    try:
+        assert queue.claim('worker') is None
+    finally:
+        writer.rollback()
+        writer.close()
+
+    job_id = queue.enqueue('process_email', {'email_id': '2'})
+    assert queue.claim('worker')['id'] == job_id
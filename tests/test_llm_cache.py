@@ -0,0 +1,109 @@
+import pytest
+import llm_cache
+from database import Database
+from llm_cache import LLMCache
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(llm_cache, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def cache(workdir, clock):
+    cache = LLMCache('data/llm_cache.db', max_entries=3, max_age_seconds=3600)
+    yield cache
+    cache.close()
+
+
+def last_accessed(cache, key):
+    return cache.connect().execute('SELECT last_accessed FROM llm_cache WHERE key = ?', (key,)).fetchone()[0]
+
+
+def test_hits_do_not_write(cache, clock):
+    cache.set('a', 'response a')
+    conn = cache.connect()
+    changes = conn.total_changes
+
+    clock.now += 10
+    assert cache.get('a') == 'response a'
+    assert cache.get('missing') is None
+    assert conn.total_changes == changes
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_access_times_are_written_in_batches(cache, clock, monkeypatch):
+    monkeypatch.setattr(cache, 'ACCESS_FLUSH_EVERY', 2)
+    cache.set('a', 'response a')
+    cache.set('b', 'response b')
+
+    clock.now += 10
+    cache.get('a')
+    cache.get('a')
+    assert last_accessed(cache, 'a') == clock.now - 10
+    cache.get('b')
+    # Two distinct keys waiting: both written together
+    assert last_accessed(cache, 'a') == last_accessed(cache, 'b') == clock.now
+
+    clock.now += 10
+    cache.get('a')
+    cache.set('c', 'response c')
+    # Written along with the next response
+    assert last_accessed(cache, 'a') == clock.now
+
+
+def test_eviction_keeps_the_most_recently_used(cache, clock):
+    for key in 'abc':
+        clock.now += 1
+        cache.set(key, f"response {key}")
+    clock.now += 1
+    # Only in memory until evict() writes it
+    cache.get('a')
+    clock.now += 1
+    cache.set('d', 'response d')
+
+    cache.evict()
+    assert [cache.get(key) for key in 'abcd'] == ['response a', None, 'response c', 'response d']
+
+
+def test_expired_entries_are_misses_and_evicted(cache, clock):
+    cache.set('old', 'old response')
+    clock.now += 1800
+    cache.set('new', 'new response')
+
+    clock.now += 1801
+    assert cache.get('old') is None
+    assert cache.get('new') == 'new response'
+    cache.evict()
+    assert cache.stats()['entries'] == 1
+
+    # A fresh response replaces the expired one
+    cache.set('old', 'fresh response')
+    assert cache.get('old') == 'fresh response'
+
+
+@pytest.mark.parametrize('prompt, invalidated', [
+    ('summary', {'summary', 'fused'}),
+    ('categorization', {'categorization', 'fused', 'categorization_packed'}),
+    ('auto_reply', {'auto_reply'})
+])
+def test_prompt_update_invalidates_its_responses(workdir, prompt, invalidated):
+    db = Database('data/emails.db', llm_cache=LLMCache('data/llm_cache.db'))
+    names = ['summary', 'categorization', 'action_extraction', 'auto_reply', 'fused', 'categorization_packed']
+    for name in names:
+        db.llm_cache.set(f"key-{name}", f"response from {name}", prompt_name=name)
+
+    db.update_prompt(prompt, 'New template')
+    kept = {name for name in names if db.llm_cache.get(f"key-{name}") is not None}
+    assert kept == set(names) - invalidated
+    db.close()
@@ -0,0 +1,191 @@
+import time
+import pytest
+from batch_processor import BatchProcessor
+from config import Config
+from database import Database
+from ingest import Ingester
+from near_duplicates import InFlightIndex, NearDuplicateIndex, hamming, simhash
+from stub_llm import NoCache
+
+BODY = ('Your monthly statement for account 4417 is ready. Log in to the customer portal to review '
+        'recent transactions, download a PDF copy and update your paperless billing preferences. '
+        'Payments made after the statement date will appear on your next statement. If you notice '
+        'a transaction you do not recognise, contact our support team from the help section of the '
+        'portal or call the number on the back of your card. We will never ask for your password '
+        'by email. To stop receiving these notices, change your notification settings in the portal. '
+        'This message was sent to the address registered on your account and replies are not monitored.')
+OTHER_BODY = ('The offsite agenda is attached. We start with a product roadmap session, then break '
+              'into teams for planning, followed by dinner at the lodge and a hike the next morning.')
+
+
+def record(email_id, sender='billing@bank.example.com', body=BODY, subject='Your statement'):
+    return {
+        'id': email_id,
+        'message_id': None,
+        'from': sender,
+        'subject': subject,
+        'body': body,
+        'date': '2024-01-15 10:00:00',
+        'in_reply_to': None,
+        'references': None,
+        'headers': None
+    }
+
+
+def bits(*positions):
+    return sum(1 << position for position in positions)
+
+
+@pytest.fixture
+def db(workdir):
+    db = Database('data/emails.db')
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def reuse(processor, monkeypatch):
+    """The processor with near-duplicate reuse on; returns the sub-tasks sent to the model"""
+    monkeypatch.setattr(Config, 'NEAR_DUPLICATE_REUSE', True)
+    calls = []
+    create = processor.client.create
+
+    def recording_create(model, messages, **kwargs):
+        calls.append(messages[0]['content'])
+        return create(model, messages, **kwargs)
+
+    monkeypatch.setattr(processor.client.chat.completions, 'create', recording_create)
+    processor.cache = NoCache()
+    return calls
+
+
+def process(processor, email_id):
+    result = processor.process_email(processor.db.get_email(email_id))
+    processor.db.update_email_processing(email_id, result)
+    return result
+
+
+def test_similar_texts_get_close_hashes():
+    assert simhash(BODY) == simhash(BODY.upper())
+    assert 0 < hamming(simhash(BODY), simhash(BODY + ' Thanks.')) <= 3
+    assert hamming(simhash(BODY), simhash(OTHER_BODY)) > 10
+
+
+def test_band_lookup_finds_hashes_within_three_bits(db):
+    index = NearDuplicateIndex(db, max_distance=3)
+    base = 0x0123456789abcdef
+    Ingester(db).ingest([record(name) for name in ('three-bands', 'one-band', 'four-bits', 'unprocessed')])
+    conn = db.connect()
+    with conn:
+        # One bit flipped in each of three bands, three bits in one band, and four bits in all four
+        index.store(conn, 'three-bands', base ^ bits(0, 16, 32), True)
+        index.store(conn, 'one-band', base ^ bits(1, 2, 3), True)
+        index.store(conn, 'four-bits', base ^ bits(5, 21, 37, 53), True)
+        index.store(conn, 'unprocessed', base, True)
+        conn.execute("UPDATE emails SET is_processed = TRUE WHERE id != 'unprocessed'")
+
+    email = {'id': 'query', 'simhash': base}
+    assert index.find_similar(email) == [('one-band', 3), ('three-bands', 3)]
+    # An exact match ends the lookup early
+    assert index.find_similar(email, processed_only=False) == [('unprocessed', 0)]
+    assert index.find_similar(email, max_distance=2) == []
+    assert index.max_distance == NearDuplicateIndex(db, max_distance=10).max_distance == 3
+
+
+def test_short_bodies_are_hashed_but_not_indexed(db):
+    index = NearDuplicateIndex(db, min_words=20)
+    Ingester(db, near_duplicates=index).ingest([record('short-1', body='Thanks!'), record('short-2', body='Thanks!')])
+    email = db.get_email('short-1')
+    assert email['simhash'] is not None
+    assert not index.is_indexed('short-1', index.ensure_indexed(email))
+    assert index.find_similar(email, processed_only=False) == []
+
+
+def test_same_sender_lookup(db):
+    index = NearDuplicateIndex(db)
+    Ingester(db, near_duplicates=index).ingest([
+        record('bank'), record('forwarded', sender='friend@example.org'), record('query')
+    ])
+    email = db.get_email('query')
+    assert index.find_similar(email, processed_only=False) == [('bank', 0), ('forwarded', 0)]
+    assert index.find_similar(email, processed_only=False, same_sender=True) == [('bank', 0)]
+
+
+def test_processed_duplicates_from_the_same_sender_are_reused(processor, reuse):
+    Ingester(processor.db).ingest([
+        record('first'),
+        record('copy'),
+        record('near', body=BODY + ' Thanks.'),
+        record('other-sender', sender='someone@example.org')
+    ])
+    process(processor, 'first')
+    assert len(reuse) == 3
+
+    reuse.clear()
+    result = process(processor, 'copy')
+    assert reuse == []
+    assert result['category_source'] == 'duplicate'
+    first = processor.db.get_email('first')
+    assert (result['category'], result['summary']) == (first['category'], first['summary'])
+
+    # Only the category is reused from a match that is not identical
+    reuse.clear()
+    result = process(processor, 'near')
+    assert len(reuse) == 2 and 'You are an email categorization assistant.' not in reuse
+    assert result['category_source'] == 'duplicate'
+
+    # The same body from someone else is processed on its own
+    reuse.clear()
+    result = process(processor, 'other-sender')
+    assert len(reuse) == 3
+    assert result['category_source'] == 'llm'
+
+
+def test_results_of_another_template_version_are_not_reused(processor, reuse):
+    Ingester(processor.db).ingest([record('first'), record('copy')])
+    process(processor, 'first')
+    processor.db.update_prompt('summary', 'Summarize in one line.')
+
+    reuse.clear()
+    process(processor, 'copy')
+    assert reuse == ['You are an email summarization assistant.']
+
+
+def test_reuse_can_be_turned_off(processor, reuse, monkeypatch):
+    monkeypatch.setattr(Config, 'NEAR_DUPLICATE_REUSE', False)
+    Ingester(processor.db).ingest([record('first'), record('copy')])
+    process(processor, 'first')
+    reuse.clear()
+    process(processor, 'copy')
+    assert len(reuse) == 3
+
+
+def test_in_flight_index():
+    in_flight = InFlightIndex()
+    in_flight.add('leader', 0xff, 'billing@bank.example.com')
+    assert in_flight.find(0xff ^ bits(40), 1, 'billing@bank.example.com') == 'leader'
+    assert in_flight.find(0xff ^ bits(40, 41), 1, 'billing@bank.example.com') is None
+    assert in_flight.find(0xff, 0, 'friend@example.org') is None
+
+    in_flight.remove('leader')
+    assert in_flight.find(0xff, 0, 'billing@bank.example.com') is None
+    assert in_flight.buckets == {} and in_flight.senders == {}
+
+
+def test_followers_wait_for_the_in_flight_leader(processor, reuse):
+    Ingester(processor.db).ingest(
+        [record(f"copy-{i}") for i in range(4)] + [record('other-sender', sender='someone@example.org')]
+    )
+    batch = BatchProcessor(processor.db, processor)
+    job = batch.start_job(email_ids=[f"copy-{i}" for i in range(4)] + ['other-sender'], concurrency=4)
+    while job['status'] not in ('completed', 'failed'):
+        time.sleep(0.01)
+        job = batch.get_job(job['id'])
+
+    assert (job['status'], job['processed']) == ('completed', 5)
+    # One leader for the four copies, and the other sender's email on its own
+    assert len(reuse) == 6
+    emails = [processor.db.get_email(f"copy-{i}") for i in range(4)]
+    assert [email['category_source'] for email in emails].count('duplicate') == 3
+    assert len({email['summary'] for email in emails}) == 1
+    assert processor.db.get_email('other-sender')['category_source'] == 'llm'
@@ -0,0 +1,103 @@
+import json
+import time
+import pytest
+from batch_processor import BatchProcessor
+from config import Config
+from email_processor import EmailProcessor
+from stub_llm import PACKED_EMAIL, StubOpenAIClient, category_for
+
+LABELS = ['1', '2', '3']
+
+
+@pytest.mark.parametrize('response, expected', [
+    # Out of order, with the label styles models use
+    ('{"3": "Spam", "1": "Important", "2": "Newsletter"}', {'1': 'Important', '2': 'Newsletter', '3': 'Spam'}),
+    ('Sure!\n{"Email 2": "Spam", "#1": " To-Do "}\nDone.', {'1': 'To-Do', '2': 'Spam'}),
+    # Missing and unknown labels
+    ('{"1": "Spam"}', {'1': 'Spam'}),
+    ('{"1": "Spam", "4": "Important", "email": "Spam"}', {'1': 'Spam'}),
+    # Duplicates: kept when they agree, dropped when they don't
+    ('{"1": "Spam", "Email 1": "Spam", "2": "Important"}', {'1': 'Spam', '2': 'Important'}),
+    ('{"1": "Spam", "1": "Important", "2": "Newsletter"}', {'2': 'Newsletter'}),
+    ('{"Email 1": "Spam", "#1": "Important"}', {}),
+    # Invalid categories
+    ('{"1": 42, "2": "", "3": {"name": "Spam"}}', {}),
+    ('{"1": "' + 'x' * 51 + '", "2": "Spam"}', {'2': 'Spam'}),
+    # Not a JSON object
+    ('Important, Spam, Newsletter', {}),
+    ('["Important", "Spam", "Newsletter"]', {}),
+    ('{"1": "Spam", "2": ', {}),
+    ('', {}),
+])
+def test_parse_packed_response(response, expected):
+    assert EmailProcessor.parse_packed_response(response, LABELS) == expected
+
+
+class ScriptedClient(StubOpenAIClient):
+    """The stub model, with packed replies taken from a list (then answered normally)"""
+
+    def __init__(self, packed_replies):
+        super().__init__()
+        self.packed_replies = list(packed_replies)
+        self.packed_requests = 0
+
+    def packed_reply(self, prompt):
+        self.packed_requests += 1
+        if self.packed_replies:
+            reply = self.packed_replies.pop(0)
+            return reply(prompt) if callable(reply) else reply
+        return super().packed_reply(prompt)
+
+
+def test_categorize_packed_maps_numbers_back_to_ids(processor, add_emails):
+    ids = add_emails(processor.db, 3)
+    emails = [processor.db.get_email(email_id) for email_id in ids]
+    processor.client = ScriptedClient(['{"3": "Spam", "Email 1": "Important", "2": 7}'])
+
+    categories = processor.categorize_packed(emails, processor.prompt_registry.get_prompts())
+    # Email 2's invalid category leaves it out, for the caller to retry
+    assert categories == {ids[0]: 'Important', ids[2]: 'Spam'}
+
+
+def only_odd_numbers(prompt):
+    #A reply that drops every other email
+    entries = PACKED_EMAIL.findall(prompt)
+    return json.dumps({label: category_for(subject) for label, subject in entries if int(label) % 2})
+
+
+def run_packed_job(processor):
+    batch = BatchProcessor(processor.db, processor)
+    job = batch.start_job(email_ids=processor.db.get_email_ids(), process_type='categorize', packed=True)
+    while job['status'] not in ('completed', 'failed'):
+        time.sleep(0.01)
+        job = batch.get_job(job['id'])
+    return job
+
+
+def stored_categories(db):
+    rows = db.connect().execute('SELECT subject, category FROM emails').fetchall()
+    return {row['subject']: row['category'] for row in rows}
+
+
+def test_missing_emails_are_packed_again(processor, add_emails):
+    add_emails(processor.db, 6)
+    processor.client = ScriptedClient([only_odd_numbers])
+
+    job = run_packed_job(processor)
+    assert (job['status'], job['processed'], job['failed']) == ('completed', 6, 0)
+    # The three dropped emails went into a second packed request
+    assert processor.client.packed_requests == 2 and processor.client.requests == 2
+    assert all(category == category_for(subject) for subject, category in stored_categories(processor.db).items())
+
+
+def test_falls_back_to_one_request_per_email(processor, add_emails, monkeypatch):
+    monkeypatch.setattr(Config, 'PACKED_CATEGORIZATION_ATTEMPTS', 2)
+    add_emails(processor.db, 5)
+    processor.client = ScriptedClient(['I cannot categorize these.', '[1, 2, 3]'])
+
+    job = run_packed_job(processor)
+    assert (job['status'], job['processed'], job['failed']) == ('completed', 5, 0)
+    # Two packed attempts, then each email on its own
+    assert processor.client.packed_requests == 2
+    assert processor.client.requests == 2 + 5
+    assert all(category == category_for(subject) for subject, category in stored_categories(processor.db).items())
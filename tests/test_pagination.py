@@ -0,0 +1,135 @@
+import json
+import pytest
+from database import Database
+from ingest import Ingester
+
+CATEGORIES = ['Work', 'Personal', 'Newsletter']
+
+
+def record(i, date):
+    return {
+        'id': f"email-{i:02d}",
+        'message_id': None,
+        'from': f"sender{i % 2}@example.com",
+        'subject': f"Subject {i}",
+        'body': f"Body {i}",
+        'date': date,
+        'in_reply_to': None,
+        'references': None,
+        'headers': None
+    }
+
+
+@pytest.fixture
+def db(workdir):
+    db = Database('data/emails.db')
+    # Pairs of emails share a date, so pages must break ties on id
+    Ingester(db).ingest([record(i, f"2024-01-{10 + i // 2:02d} 09:00:00") for i in range(20)])
+    conn = db.connect()
+    with conn:
+        for i in range(20):
+            conn.execute('UPDATE emails SET category = ?, is_processed = ?, actions = ? WHERE id = ?', (
+                CATEGORIES[i % 3], i % 4 == 0, json.dumps({'tasks': [{'task': f"Task {i}"}]}), f"email-{i:02d}"
+            ))
+    yield db
+    db.close()
+
+
+def all_pages(db, limit, **filters):
+    pages = []
+    cursor = None
+    while True:
+        emails, cursor = db.list_emails(limit=limit, cursor=cursor, **filters)
+        pages.append([email['id'] for email in emails])
+        if cursor is None:
+            return pages
+
+
+def expected_order(db, condition=lambda email: True):
+    emails = [email for email in db.get_emails() if condition(email)]
+    return [email['id'] for email in sorted(emails, key=lambda email: (email['date'], email['id']), reverse=True)]
+
+
+def test_pages_cover_every_email_once_in_order(db):
+    pages = all_pages(db, limit=3)
+    assert [len(page) for page in pages] == [3] * 6 + [2]
+    assert sum(pages, []) == expected_order(db)
+
+
+def test_emails_without_a_date_are_paged_last(db):
+    Ingester(db).ingest([record(i, None) for i in range(20, 25)])
+    pages = all_pages(db, limit=3)
+
+    ids = sum(pages, [])
+    assert len(ids) == len(set(ids)) == 25
+    assert ids[-5:] == [f"email-{i}" for i in range(24, 19, -1)]
+    assert ids[:-5] == expected_order(db, lambda email: email['date'] is not None)
+
+
+def test_pages_are_stable_when_newer_emails_arrive(db):
+    first, cursor = db.list_emails(limit=5)
+    Ingester(db).ingest([record(i, '2024-02-01 09:00:00') for i in range(20, 23)])
+    second, _ = db.list_emails(limit=5, cursor=cursor)
+
+    # Newer emails go before the first page; the next page carries on where it stopped
+    ids = expected_order(db)
+    start = ids.index(first[-1]['id']) + 1
+    assert [email['id'] for email in second] == ids[start:start + 5]
+
+
+def test_cursor_round_trip(db):
+    emails, cursor = db.list_emails(limit=4)
+    assert db.decode_cursor(cursor) == (emails[-1]['date'], emails[-1]['id'])
+    assert db.decode_cursor(db.encode_cursor('2024-01-01 00:00:00', 'a/b+c')) == ('2024-01-01 00:00:00', 'a/b+c')
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        db.list_emails(cursor='not-a-cursor')
+
+
+@pytest.mark.parametrize('filters, condition', [
+    ({'category': 'Work'}, lambda email: email['category'] == 'Work'),
+    ({'is_processed': True}, lambda email: email['is_processed']),
+    ({'sender': 'sender1@example.com', 'category': 'Personal'},
+     lambda email: email['sender'] == 'sender1@example.com' and email['category'] == 'Personal'),
+    ({'date_from': '2024-01-12', 'date_to': '2024-01-16'},
+     lambda email: '2024-01-12' <= email['date'] <= '2024-01-16')
+])
+def test_filters_combine_with_cursors(db, filters, condition):
+    pages = all_pages(db, limit=2, **filters)
+    assert all(page for page in pages)
+    assert sum(pages, []) == expected_order(db, condition)
+
+
+def test_fields_projection(db):
+    emails, cursor = db.list_emails(limit=2, fields=['subject', 'actions'])
+    # id and date are always included to build the next cursor
+    assert set(emails[0]) == {'id', 'date', 'subject', 'actions'}
+    assert emails[0]['actions'] == {'tasks': [{'task': 'Task 19'}]}
+
+    rest, _ = db.list_emails(limit=2, cursor=cursor, fields=['subject'])
+    assert set(rest[0]) == {'id', 'date', 'subject'}
+    with pytest.raises(ValueError, match='Unknown fields: clean_body'):
+        db.list_emails(fields=['subject', 'clean_body'])
+
+
+def test_api_pages(backend_app):
+    client = backend_app.app.test_client()
+    client.post('/api/emails/load-mock')
+    total = len(client.get('/api/emails').get_json())
+
+    ids = []
+    cursor = None
+    while True:
+        query = {'limit': 4, 'fields': 'subject'}
+        if cursor:
+            query['cursor'] = cursor
+        page = client.get('/api/emails', query_string=query).get_json()
+        ids += [email['id'] for email in page['emails']]
+        assert all(set(email) == {'id', 'date', 'subject'} for email in page['emails'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert len(ids) == len(set(ids)) == total
+
+    for query in ({'cursor': 'garbage'}, {'fields': 'nope'}, {'limit': 'ten'}):
+        response = client.get('/api/emails', query_string=query)
+        assert response.status_code == 400 and 'error' in response.get_json()
@@ -0,0 +1,178 @@
+import json
+import random
+import pytest
+from database import Database
+from ingest import Ingester
+from pre_classifier import PreClassifier
+from stub_llm import NoCache
+
+WORK_WORDS = ['meeting', 'report', 'deadline', 'project', 'review', 'budget', 'client', 'roadmap']
+PERSONAL_WORDS = ['dinner', 'weekend', 'birthday', 'family', 'holiday', 'movie', 'picnic', 'garden']
+
+
+def record(email_id, sender, subject, body, headers=None):
+    return {
+        'id': email_id,
+        'message_id': None,
+        'from': sender,
+        'subject': subject,
+        'body': body,
+        'date': '2024-01-15 10:00:00',
+        'in_reply_to': None,
+        'references': None,
+        'headers': headers
+    }
+
+
+def labelled_inbox(count=120):
+    """(record, LLM category) pairs: bulk newsletters, work mail from one domain, personal mail from many"""
+    emails = []
+    for i in range(count):
+        emails.append((record(
+            f"news-{i}", f"digest{i % 3}@news.example.com", f"Weekly digest {i}",
+            f"Top stories this week, issue {i}.", headers={'List-Unsubscribe': '<mailto:leave@news.example.com>'}
+        ), 'Newsletter'))
+        words = [WORK_WORDS[(i + k) % len(WORK_WORDS)] for k in range(3)]
+        emails.append((record(
+            f"work-{i}", f"colleague{i}@corp.example.com", f"{words[0].title()} update",
+            f"Can we discuss the {words[1]} and the {words[2]} tomorrow?"
+        ), 'Work'))
+        words = [PERSONAL_WORDS[(i + k) % len(PERSONAL_WORDS)] for k in range(3)]
+        emails.append((record(
+            f"personal-{i}", f"friend{i}@home{i}.example.org", f"{words[0].title()} plans",
+            f"Are you free for the {words[1]} and the {words[2]} this week?"
+        ), 'Personal'))
+    return emails
+
+
+def store_labels(db, emails, prompt_version=1, source='llm'):
+    Ingester(db).ingest([email for email, _ in emails])
+    conn = db.connect()
+    with conn:
+        conn.executemany('''
+            UPDATE emails SET category = ?, category_source = ?, prompt_versions = ? WHERE id = ?
+        ''', [(category, source, json.dumps({'categorization': prompt_version}), email['id'])
+              for email, category in emails])
+
+
+@pytest.fixture
+def db(workdir):
+    db = Database('data/emails.db')
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def trained(db):
+    store_labels(db, labelled_inbox())
+    classifier = PreClassifier(db)
+    return classifier, classifier.train(1)
+
+
+def test_training_reports_held_out_accuracy(trained):
+    classifier, report = trained
+    assert report['enabled']
+    assert report['categories'] == ['Newsletter', 'Personal', 'Work']
+    assert report['held_out'] >= PreClassifier.MIN_HELD_OUT
+    assert report['trained_on'] + report['held_out'] == 360
+    assert report['answered_accuracy'] >= 0.95
+    assert report['by_source']['rules']['answered'] > 0
+    assert report['by_source']['model']['answered'] > 0
+    # Only domains with enough consistent support become rules
+    assert report['domain_rules'] == 2
+    assert report['bulk_rule'] == 'Newsletter'
+
+    stored = classifier.get_report()
+    assert (stored['enabled'], stored['prompt_version'], stored['held_out']) == (True, 1, report['held_out'])
+
+
+def test_rules_and_confident_predictions_answer_locally(trained):
+    classifier, _ = trained
+    assert classifier.classify(
+        record('new-1', 'editor@news.example.com', 'Monthly roundup', 'Read more'), 1
+    ) == ('Newsletter', 'rules')
+    assert classifier.classify(
+        record('new-2', 'someone@elsewhere.example.net', 'Sale', 'Offers inside', headers={'Precedence': 'bulk'}), 1
+    ) == ('Newsletter', 'rules')
+    assert classifier.classify(
+        record('new-3', 'colleague@corp.example.com', 'Lunch?', 'Anyone hungry?'), 1
+    ) == ('Work', 'rules')
+    assert classifier.classify(
+        record('new-4', 'cousin@unknown.example.org', 'Birthday dinner',
+               'Are you free for the birthday dinner and the family picnic this weekend?'), 1
+    ) == ('Personal', 'model')
+
+
+def test_low_confidence_goes_to_the_llm(db, trained):
+    classifier, _ = trained
+    unknown = record('new-1', 'stranger@unknown.example.org', 'Question', 'Zebra quantum xylophone.')
+    assert classifier.classify(unknown, 1) is None
+
+    # The same model behind a stricter threshold leaves model answers to the LLM; rules still apply
+    strict = PreClassifier(db, threshold=1.01)
+    personal = record('new-2', 'cousin@unknown.example.org', 'Birthday dinner',
+                      'Are you free for the birthday dinner and the family picnic this weekend?')
+    assert classifier.classify(personal, 1) == ('Personal', 'model')
+    assert strict.classify(personal, 1) is None
+    assert strict.classify(record('new-3', 'colleague@corp.example.com', 'Hi', 'Hi'), 1) == ('Work', 'rules')
+
+
+def test_models_for_another_prompt_version_are_ignored(trained):
+    classifier, _ = trained
+    email = record('new-1', 'editor@news.example.com', 'Monthly roundup', 'Read more')
+    assert classifier.classify(email, 2) is None
+
+
+def test_inaccurate_models_stay_disabled(db):
+    # Labels that ignore the content cannot be learned
+    rng = random.Random(0)
+    store_labels(db, [(email, rng.choice(['Newsletter', 'Work', 'Personal'])) for email, _ in labelled_inbox()])
+    classifier = PreClassifier(db)
+    report = classifier.train(1)
+    assert not report['enabled']
+    assert report['domain_rules'] == 0
+    assert classifier.classify(record('new-1', 'editor@news.example.com', 'Roundup', 'Read more'), 1) is None
+
+
+def test_only_llm_labels_of_the_prompt_version_are_used(db):
+    emails = labelled_inbox(30)
+    store_labels(db, emails[:30], prompt_version=1)
+    store_labels(db, emails[30:60], prompt_version=2)
+    store_labels(db, emails[60:], prompt_version=1, source='model')
+    classifier = PreClassifier(db)
+    report = classifier.train(1)
+    assert report['trained_on'] + report['held_out'] == 30
+
+    with pytest.raises(ValueError, match='Not enough LLM-labelled emails'):
+        classifier.train(3)
+
+
+def test_confident_emails_skip_the_llm(processor, monkeypatch):
+    store_labels(processor.db, labelled_inbox())
+    assert processor.train_pre_classifier()['enabled']
+
+    systems = []
+    create = processor.client.create
+
+    def recording_create(model, messages, **kwargs):
+        systems.append(messages[0]['content'])
+        return create(model, messages, **kwargs)
+
+    monkeypatch.setattr(processor.client.chat.completions, 'create', recording_create)
+    processor.cache = NoCache()
+    categorization = 'You are an email categorization assistant.'
+
+    Ingester(processor.db).ingest([
+        record('local', 'editor@news.example.com', 'Monthly roundup', 'Read more',
+               headers={'List-Unsubscribe': '<mailto:leave@news.example.com>'}),
+        record('remote', 'stranger@unknown.example.org', 'Question', 'Zebra quantum xylophone.')
+    ])
+    result = processor.process_email(processor.db.get_email('local'))
+    assert (result['category'], result['category_source']) == ('Newsletter', 'rules')
+    assert categorization not in systems
+    assert len(systems) == 2
+
+    systems.clear()
+    result = processor.process_email(processor.db.get_email('remote'))
+    assert result['category_source'] == 'llm'
+    assert systems.count(categorization) == 1
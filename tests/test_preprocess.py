@@ -0,0 +1,95 @@
+import pytest
+from preprocess import clean_body, html_to_text, mentions_time, strip_signature, truncate
+
+REQUEST = 'Can you review the deck before the board meeting?'
+
+
+@pytest.mark.parametrize('tail', [
+    ['P.S. the review moved to 3pm Friday'],
+    ['PS: bring the printouts'],
+    ['Senior Engineer', 'The review moved to 10:30 tomorrow'],
+    ['Also, could you loop in Dana?'],
+    ['One more thing: the numbers in the appendix are from last quarter and still need updating before we send it'],
+])
+def test_text_after_the_sign_off_is_kept(tail):
+    lines = [REQUEST, '', 'Thanks,', 'Bob'] + tail
+    assert strip_signature(lines) == lines
+
+
+def test_contact_block_after_the_sign_off_is_dropped():
+    lines = [REQUEST, '', 'Best regards,', 'Bob Smith', 'Senior Engineer | Acme Corp', '+1 555 0100', 'www.acme.com']
+    assert strip_signature(lines) == [REQUEST, '', 'Best regards,', 'Bob Smith']
+
+
+def test_message_that_is_only_a_sign_off_is_kept():
+    assert strip_signature(['Thanks!', 'Bob']) == ['Thanks!', 'Bob']
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('Meeting at 3pm', True), ('moved to 10:30', True), ('see you Thursday', True), ('due 14 March', True),
+    ('+1 555 0100', False), ('Acme Corp, 12 Main St', False), ('bob@acme.com', False),
+])
+def test_mentions_time(line, expected):
+    assert mentions_time(line) == expected
+
+
+def test_quoted_history_is_dropped():
+    body = (
+        'Sounds good, see you then.\n\n'
+        'On Mon, Jan 15, 2024 at 9:00 AM Anna <anna@example.com>\nwrote:\n'
+        '> Can we meet on Tuesday?\n'
+    )
+    assert clean_body(body) == 'Sounds good, see you then.'
+
+
+def test_outlook_reply_header_and_quotes_are_dropped():
+    body = 'Approved.\n\nFrom: Anna\nSent: Monday\nSubject: Budget\n\nPlease approve the budget.'
+    assert clean_body(body) == 'Approved.'
+    assert clean_body('Approved.\n-----Original Message-----\nPlease approve.') == 'Approved.'
+
+
+def test_forwarded_header_is_dropped_but_its_body_kept():
+    body = (
+        'FYI\n\n---------- Forwarded message ---------\n'
+        'From: IT <it@example.com>\nDate: Mon, Jan 15\nSubject: Maintenance\nTo: all@example.com\n\n'
+        'Servers go down at 10pm.'
+    )
+    assert clean_body(body) == 'FYI\n\nServers go down at 10pm.'
+
+
+def test_disclaimers_and_mobile_signatures_are_dropped():
+    body = (
+        'Please send the report.\n\nSent from my iPhone\n\n'
+        'CONFIDENTIALITY NOTICE: This message is confidential and intended only for the recipient.'
+    )
+    assert clean_body(body) == 'Please send the report.'
+
+
+def test_signature_delimiter_ends_the_message():
+    assert clean_body('See attached.\n-- \nBob\nAcme Corp') == 'See attached.'
+
+
+def test_html_is_reduced_to_visible_text():
+    body = (
+        '<html><head><style>p {color: red}</style></head><body>'
+        '<p>Hello&nbsp;team,</p><p>The launch is <b>Friday</b>.</p>'
+        '<script>track()</script><blockquote>old thread</blockquote>'
+        '<div class="gmail_quote">On Monday Anna wrote: <div>nested</div> quoted</div></body></html>'
+    )
+    assert clean_body(body) == 'Hello\xa0team,\n\nThe launch is Friday.'
+    assert 'track' not in html_to_text(body)
+
+
+def test_all_boilerplate_falls_back_to_the_original():
+    body = 'To unsubscribe from this list, click here.'
+    assert clean_body(body) == body
+    assert clean_body(None) == ''
+
+
+def test_truncate_cuts_at_a_boundary():
+    text = '\n'.join(f"Line {i} of the report with some words" for i in range(100))
+    cut = truncate(text, 50)
+    assert cut.endswith('\n[truncated]')
+    assert len(cut) <= 50 * 4 + len('\n[truncated]')
+    assert text.startswith(cut[:-len('\n[truncated]')])
+    assert truncate('short', 50) == 'short'
@@ -0,0 +1,86 @@
+import multiprocessing
+import pytest
+from database import Database
+from prompt_registry import PromptRegistry
+
+
+class CountingDatabase(Database):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loads = 0
+
+    def get_prompts(self):
+        self.loads += 1
+        return super().get_prompts()
+
+
+@pytest.fixture
+def db(workdir):
+    db = CountingDatabase('data/emails.db')
+    yield db
+    db.close()
+
+
+def edit_prompt_in_another_process(name, content):
+    def edit():
+        Database('data/emails.db').update_prompt(name, content)
+
+    process = multiprocessing.get_context('fork').Process(target=edit)
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+
+def test_templates_are_loaded_once_per_version(db):
+    registry = PromptRegistry(db)
+    prompts = registry.get_prompts()
+    assert prompts['summary']['prefix'].startswith(prompts['summary']['content'])
+    for _ in range(5):
+        assert registry.get_prompts() is prompts
+    assert db.loads == 1
+
+
+def test_edit_bumps_the_prompt_and_table_versions(db):
+    registry = PromptRegistry(db)
+    before = registry.get_prompts()['summary']
+    table_version = db.get_table_version('prompts')
+
+    db.update_prompt('summary', 'Summarize in one sentence.')
+    after = registry.get_prompts()['summary']
+    assert after['version'] == before['version'] + 1
+    assert db.get_table_version('prompts') > table_version
+    assert after['content'] == 'Summarize in one sentence.'
+    assert after['prefix'] == 'Summarize in one sentence.\n\nEmail: '
+    assert db.loads == 2
+
+
+def test_other_registries_reload_after_an_edit(db):
+    # As in the API server and a worker, each with its own connection
+    other_db = CountingDatabase('data/emails.db')
+    registry, other = PromptRegistry(db), PromptRegistry(other_db)
+    registry.get_prompts()
+    other.get_prompts()
+
+    db.update_prompt('categorization', 'Pick one category.')
+    assert other.get_prompts()['categorization']['content'] == 'Pick one category.'
+    assert other_db.loads == 2
+    other_db.close()
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_edits_from_another_process_are_picked_up(db):
+    registry = PromptRegistry(db)
+    version = registry.get_prompts()['action_extraction']['version']
+
+    edit_prompt_in_another_process('action_extraction', 'List the tasks.')
+    prompts = registry.get_prompts()
+    assert prompts['action_extraction']['content'] == 'List the tasks.'
+    assert prompts['action_extraction']['version'] == version + 1
+
+
+def test_invalidate_forces_a_reload(db):
+    registry = PromptRegistry(db)
+    registry.get_prompts()
+    registry.invalidate()
+    registry.get_prompts()
+    assert db.loads == 2
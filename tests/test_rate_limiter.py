@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+import rate_limiter
+from rate_limiter import LLMError, LLMScheduler, is_throttling_error, retry_after_seconds
+
+
+class FakeClock:
+    """Stands in for the time module; sleeping only moves the clock forward"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Throttled(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__('Too Many Requests')
+        headers = {'retry-after': retry_after} if retry_after is not None else {}
+        self.response = SimpleNamespace(headers=headers)
+
+
+class RateLimitError(Exception):
+    """Named like the OpenAI client's exception, without a status code"""
+
+
+class FakeClient:
+    """Raises the given errors in turn, then answers"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def create(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', clock)
+    return clock
+
+
+def test_is_throttling_error():
+    assert is_throttling_error(Throttled())
+    assert is_throttling_error(RateLimitError())
+    assert not is_throttling_error(ValueError('bad request'))
+    assert not is_throttling_error(SimpleNamespace(status_code=500))
+
+
+@pytest.mark.parametrize('error, expected', [
+    (Throttled('2.5'), 2.5),
+    (Throttled('7'), 7.0),
+    (Throttled(), None),
+    (Throttled('Wed, 21 Oct 2015 07:28:00 GMT'), None),
+    (RateLimitError(), None)
+])
+def test_retry_after_seconds(error, expected):
+    assert retry_after_seconds(error) == expected
+
+
+def test_retry_delay(clock):
+    scheduler = LLMScheduler(max_retries=3, base_delay=1.0, max_delay=5.0)
+    with pytest.raises(ValueError):
+        scheduler.retry_delay(ValueError('bad request'), 0)
+
+    assert scheduler.retry_delay(Throttled('4'), 0) == 4.0
+    # Jittered exponential backoff, capped at max_delay
+    assert 0.5 <= scheduler.retry_delay(Throttled(), 0) <= 1.5
+    assert 2.0 <= scheduler.retry_delay(Throttled(), 2) <= 6.0
+    with pytest.raises(LLMError):
+        scheduler.retry_delay(Throttled(), 3)
+
+    stats = scheduler.get_stats()
+    assert (stats['throttled'], stats['retries'], stats['failed']) == (4, 3, 1)
+
+
+def test_set_pause_holds_dispatch(clock):
+    scheduler = LLMScheduler()
+    scheduler.set_pause(10)
+    scheduler.set_pause(3)
+    # A shorter pause never cuts an existing one short
+    assert scheduler.dispatch_wait(clock.now, 1) == 10
+    clock.now += 10
+    assert scheduler.dispatch_wait(clock.now, 1) == 0
+
+
+def test_run_retries_after_the_server_delay(clock):
+    client = FakeClient(Throttled('3'), Throttled('3'))
+    scheduler = LLMScheduler(max_retries=5)
+
+    assert scheduler.run(client.create, estimated_tokens=10) == 'ok'
+    assert client.calls == 3
+    assert clock.sleeps == [3.0, 3.0]
+    stats = scheduler.get_stats()
+    assert (stats['requests'], stats['throttled'], stats['retries']) == (3, 2, 2)
+
+
+def test_run_gives_up_after_max_retries(clock):
+    client = FakeClient(*[Throttled('1')] * 10)
+    scheduler = LLMScheduler(max_retries=2)
+
+    with pytest.raises(LLMError):
+        scheduler.run(client.create, estimated_tokens=10)
+    assert client.calls == 3
+    assert scheduler.get_stats()['failed'] == 1
+
+
+def test_run_does_not_retry_other_errors(clock):
+    client = FakeClient(ValueError('bad request'))
+    with pytest.raises(ValueError):
+        LLMScheduler().run(client.create, estimated_tokens=10)
+    assert client.calls == 1 and clock.sleeps == []
+
+
+def test_run_waits_for_the_request_budget(clock):
+    scheduler = LLMScheduler(requests_per_minute=60)
+    scheduler.requests.available = 0
+    clock.now += 1.5
+    # 60 per minute refills one request per second
+    assert scheduler.dispatch_wait(clock.now, 1) == 0
+    scheduler.dispatch(clock.now, clock.now, 1)
+    assert scheduler.dispatch_wait(clock.now, 1) == pytest.approx(0.5)
+
+
+def test_arun_retries_throttled_coroutines():
+    calls = []
+
+    async def request():
+        calls.append(time.monotonic())
+        if len(calls) < 3:
+            raise Throttled('0.01')
+        return 'ok'
+
+    scheduler = LLMScheduler()
+    assert asyncio.run(scheduler.arun(request, estimated_tokens=10)) == 'ok'
+    assert len(calls) == 3
+    assert scheduler.get_stats()['retries'] == 2
+
+
+def test_interactive_requests_jump_ahead_of_batch():
+    scheduler = LLMScheduler()
+    dispatched = []
+    dispatch = scheduler.dispatch
+
+    def record(now, started, estimated_tokens):
+        # Runs with the condition held, so the order is the dispatch order
+        dispatched.append(estimated_tokens)
+        dispatch(now, started, estimated_tokens)
+
+    scheduler.dispatch = record
+    scheduler.set_pause(0.3)
+
+    def acquire(tokens, priority):
+        thread = threading.Thread(target=scheduler.acquire, args=(tokens, priority))
+        thread.start()
+        return thread
+
+    threads = [acquire(1, 'batch'), acquire(2, 'batch')]
+    while scheduler.get_stats()['queued'] < 2:
+        time.sleep(0.01)
+    threads.append(acquire(3, 'interactive'))
+    for thread in threads:
+        thread.join()
+
+    assert dispatched == [3, 1, 2]
+
+
+def test_budget_is_split_across_processes(workdir, monkeypatch):
+    from config import Config
+    from email_processor import EmailProcessor
+
+    monkeypatch.setattr(Config, 'LLM_PROCESSES', 4)
+    scheduler = EmailProcessor().scheduler
+    assert scheduler.requests.capacity == Config.LLM_REQUESTS_PER_MINUTE / 4
+    assert scheduler.tokens.capacity == Config.LLM_TOKENS_PER_MINUTE / 4
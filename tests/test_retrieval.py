@@ -0,0 +1,122 @@
+import pytest
+from database import Database
+from ingest import Ingester
+from retrieval import HashingEmbedder, InboxRetriever
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.texts = []
+
+    def embed(self, text):
+        self.texts.append(text)
+        return super().embed(text)
+
+
+EMAILS = [
+    ('budget', 'Q3 budget approval', 'The finance team needs your approval of the Q3 budget by Friday.'),
+    ('offsite', 'Team offsite', 'We are planning the team offsite in the mountains next month.'),
+    ('outage', 'Database outage', 'The primary database was down for an hour; the postmortem is attached.'),
+    ('newsletter', 'Weekly digest', 'Top stories this week: gardening tips and a recipe for bread.'),
+    ('hiring', 'Interview schedule', 'Please confirm your interview slots for the backend engineer role.')
+]
+
+
+def record(email_id, subject, body):
+    return {
+        'id': email_id,
+        'message_id': None,
+        'from': f"{email_id}@example.com",
+        'subject': subject,
+        'body': body,
+        'date': '2024-01-15 10:00:00',
+        'in_reply_to': None,
+        'references': None,
+        'headers': None
+    }
+
+
+@pytest.fixture
+def db(workdir):
+    db = Database('data/emails.db')
+    Ingester(db).ingest([record(*email) for email in EMAILS])
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def retriever(db):
+    return InboxRetriever(db, embedder=CountingEmbedder(), top_k=3, token_budget=2000)
+
+
+def stored_embeddings(db):
+    return {row[0] for row in db.connect().execute('SELECT email_id FROM email_embeddings')}
+
+
+def test_embedder_is_deterministic_and_normalized():
+    embedder = HashingEmbedder(dimensions=64)
+    vector = embedder.embed('Quarterly budget approval needed')
+    assert vector == HashingEmbedder(dimensions=64).embed('Quarterly budget approval needed')
+    assert len(vector) == 64
+    assert abs(sum(value * value for value in vector) - 1.0) < 1e-9
+    assert embedder.embed('') == [0.0] * 64
+
+    def similarity(a, b):
+        return sum(x * y for x, y in zip(embedder.embed(a), embedder.embed(b)))
+
+    assert similarity('budget approval for Q3', 'approval of the Q3 budget') > similarity('budget approval for Q3', 'gardening tips')
+
+
+@pytest.mark.parametrize('question, expected', [
+    ('Who needs my approval for the budget?', 'budget'),
+    ('what happened with the database outage', 'outage'),
+    ('When are the interviews?', 'hiring')
+])
+def test_most_relevant_email_comes_first(retriever, question, expected):
+    results = retriever.retrieve(question)
+    assert results[0]['id'] == expected
+    assert len(results) <= 3
+    assert all('body' not in email and email['excerpt'] for email in results)
+
+
+def test_token_budget_limits_the_context(retriever):
+    everything = retriever.retrieve('team budget database interview digest', top_k=5, token_budget=10000)
+    assert len(everything) == 5
+    # The best match is always included, even when it alone exceeds the budget
+    assert len(retriever.retrieve('team budget database interview digest', top_k=5, token_budget=1)) == 1
+
+
+def test_embeddings_are_stored_and_reused(db, retriever):
+    retriever.retrieve('budget approval')
+    assert stored_embeddings(db) == {email[0] for email in EMAILS}
+    computed = len(retriever.embedder.texts)
+
+    retriever.retrieve('budget approval')
+    # Only the question is embedded again
+    assert len(retriever.embedder.texts) == computed + 1
+
+    with db.connect() as conn:
+        conn.execute("UPDATE emails SET summary = 'Approve the budget' WHERE id = 'budget'")
+    retriever.retrieve('budget approval')
+    assert len(retriever.embedder.texts) == computed + 3
+    assert 'Approve the budget' in retriever.embedder.texts[-2]
+
+
+def test_deleted_emails_lose_their_embeddings(db, retriever):
+    retriever.retrieve('budget approval')
+    with db.connect() as conn:
+        conn.execute("DELETE FROM emails WHERE id = 'budget'")
+    assert 'budget' not in stored_embeddings(db)
+    assert 'budget' not in [email['id'] for email in retriever.retrieve('budget approval')]
+
+
+def test_embeddings_orphaned_before_the_trigger_are_removed(db, retriever):
+    retriever.retrieve('budget approval')
+    with db.connect() as conn:
+        conn.execute('DROP TRIGGER email_embeddings_delete')
+        conn.execute("DELETE FROM emails WHERE id = 'outage'")
+    assert 'outage' in stored_embeddings(db)
+
+    InboxRetriever(db)
+    assert stored_embeddings(db) == {email[0] for email in EMAILS} - {'outage'}
@@ -0,0 +1,136 @@
+import pytest
+from database import Database
+from ingest import Ingester
+
+
+def record(email_id, sender='alice@example.com', subject='Hello', body='Nothing to see'):
+    return {
+        'id': email_id,
+        'message_id': None,
+        'from': sender,
+        'subject': subject,
+        'body': body,
+        'date': '2024-01-15 10:00:00',
+        'in_reply_to': None,
+        'references': None,
+        'headers': None
+    }
+
+
+@pytest.fixture
+def db(workdir):
+    db = Database('data/emails.db')
+    yield db
+    db.close()
+
+
+def found(db, query, **options):
+    results, _ = db.search_emails(query, **options)
+    return [result['id'] for result in results]
+
+
+def assert_index_consistent(db):
+    # Fails if the index and the emails table disagree on any row
+    with db.connect() as conn:
+        conn.execute("INSERT INTO emails_fts (emails_fts, rank) VALUES ('integrity-check', 1)")
+
+
+def test_inserted_emails_are_searchable(db):
+    Ingester(db).ingest([
+        record('1', sender='carol@invoices.example.com', subject='Invoice overdue', body='Please pay by Friday'),
+        record('2', subject='Lunch', body='Café on Tuesday?')
+    ])
+    assert found(db, 'invoice') == ['1']
+    assert found(db, 'carol') == ['1']
+    assert found(db, 'friday') == ['1']
+    # Diacritics are folded
+    assert found(db, 'cafe') == ['2']
+    assert_index_consistent(db)
+
+
+@pytest.mark.parametrize('column, old, new', [
+    ('sender', 'alice@example.com', 'zoltan@example.com'),
+    ('subject', 'Hello', 'Quarterly forecast'),
+    ('body', 'Nothing to see', 'The migration finished overnight'),
+    ('summary', None, 'Migration done, no action needed')
+])
+def test_updates_reindex_the_email(db, column, old, new):
+    Ingester(db).ingest([record('1')])
+    conn = db.connect()
+    with conn:
+        conn.execute(f"UPDATE emails SET {column} = ? WHERE id = '1'", (new,))
+
+    if old:
+        assert found(db, old.split('@')[0]) == []
+    assert found(db, new.split('@')[0].split()[0]) == ['1']
+    assert_index_consistent(db)
+
+
+def test_deleted_emails_leave_the_index(db):
+    Ingester(db).ingest([record('1', subject='Budget review'), record('2', subject='Budget draft')])
+    conn = db.connect()
+    with conn:
+        conn.execute("DELETE FROM emails WHERE id = '1'")
+    assert found(db, 'budget') == ['2']
+    assert_index_consistent(db)
+
+
+def test_replaced_rows_stay_consistent(db):
+    Ingester(db).ingest([record('1', subject='Old subject')])
+    conn = db.connect()
+    with conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO emails (id, sender, subject, body, date)
+            VALUES ('1', 'alice@example.com', 'New subject', 'Body', '2024-01-15 10:00:00')
+        ''')
+    assert found(db, 'old') == []
+    assert found(db, 'new') == ['1']
+    assert_index_consistent(db)
+
+
+def test_bm25_ranks_subject_matches_and_repeated_terms_higher(db):
+    Ingester(db).ingest([
+        record('body-once', body='The outage report is attached, along with several other unrelated notes.'),
+        record('subject', subject='Outage report', body='See attached.'),
+        record('body-twice', body='Outage report: the outage lasted an hour.')
+    ])
+    results, _ = db.search_emails('outage')
+    assert [result['id'] for result in results] == ['subject', 'body-twice', 'body-once']
+    scores = [result['score'] for result in results]
+    # bm25() is lower for better matches
+    assert scores == sorted(scores)
+
+
+def test_snippets_mark_the_matched_terms(db):
+    body = ' '.join(['filler'] * 40 + ['the', 'deployment', 'failed', 'at', 'noon'] + ['filler'] * 40)
+    Ingester(db).ingest([record('1', body=body)])
+    snippet = db.search_emails('deployment')[0][0]['snippet']
+    assert '[deployment]' in snippet
+    assert snippet.startswith('...') and snippet.endswith('...')
+    assert len(snippet.split()) <= 16
+
+
+def test_queries_are_quoted_and_paged(db):
+    Ingester(db).ingest([record(str(i), subject=f"Report {i}", body='weekly status') for i in range(5)])
+    # FTS syntax in user input is treated as plain terms
+    assert db.build_fts_query('status AND NOT "report" OR x*') == '"status" "AND" "NOT" "report" "OR" "x"'
+    assert db.build_fts_query('status report', match_any=True) == '"status" OR "report"'
+    assert found(db, '"unbalanced') == []
+    assert db.search_emails('') == ([], False)
+
+    first, has_more = db.search_emails('weekly', limit=3)
+    rest, more = db.search_emails('weekly', limit=3, offset=3)
+    assert (len(first), has_more, len(rest), more) == (3, True, 2, False)
+    assert not {result['id'] for result in first} & {result['id'] for result in rest}
+
+
+def test_emails_stored_before_the_index_are_indexed(workdir):
+    db = Database('data/emails.db')
+    Ingester(db).ingest([record('1', subject='Legacy message')])
+    with db.connect() as conn:
+        conn.execute('DROP TABLE emails_fts')
+    db.close()
+
+    db = Database('data/emails.db')
+    assert found(db, 'legacy') == ['1']
+    db.close()
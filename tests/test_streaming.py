@@ -0,0 +1,237 @@
+import asyncio
+import json
+from types import SimpleNamespace
+import pytest
+from stub_llm import NoCache
+
+DELTAS = ['Subject: Re: Budget', '\n\nHi Anna,', None, ' the numbers', '', ' look right.']
+TEXT = ''.join(delta for delta in DELTAS if delta)
+
+
+def chunk(delta):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+
+class FakeStream:
+    """A streamed completion: the given deltas (plus a chunk with no choices), closable"""
+
+    def __init__(self, deltas):
+        self.chunks = [SimpleNamespace(choices=[])] + [chunk(delta) for delta in deltas]
+        self.sent = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed or self.sent == len(self.chunks):
+            raise StopIteration
+        self.sent += 1
+        return self.chunks[self.sent - 1]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAsyncStream(FakeStream):
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        # Let other tasks (e.g. the server noticing a disconnect) run between chunks
+        await asyncio.sleep(0.01)
+        try:
+            return self.__next__()
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeStreamingClient:
+    """Stands in for the OpenAI client; keeps every stream it hands out"""
+
+    def __init__(self, deltas=DELTAS, stream_class=FakeStream):
+        self.deltas = deltas
+        self.stream_class = stream_class
+        self.streams = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, temperature=None, stream=False, **kwargs):
+        assert stream
+        self.streams.append(self.stream_class(self.deltas))
+        return self.streams[-1]
+
+
+class FakeAsyncStreamingClient(FakeStreamingClient):
+    def __init__(self, deltas=DELTAS):
+        super().__init__(deltas, FakeAsyncStream)
+
+    async def create(self, model, messages, temperature=None, stream=False, **kwargs):
+        return super().create(model, messages, temperature, stream, **kwargs)
+
+
+def sse_events(body):
+    #[(event, data)] from a Server-Sent Events body
+    events = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines.get('event', 'message'), json.loads(lines['data'])))
+    return events
+
+
+def test_stream_llm_yields_deltas_in_order_and_caches_them(processor):
+    processor.client = FakeStreamingClient()
+    assert list(processor.stream_llm('Hello', prompt_name='chat_email')) == [d for d in DELTAS if d]
+    assert processor.client.streams[0].closed
+
+    # The joined text is cached and replayed as one chunk
+    assert list(processor.stream_llm('Hello', prompt_name='chat_email')) == [TEXT]
+    assert len(processor.client.streams) == 1
+
+
+def test_closing_stream_llm_closes_the_upstream_stream(processor):
+    processor.client = FakeStreamingClient()
+    chunks = processor.stream_llm('Hello', prompt_name='chat_email')
+    assert next(chunks) == DELTAS[0]
+    chunks.close()
+
+    stream = processor.client.streams[0]
+    assert stream.closed and stream.sent < len(stream.chunks)
+    # An interrupted completion is not cached
+    assert processor.cache.get(processor.cache.make_key(processor.model, None, 'Hello', processor.temperature)) is None
+
+
+def test_astream_llm_yields_deltas_in_order(processor):
+    processor.async_client = FakeAsyncStreamingClient()
+
+    async def collect():
+        return [delta async for delta in processor.astream_llm('Hello', use_cache=False)]
+
+    assert asyncio.run(collect()) == [d for d in DELTAS if d]
+    assert processor.async_client.streams[0].closed
+
+
+def test_closing_astream_llm_closes_the_upstream_stream(processor):
+    processor.async_client = FakeAsyncStreamingClient()
+
+    async def first_delta():
+        chunks = processor.astream_llm('Hello', use_cache=False)
+        delta = await chunks.__anext__()
+        await chunks.aclose()
+        return delta
+
+    assert asyncio.run(first_delta()) == DELTAS[0]
+    assert processor.async_client.streams[0].closed
+
+
+def keep_generators(monkeypatch, processor, name):
+    """Keep the chunk generators that processor.<name> returns alive.
+
+    Otherwise dropping one would close it (and its upstream stream) anyway,
+    and the tests could not tell whether the response closed it.
+    """
+    generators = []
+    method = getattr(processor, name)
+
+    def keep(*args, **kwargs):
+        generators.append(method(*args, **kwargs))
+        return generators[-1]
+
+    monkeypatch.setattr(processor, name, keep)
+    return generators
+
+
+@pytest.fixture
+def streaming_app(backend_app, monkeypatch):
+    processor = backend_app.email_processor
+    monkeypatch.setattr(processor, 'client', FakeStreamingClient())
+    monkeypatch.setattr(processor, 'async_client', FakeAsyncStreamingClient())
+    monkeypatch.setattr(processor, 'cache', NoCache())
+    backend_app.app.test_client().post('/api/emails/load-mock')
+    return backend_app
+
+
+def test_flask_sse_stream(streaming_app):
+    response = streaming_app.app.test_client().post('/api/chat/stream', json={'query': 'What is due?', 'email_id': '1'})
+    assert response.mimetype == 'text/event-stream'
+
+    events = sse_events(response.get_data(as_text=True))
+    assert events[:-1] == [('message', {'delta': delta}) for delta in DELTAS if delta]
+    assert events[-1] == ('done', {'response': TEXT})
+
+
+def test_closing_the_flask_response_closes_the_upstream_stream(streaming_app, monkeypatch):
+    keep_generators(monkeypatch, streaming_app.email_processor, 'stream_llm')
+    response = streaming_app.app.test_client().post(
+        '/api/chat/stream', json={'query': 'What is due?', 'email_id': '1'}, buffered=False
+    )
+    body = iter(response.response)
+    assert b'delta' in next(body)
+    response.close()
+    assert streaming_app.email_processor.client.streams[-1].closed
+
+
+def test_asgi_sse_stream(streaming_app):
+    from asgi_app import async_app
+
+    async def post(path, data):
+        response = await async_app.test_client().post(path, json=data)
+        return response.mimetype, (await response.get_data()).decode()
+
+    mimetype, body = asyncio.run(post('/api/chat/stream', {'query': 'What is due?', 'email_id': '1'}))
+    assert mimetype == 'text/event-stream'
+    events = sse_events(body)
+    assert events[:-1] == [('message', {'delta': delta}) for delta in DELTAS if delta]
+    assert events[-1] == ('done', {'response': TEXT})
+
+    _, body = asyncio.run(post('/api/drafts/generate/stream', {'email_id': '1', 'instructions': 'Agree'}))
+    event, draft = sse_events(body)[-1]
+    assert event == 'done'
+    assert draft == streaming_app.email_processor.parse_draft(TEXT, streaming_app.db.get_email('1'))
+    assert draft['subject'] == 'Re: Budget'
+
+
+def test_asgi_client_disconnect_closes_the_upstream_stream(streaming_app, monkeypatch):
+    from asgi_app import async_app
+
+    keep_generators(monkeypatch, streaming_app.email_processor, 'astream_llm')
+
+    async def post_then_disconnect():
+        body = json.dumps({'query': 'What is due?', 'email_id': '1'}).encode()
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+            'scheme': 'http', 'path': '/api/chat/stream', 'raw_path': b'/api/chat/stream', 'query_string': b'',
+            'root_path': '', 'headers': [(b'content-type', b'application/json'), (b'host', b'localhost')],
+            'client': ('127.0.0.1', 1234), 'server': ('localhost', 5000), 'extensions': {}
+        }
+        requested = False
+        first_event = asyncio.Event()
+        sent = []
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            # The client goes away after the first event
+            await first_event.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            if message['type'] == 'http.response.body' and message.get('body'):
+                first_event.set()
+                # Slow to write, so the disconnect arrives while the response is between events
+                await asyncio.sleep(1)
+
+        await asyncio.wait_for(async_app(scope, receive, send), timeout=5)
+        # Checked before asyncio.run() finalizes leftover async generators, which would close it anyway
+        stream = streaming_app.email_processor.async_client.streams[-1]
+        return sent, stream.closed, stream.sent < len(stream.chunks)
+
+    sent, closed, interrupted = asyncio.run(post_then_disconnect())
+    bodies = b''.join(message.get('body', b'') for message in sent if message['type'] == 'http.response.body')
+    assert closed and interrupted
+    assert b'event: done' not in bodies
@@ -0,0 +1,186 @@
+import json
+import pytest
+from database import Database
+from ingest import Ingester
+
+# The emails are from Monday 2024-01-15
+ACTIONS = {
+    'email-a': {'tasks': [
+        {'task': 'Send the report', 'deadline': '2024-01-19', 'priority': 'high'},
+        {'task': 'Book a room', 'deadline': None, 'priority': 'low'},
+        {'task': 'Call the supplier', 'deadline': 'tomorrow', 'priority': 'medium'}
+    ]},
+    'email-b': {'tasks': [
+        {'task': 'Review the pull request', 'deadline': 'Friday', 'priority': 'urgent'},
+        {'task': 'Plan the offsite', 'deadline': 'Feb 1', 'priority': 'low'},
+        {'task': 'Read the docs'}
+    ]}
+}
+# Soonest deadline first, ties by id, tasks without a deadline last
+ORDER = ['Call the supplier', 'Send the report', 'Review the pull request', 'Plan the offsite',
+         'Book a room', 'Read the docs']
+
+
+def record(email_id):
+    return {
+        'id': email_id,
+        'message_id': None,
+        'from': f"{email_id}@example.com",
+        'subject': f"Subject of {email_id}",
+        'body': 'Body',
+        'date': '2024-01-15 10:00:00',
+        'in_reply_to': None,
+        'references': None,
+        'headers': None
+    }
+
+
+def store_actions(db, actions):
+    Ingester(db).ingest([record(email_id) for email_id in actions])
+    for email_id, result in actions.items():
+        db.update_email_processing(email_id, {'actions': result})
+
+
+@pytest.fixture
+def db(workdir):
+    db = Database('data/emails.db')
+    store_actions(db, ACTIONS)
+    yield db
+    db.close()
+
+
+def tasks_of(db, **filters):
+    return [task['task'] for task in db.list_tasks(limit=100, **filters)[0]]
+
+
+def all_pages(db, limit, **filters):
+    pages = []
+    cursor = None
+    while True:
+        tasks, cursor = db.list_tasks(limit=limit, cursor=cursor, **filters)
+        pages.append([task['task'] for task in tasks])
+        if cursor is None:
+            return pages
+
+
+def test_tasks_are_stored_with_normalized_deadlines(db):
+    tasks = {task['task']: task for task in db.list_tasks(limit=100)[0]}
+    assert list(tasks) == ORDER
+    assert (tasks['Call the supplier']['deadline'], tasks['Call the supplier']['deadline_text']) == ('2024-01-16', 'tomorrow')
+    assert (tasks['Review the pull request']['deadline'], tasks['Review the pull request']['priority']) == ('2024-01-19', 'high')
+    assert tasks['Plan the offsite']['deadline'] == '2024-02-01'
+    assert tasks['Read the docs']['priority'] is None
+    assert tasks['Send the report']['email_subject'] == 'Subject of email-a'
+    assert {task['status'] for task in tasks.values()} == {'open'}
+
+
+def test_existing_actions_are_backfilled(workdir):
+    db = Database('data/emails.db')
+    Ingester(db).ingest([record('email-a'), record('email-b'), record('broken')])
+    conn = db.connect()
+    with conn:
+        conn.execute('DROP TABLE tasks')
+        conn.executemany('UPDATE emails SET actions = ? WHERE id = ?', [
+            (json.dumps(actions), email_id) for email_id, actions in ACTIONS.items()
+        ] + [('not json', 'broken')])
+    db.close()
+
+    db = Database('data/emails.db')
+    assert tasks_of(db) == ORDER
+    # Only the first time the table is created
+    with db.connect() as conn:
+        conn.execute("DELETE FROM tasks WHERE email_id = 'email-b'")
+    db.close()
+    db = Database('data/emails.db')
+    assert tasks_of(db, email_id='email-b') == []
+    db.close()
+
+
+def test_status_survives_reprocessing(db):
+    tasks = {task['task']: task for task in db.list_tasks(limit=100, email_id='email-a')[0]}
+    assert db.update_task_status(tasks['Send the report']['id'], 'done')
+    assert not db.update_task_status(10 ** 6, 'done')
+
+    # The re-extracted result keeps one task, rewords one and drops one
+    db.update_email_processing('email-a', {'actions': {'tasks': [
+        {'task': 'Book a room for Thursday', 'deadline': 'Thursday'},
+        {'task': 'Send the report', 'deadline': 'Tuesday', 'priority': 'low'}
+    ]}})
+    tasks = {task['task']: task for task in db.list_tasks(limit=100, email_id='email-a')[0]}
+    assert set(tasks) == {'Book a room for Thursday', 'Send the report'}
+    assert tasks['Send the report']['status'] == 'done'
+    assert (tasks['Send the report']['deadline'], tasks['Send the report']['priority']) == ('2024-01-16', 'low')
+    assert tasks['Book a room for Thursday']['status'] == 'open'
+
+    # Results without actions leave the tasks alone
+    db.update_email_processing('email-a', {'summary': 'Report and room'})
+    assert len(tasks_of(db, email_id='email-a')) == 2
+
+
+def test_deleting_an_email_deletes_its_tasks(db):
+    with db.connect() as conn:
+        conn.execute("DELETE FROM emails WHERE id = 'email-b'")
+    assert tasks_of(db) == ['Call the supplier', 'Send the report', 'Book a room']
+
+
+def test_filters(db):
+    assert tasks_of(db, due_from='2024-01-17', due_to='2024-01-31') == ['Send the report', 'Review the pull request']
+    assert tasks_of(db, due_to='2024-01-18') == ['Call the supplier']
+    assert tasks_of(db, priorities=['high']) == ['Send the report', 'Review the pull request']
+    assert tasks_of(db, priorities=['low', 'medium']) == ['Call the supplier', 'Plan the offsite', 'Book a room']
+    assert tasks_of(db, email_id='email-b') == ['Review the pull request', 'Plan the offsite', 'Read the docs']
+
+    task_id = db.list_tasks(email_id='email-b', limit=1)[0][0]['id']
+    db.update_task_status(task_id, 'done')
+    assert tasks_of(db, status='done') == ['Review the pull request']
+    assert 'Review the pull request' not in tasks_of(db, status='open')
+
+
+@pytest.mark.parametrize('filters', [{}, {'priorities': ['low', 'high']}, {'due_from': '2024-01-16'}])
+def test_pages_cover_every_task_once_in_order(db, filters):
+    expected = tasks_of(db, **filters)
+    for limit in (1, 2, 4):
+        pages = all_pages(db, limit, **filters)
+        assert all(pages[:-1]) and sum(pages, []) == expected
+
+
+def test_api(backend_app):
+    db = backend_app.db
+    actions = {'api-email': {'tasks': [
+        {'task': f"Task {i}", 'deadline': f"2024-01-{20 + i}", 'priority': 'high' if i % 2 else 'low'}
+        for i in range(5)
+    ] + [{'task': 'Task without a deadline'}]}}
+    store_actions(db, actions)
+    client = backend_app.app.test_client()
+
+    names = []
+    cursor = None
+    while True:
+        query = {'email_id': 'api-email', 'limit': 2}
+        if cursor:
+            query['cursor'] = cursor
+        page = client.get('/api/tasks', query_string=query).get_json()
+        names += [task['task'] for task in page['tasks']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert names == [f"Task {i}" for i in range(5)] + ['Task without a deadline']
+
+    def get(**query):
+        response = client.get('/api/tasks', query_string=dict(query, email_id='api-email'))
+        return [task['task'] for task in response.get_json()['tasks']]
+
+    assert get(priority='high') == ['Task 1', 'Task 3']
+    assert get(priority='low, high', due_from='2024-01-22', due_to='2024-01-23') == ['Task 2', 'Task 3']
+
+    task_id = db.list_tasks(email_id='api-email', limit=1)[0][0]['id']
+    response = client.post(f"/api/tasks/{task_id}/status", json={'status': 'done'})
+    assert response.get_json() == {'id': task_id, 'status': 'done'}
+    assert get(status='done') == ['Task 0']
+    assert client.post(f"/api/tasks/{task_id}/status", json={'status': 'maybe'}).status_code == 400
+    assert client.post('/api/tasks/999999999/status', json={'status': 'done'}).status_code == 404
+
+    for query in ({'due_from': 'soon'}, {'priority': 'urgent'}, {'status': 'closed'}, {'cursor': 'garbage'},
+                  {'limit': 'ten'}):
+        response = client.get('/api/tasks', query_string=query)
+        assert response.status_code == 400 and 'error' in response.get_json()
@@ -0,0 +1,61 @@
+import pytest
+import db_connection
+from job_queue import JobQueue
+from worker import Worker
+
+
+@pytest.fixture
+def worker(processor):
+    queue = JobQueue(processor.db, max_attempts=3, base_delay=0.0)
+    return Worker(db=processor.db, email_processor=processor, queue=queue, poll_interval=0)
+
+
+def test_worker_reuses_its_connections_across_jobs(worker, add_emails, monkeypatch):
+    email_ids = add_emails(worker.db, 3)
+    for email_id in email_ids:
+        worker.queue.enqueue('process_email', {'email_id': email_id})
+    assert worker.run_once()
+
+    opened = []
+    connect = db_connection.sqlite3.connect
+
+    def counting_connect(*args, **kwargs):
+        opened.append(args[0])
+        return connect(*args, **kwargs)
+
+    monkeypatch.setattr(db_connection.sqlite3, 'connect', counting_connect)
+    while worker.run_once():
+        pass
+
+    assert opened == []
+    assert [worker.db.get_email(email_id)['is_processed'] for email_id in email_ids] == [1, 1, 1]
+
+
+@pytest.mark.parametrize('kind, payload, error', [
+    ('process_email', {'email_id': 'missing'}, 'Email not found: missing'),
+    ('process_email', {'email_id': 'email-0', 'type': 'translate'}, 'Unknown processing type: translate'),
+    ('import_mailbox', {'path': 'data/missing.mbox'}, 'Import file not found: data/missing.mbox'),
+    ('import_mailbox', {'path': 'data/inbox.csv', 'format': 'csv'}, 'Unsupported import format: csv'),
+    ('reindex', {}, 'Unknown job kind: reindex')
+])
+def test_permanent_errors_fail_without_retrying(worker, add_emails, kind, payload, error):
+    add_emails(worker.db, 1)
+    job_id = worker.queue.enqueue(kind, payload)
+    assert worker.run_once()
+
+    job = worker.queue.get_job(job_id)
+    assert (job['status'], job['attempts'], job['error']) == ('failed', 1, error)
+
+
+def test_model_errors_are_retried(worker, add_emails, monkeypatch):
+    def unavailable(**kwargs):
+        raise RuntimeError('model unavailable')
+
+    email_id, = add_emails(worker.db, 1)
+    monkeypatch.setattr(worker.email_processor.client.chat.completions, 'create', unavailable)
+    job_id = worker.queue.enqueue('process_email', {'email_id': email_id})
+    assert worker.run_once()
+
+    job = worker.queue.get_job(job_id)
+    assert (job['status'], job['attempts']) == ('queued', 1)
+    assert 'model unavailable' in job['error']